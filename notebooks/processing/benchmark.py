@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline benchmarks of the query modules.
+
+The API clients are served by a fixture transport (FixtureAdapter) mounted on the shared
+session (see http_utils). It answers RePORTER, grants.gov, Semantic Scholar, and SPECTER
+requests in the format of these APIs with records synthesized from the KG tables in kg/data.
+The records can be multiplied (scale) to benchmark with 10x or 100x today's data.
+
+Rate limits are disabled, and the response cache and the checkpoints are redirected to a
+temporary directory and cleared before each run. The benchmarks therefore measure request
+handling, parsing, and transformation, but not the network.
+
+Usage (from the notebooks/processing directory):
+    python benchmark.py                                   # all benchmarks at scale 1
+    python benchmark.py get_projects get_author_ids       # selected benchmarks
+    python benchmark.py --scale 1 10 100 --output ../derived_data/benchmark.json
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+import chunk_runner
+import citation_crawler
+import embedding_store
+import grant_query
+import http_utils
+import publication_query
+import response_cache
+
+# the embedding client and the vector index of the visualization tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "visualization"))
+import embed  # noqa: E402
+import vector_index  # noqa: E402
+
+KG_PATH = "../kg/data"
+SCALES = [1]
+REPEAT = 3
+EMBEDDING_DIMENSION = 768
+# requests per second, high enough to never wait
+RATE_LIMIT = 1e9
+# profile ids of the copies of a researcher are offset by multiples of this value
+PROFILE_ID_OFFSET = 10**9
+# name match threshold of the author_match_score benchmark
+AUTHOR_MATCH_THRESHOLD = 0.9
+# number of papers per SPECTER request (as in 9_add_embeddings)
+SPECTER_BATCH_SIZE = 16
+S2_BATCH_URL = "https://api.semanticscholar.org/graph/v1/paper/batch"
+SPECTER_URL = "https://model-apis.semanticscholar.org/specter/v1/invoke"
+HOSTS = ["api.reporter.nih.gov", "apply07.grants.gov", "api.semanticscholar.org", "model-apis.semanticscholar.org"]
+
+
+def read_tables(kg_path, kind, prefix):
+    """Read and concatenate the CSV files of a node label or relationship type (e.g., Researcher_*.csv)."""
+    paths = sorted(glob.glob(os.path.join(kg_path, kind, prefix + ".csv")) + glob.glob(os.path.join(kg_path, kind, prefix + "_*.csv")))
+    paths = [path for path in paths if not path.endswith("_embedding.csv")]
+    return pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths], ignore_index=True)
+
+
+def copy_id(value, copy):
+    """Return the id of a synthetic copy of a record, e.g., doi:10.1/abc -> doi:10.1/abc.2 for copy 2."""
+    return value if copy == 0 else f"{value}.{copy}"
+
+
+def to_int(value):
+    return int(value) if value.isdigit() else None
+
+
+class Fixture:
+    """
+    Synthetic API records derived from the KG tables.
+
+    Each grant becomes a RePORTER project with its investigators and the organization of the
+    contact PI, each funding opportunity a grants.gov hit, and each publication a Semantic
+    Scholar paper with its authors and citations. With a scale > 1, each record is copied
+    with suffixed ids (see copy_id), and the copies reference each other.
+
+    Args:
+        kg_path (str): The directory with the nodes and relationships CSV files.
+        scale (int): The number of copies of each record.
+        dimension (int): The dimension of the synthetic embeddings.
+    """
+    def __init__(self, kg_path=KG_PATH, scale=1, dimension=EMBEDDING_DIMENSION):
+        self.scale = scale
+        self.dimension = dimension
+        grants = read_tables(kg_path, "nodes", "Grant")
+        researchers = read_tables(kg_path, "nodes", "Researcher").drop_duplicates("id").set_index("id")
+        publications = read_tables(kg_path, "nodes", "Publication").drop_duplicates("id")
+        opportunities = read_tables(kg_path, "nodes", "FundingOpportunity")
+        investigators = read_tables(kg_path, "relationships", "Researcher-IS_INVESTIGATOR_OF-Grant")
+        employed = read_tables(kg_path, "relationships", "Researcher-EMPLOYED_AT-Organization")
+        organizations = read_tables(kg_path, "nodes", "Organization").set_index("id")
+        provides = read_tables(kg_path, "relationships", "FundingOpportunity-PROVIDES-Grant")
+        authored = read_tables(kg_path, "relationships", "Researcher-AUTHORED-Publication")
+        cites = read_tables(kg_path, "relationships", "Publication-CITES-Publication")
+
+        investigators = investigators[investigators["from"].isin(researchers.index) & researchers.reindex(investigators["from"])["profileId"].str.startswith("profileid:").to_numpy()]
+        pis_by_grant = investigators.groupby("to")
+        organization_by_researcher = dict(zip(employed["from"], employed["to"]))
+        opportunity_by_grant = dict(zip(provides["to"], provides["from"]))
+        authors_by_paper = authored.groupby("to")["from"].agg(list).to_dict()
+        citing_by_paper = cites.groupby("to")["from"].agg(list).to_dict()
+        publications_by_id = publications.set_index("id")
+
+        self.projects = []
+        self.papers = []
+        self.opportunities = {}
+        for copy in range(scale):
+            for grant in grants.itertuples(index=False):
+                pis = pis_by_grant.get_group(grant.id) if grant.id in pis_by_grant.groups else investigators.iloc[:0]
+                self.projects.append(self.project_record(grant, pis, researchers, organizations, organization_by_researcher,
+                                                         opportunity_by_grant.get(grant.id, ""), copy))
+            for opportunity in opportunities.itertuples(index=False):
+                self.opportunities[copy_id(opportunity.id, copy)] = self.opportunity_record(opportunity, copy)
+            for publication in publications.itertuples(index=False):
+                self.papers.append(self.paper_record(publication, authors_by_paper.get(publication.id, []),
+                                                     citing_by_paper.get(publication.id, []), researchers, publications_by_id, copy))
+
+        # papers are looked up by DOI, PubMed id, or Semantic Scholar id (case-insensitive)
+        self.paper_index = {}
+        for i, paper in enumerate(self.papers):
+            ids = paper["externalIds"]
+            self.paper_index[paper["paperId"]] = i
+            self.paper_index["doi:" + ids["DOI"].lower()] = i
+            if ids["PubMed"] is not None:
+                self.paper_index["pmid:" + ids["PubMed"]] = i
+        # serialized papers by requested fields, so serving a request is cheap compared to the code under test
+        self._serialized = {}
+
+        self.core_project_numbers = [project["core_project_num"] for project in self.projects]
+        self.profile_ids = list(dict.fromkeys(str(pi["profile_id"]) for project in self.projects for pi in project["principal_investigators"]))
+        self.opportunity_numbers = list(self.opportunities)
+        self.dois = ["doi:" + paper["externalIds"]["DOI"] for paper in self.papers]
+        self.publications = pd.DataFrame({"id": self.dois, "title": [paper["title"] for paper in self.papers],
+                                          "abstract": [paper["abstract"] for paper in self.papers]})
+        # the name of an investigator and the authors of one of their publications
+        self.author_pairs = [(pi["full_name"], [author["name"] for author in paper["authors"]])
+                             for project, paper in zip(self.projects, self.papers) for pi in project["principal_investigators"][:1]
+                             if paper["authors"]]
+
+    @staticmethod
+    def project_record(grant, pis, researchers, organizations, organization_by_researcher, opportunity, copy):
+        core_project_num = copy_id(grant.id, copy)
+        principal_investigators = []
+        organization = {}
+        for researcher_id, is_contact_pi in zip(pis["from"], pis["isContactPi"]):
+            researcher = researchers.loc[researcher_id]
+            profile_id = int(researcher["profileId"].removeprefix("profileid:")) + copy * PROFILE_ID_OFFSET
+            principal_investigators.append({"profile_id": profile_id, "first_name": researcher["firstName"],
+                                            "middle_name": researcher["middleName"], "last_name": researcher["lastName"],
+                                            "is_contact_pi": is_contact_pi == "true", "full_name": researcher["fullName"], "title": ""})
+            if is_contact_pi == "true" and organization_by_researcher.get(researcher_id) in organizations.index:
+                org = organizations.loc[organization_by_researcher[researcher_id]]
+                organization = {"org_name": org["name"], "org_city": org["city"], "org_zipcode": "", "org_state": org["state"],
+                                "org_country": org["country"], "primary_duns": org["duns"].removeprefix("duns:"),
+                                "primary_uei": org["uei"].removeprefix("uei:")}
+        serial_num = grant.id[-8:]
+        return {"appl_id": 10000000 + zlib.crc32(core_project_num.encode()) % 10000000, "subproject_id": None,
+                "fiscal_year": 2021, "project_num": f"1{core_project_num}-01", "project_serial_num": serial_num,
+                "core_project_num": core_project_num, "agency_ic_admin": {"code": "", "abbreviation": "NIH", "name": ""},
+                "project_title": grant.name, "abstract_text": grant.abstract, "phr_text": grant.narrative,
+                "funding_mechanism": grant.fundingMechanism, "activity_code": grant.awardCode,
+                "opportunity_number": opportunity, "organization": organization,
+                "principal_investigators": principal_investigators}
+
+    @staticmethod
+    def opportunity_record(opportunity, copy):
+        number = copy_id(opportunity.id, copy)
+        return {"id": str(zlib.crc32(number.encode())), "number": number, "title": opportunity.name, "agencyCode": "HHS-NIH11",
+                "agency": "National Institutes of Health", "openDate": "07/30/2020", "closeDate": "08/28/2020",
+                "oppStatus": "archived", "docType": "synopsis"}
+
+    @staticmethod
+    def paper_record(publication, author_ids, citing_ids, researchers, publications, copy):
+        doi = copy_id(publication.doi.removeprefix("doi:"), copy)
+        authors = []
+        for i, author_id in enumerate(author_ids):
+            researcher = researchers.loc[author_id] if author_id in researchers.index else None
+            name = researcher["fullName"] if researcher is not None else author_id
+            s2_id = author_id.removeprefix("s2authorid:") if author_id.startswith("s2authorid:") else str(zlib.crc32(author_id.encode()))
+            # as in the API, some authors have no aliases or external ids, and DBLP names may have a number
+            external_ids = {}
+            if i % 3 == 0:
+                external_ids["DBLP"] = [name, f"{name} 0001"]
+            if researcher is not None and researcher["orcid"]:
+                external_ids["ORCID"] = researcher["orcid"].removeprefix("orcid:")
+            authors.append({"authorId": copy_id(s2_id, copy), "name": name,
+                            "aliases": [researcher["name"], name.replace(" ", ". ", 1)] if researcher is not None and i % 2 == 0 else None,
+                            "affiliations": [], "paperCount": 1, "citationCount": 0, "hIndex": 0,
+                            "externalIds": external_ids})
+        citations = []
+        for citing in citing_ids:
+            citation = {"paperId": copy_id(format(zlib.crc32(citing.encode()), "x"), copy),
+                        "externalIds": {"DOI": copy_id(citing.removeprefix("doi:"), copy)}}
+            if citing in publications.index:
+                citing_publication = publications.loc[citing]
+                citation.update({"title": citing_publication["name"], "abstract": citing_publication["abstract"] or None,
+                                 "year": to_int(citing_publication["year"])})
+            citations.append(citation)
+        return {"paperId": copy_id(format(zlib.crc32(publication.doi.encode()), "x"), copy),
+                "externalIds": {"DOI": doi, "PubMed": publication.pmId or None, "PubMedCentral": publication.pmcId.removeprefix("PMC") or None},
+                "title": publication.name, "journal": {"name": publication.journal}, "year": to_int(publication.year),
+                "citationCount": len(citations), "abstract": publication.abstract or None, "authors": authors,
+                "citations": citations}
+
+    def embedding(self, paper_id):
+        """Return the synthetic embedding of a paper, the same for each request."""
+        rng = np.random.default_rng(zlib.crc32(paper_id.encode()))
+        return rng.standard_normal(self.dimension, dtype=np.float32).tolist()
+
+    def search_projects(self, body):
+        """Answer a RePORTER projects/search request (project_nums, pi_profile_ids, or pi_names criteria)."""
+        criteria = body["criteria"]
+        if "project_nums" in criteria:
+            numbers = set(criteria["project_nums"])
+            projects = [project for project in self.projects if project["core_project_num"] in numbers]
+        elif "pi_profile_ids" in criteria:
+            profile_ids = {int(profile_id) for profile_id in criteria["pi_profile_ids"]}
+            projects = [project for project in self.projects
+                        if any(pi["profile_id"] in profile_ids for pi in project["principal_investigators"])]
+        else:
+            names = [name["any_name"].lower() for name in criteria.get("pi_names", [])]
+            projects = [project for project in self.projects
+                        if any(name in pi["full_name"].lower() for pi in project["principal_investigators"] for name in names)]
+        offset, limit = body.get("offset", 0), body.get("limit", grant_query.PROJECT_LIMIT)
+        return json.dumps({"meta": {"total": len(projects)}, "results": projects[offset:offset + limit]}).encode()
+
+    def search_opportunities(self, body):
+        """Answer a grants.gov opportunity search."""
+        hit = self.opportunities.get(body["oppNum"])
+        return json.dumps({"oppHits": [hit] if hit else [], "hitCount": 1 if hit else 0}).encode()
+
+    def paper_batch(self, ids, fields):
+        """Answer a Semantic Scholar paper batch request. Unknown ids are null, as in the API."""
+        top_fields = tuple(sorted({"paperId"} | {field.split(".")[0] for field in fields.split(",")}))
+        papers = []
+        for paper_id in ids:
+            i = self.paper_index.get(paper_id.lower())
+            if i is None:
+                papers.append(b"null")
+                continue
+            key = (top_fields, i)
+            if key not in self._serialized:
+                paper = {field: self.papers[i][field] for field in top_fields if field in self.papers[i]}
+                if "embedding" in top_fields:
+                    paper["embedding"] = {"model": "specter_v2", "vector": self.embedding(self.papers[i]["paperId"])}
+                self._serialized[key] = json.dumps(paper).encode()
+            papers.append(self._serialized[key])
+        return b"[" + b",".join(papers) + b"]"
+
+    def specter(self, papers):
+        """Answer a SPECTER request."""
+        return json.dumps({"preds": [{"paper_id": paper["paper_id"], "embedding": self.embedding(paper["paper_id"])}
+                                     for paper in papers]}).encode()
+
+
+class FixtureAdapter(BaseAdapter):
+    """Transport adapter that serves the API requests from a Fixture instead of the network."""
+    def __init__(self, fixture):
+        super().__init__()
+        self.fixture = fixture
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        endpoint = url.netloc + url.path
+        body = json.loads(request.body) if request.body else None
+        status = 200
+        if request.url.startswith(grant_query.PROJECTS_URL):
+            content = self.fixture.search_projects(body)
+        elif request.url.startswith(grant_query.GRANTS_GOV_URL):
+            content = self.fixture.search_opportunities(body)
+        elif request.url.startswith(S2_BATCH_URL):
+            content = self.fixture.paper_batch(body["ids"], parse_qs(url.query).get("fields", [""])[0])
+        elif request.url.startswith(SPECTER_URL):
+            content = self.fixture.specter(body)
+        else:
+            status, content = 404, json.dumps({"error": f"no fixture for {endpoint}"}).encode()
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def install(fixture, work_path):
+    """
+    Serve the API hosts from a fixture and prepare the clients for offline benchmarks.
+
+    The response cache and the checkpoints are moved to work_path, and the rate limits are
+    disabled (the limiters are created on first use with these rates).
+    """
+    adapter = FixtureAdapter(fixture)
+    session = http_utils.get_session()
+    for host in HOSTS:
+        session.mount(f"https://{host}/", adapter)
+    response_cache.set_cache(response_cache.ResponseCache(os.path.join(work_path, "http_cache.sqlite")))
+    chunk_runner.CHECKPOINT_PATH = os.path.join(work_path, "checkpoints")
+    grant_query.REPORTER_RATE_LIMIT = RATE_LIMIT
+    publication_query.RATE_LIMIT = RATE_LIMIT
+
+
+def reset(work_path):
+    """Clear the state that would let a run skip work done by a previous run."""
+    response_cache.get_cache().clear()
+    grant_query.clear_project_snapshots()
+    chunk_runner.CHECKPOINT_PATH = tempfile.mkdtemp(dir=work_path)
+    http_utils.reset_stats()
+
+
+def embed_publications(fixture, work_path):
+    """Request the SPECTER embeddings of the publications and export them like 9_add_embeddings."""
+    csv_file = os.path.join(work_path, "Publication.csv")
+    fixture.publications[["id", "title"]].to_csv(csv_file, index=False)
+    papers = json.loads(fixture.publications.rename(columns={"id": "paper_id"}).to_json(orient="records"))
+    embeddings = {}
+    for i in range(0, len(papers), SPECTER_BATCH_SIZE):
+        data = http_utils.post_json(SPECTER_URL, json=papers[i:i + SPECTER_BATCH_SIZE])
+        embeddings.update((paper["paper_id"], paper["embedding"]) for paper in data["preds"])
+    ids = [paper_id for paper_id in fixture.publications["id"] if paper_id in embeddings]
+    embedding_store.write_embeddings(csv_file, ids, np.array([embeddings[paper_id] for paper_id in ids], dtype=np.float32))
+    embedding_store.export_csv(csv_file)
+
+
+def embedding_files(fixture, work_path):
+    """
+    Return the paths of two Publication node files with the synthetic embeddings of the fixture,
+    created on first use: one with sidecar files and one with the embedding column only.
+    """
+    path = os.path.join(work_path, f"embeddings_{fixture.scale}_{fixture.dimension}")
+    sidecar_file = os.path.join(path, "Publication.csv")
+    csv_file = os.path.join(path, "Publication_csv.csv")
+    if not os.path.exists(csv_file):
+        os.makedirs(path, exist_ok=True)
+        fixture.publications[["id", "title"]].to_csv(sidecar_file, index=False)
+        ids = fixture.publications["id"].tolist()
+        embedding_store.write_embeddings(sidecar_file, ids, np.array([fixture.embedding(paper_id) for paper_id in ids], dtype=np.float32))
+        embedding_store.export_csv(sidecar_file)
+        # a copy without sidecar files, written last so the files above are only created once
+        pd.read_csv(sidecar_file, dtype=str, keep_default_na=False).to_csv(csv_file, index=False)
+    return sidecar_file, csv_file
+
+
+def load_embeddings(fixture, work_path, loader, sidecar=True):
+    """Load the embeddings of a Publication node file with a loader and return the number of embeddings read."""
+    sidecar_file, csv_file = embedding_files(fixture, work_path)
+    ids, embeddings = loader(sidecar_file if sidecar else csv_file)
+    # read memory-mapped embeddings, so the time covers the data and not only opening the file
+    np.asarray(embeddings).sum()
+    return len(ids)
+
+
+def embed_papers(fixture, work_path):
+    """Embed the publications with the SPECTER client of the visualization tools, without its embedding cache."""
+    client = embed.EmbeddingClient(cache=False)
+    papers = json.loads(fixture.publications.to_json(orient="records"))
+    return len(client.embed(papers))
+
+
+# each benchmark returns the number of records it processed
+BENCHMARKS = {
+    "get_projects": lambda fixture, work_path: grant_query.get_projects(fixture.core_project_numbers) is not None and len(fixture.core_project_numbers),
+    "get_principal_investigators": lambda fixture, work_path: grant_query.get_principal_investigators(fixture.core_project_numbers) is not None and len(fixture.core_project_numbers),
+    "get_organizations": lambda fixture, work_path: grant_query.get_organizations(fixture.profile_ids) is not None and len(fixture.profile_ids),
+    "get_funding_opportunities": lambda fixture, work_path: grant_query.get_funding_opportunities(fixture.opportunity_numbers) is not None and len(fixture.opportunity_numbers),
+    "get_author_ids": lambda fixture, work_path: publication_query.get_author_ids(fixture.dois) is not None and len(fixture.dois),
+    "get_citations": lambda fixture, work_path: publication_query.get_citations(fixture.dois) is not None and len(fixture.dois),
+    "get_publication_info": lambda fixture, work_path: publication_query.get_publication_info(fixture.dois) is not None and len(fixture.dois),
+    "get_embeddings": lambda fixture, work_path: publication_query.get_embeddings(fixture.dois) is not None and len(fixture.dois),
+    "crawl_citations": lambda fixture, work_path: len(citation_crawler.crawl_citations(fixture.dois[:len(fixture.dois) // 10],
+                                                                                      citations_file=os.path.join(work_path, "citations.csv"))),
+    "add_relevance_score": lambda fixture, work_path: len(publication_query.add_relevance_score(fixture.publications.copy(), ["title", "abstract"], 1)),
+    "author_match_score": lambda fixture, work_path: len([grant_query.author_match_score(name, authors, AUTHOR_MATCH_THRESHOLD)
+                                                          for name, authors in fixture.author_pairs]),
+    "specter_export": lambda fixture, work_path: embed_publications(fixture, work_path) or len(fixture.publications),
+    "embed_client": embed_papers,
+    "read_embeddings": lambda fixture, work_path: load_embeddings(fixture, work_path, embedding_store.read_embeddings),
+    "load_embeddings_sidecar": lambda fixture, work_path: load_embeddings(fixture, work_path, vector_index.load_embeddings),
+    "load_embeddings_csv": lambda fixture, work_path: load_embeddings(fixture, work_path, lambda csv_file: vector_index.load_embeddings(csv_file, cache=False),
+                                                                      sidecar=False),
+}
+
+
+def run_benchmark(name, fixture, work_path, repeat=REPEAT):
+    """
+    Run a benchmark once to warm up, repeat times to measure the wall time, and once with tracemalloc to measure the peak memory.
+
+    Returns
+    -------
+    dict
+        The number of records, the minimum and median wall time in seconds, the throughput
+        (records per second, based on the minimum time), the peak traced memory in MB, and
+        the requests and bytes per run.
+    """
+    benchmark = BENCHMARKS[name]
+    # the output of the query functions (e.g., "Proceeding without S2_API_KEY") is not part of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        reset(work_path)
+        benchmark(fixture, work_path)
+
+        times = []
+        for _ in range(repeat):
+            reset(work_path)
+            start = time.perf_counter()
+            records = benchmark(fixture, work_path)
+            times.append(time.perf_counter() - start)
+        stats = http_utils.get_stats().values()
+
+        reset(work_path)
+        tracemalloc.start()
+        benchmark(fixture, work_path)
+        peak_memory = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+
+    return {"benchmark": name, "scale": fixture.scale, "records": records, "min_time": min(times),
+            "median_time": statistics.median(times), "throughput": records / min(times) if min(times) > 0 else float("inf"),
+            "peak_memory": peak_memory, "requests": sum(endpoint["requests"] for endpoint in stats),
+            "bytes": sum(endpoint["bytes"] for endpoint in stats)}
+
+
+def run_benchmarks(names=None, scales=SCALES, repeat=REPEAT, kg_path=KG_PATH, dimension=EMBEDDING_DIMENSION):
+    """
+    Run benchmarks at each scale.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per benchmark and scale (see run_benchmark).
+    """
+    names = names or list(BENCHMARKS)
+    results = []
+    with tempfile.TemporaryDirectory() as work_path:
+        for scale in scales:
+            fixture = Fixture(kg_path, scale, dimension)
+            install(fixture, work_path)
+            for name in names:
+                result = run_benchmark(name, fixture, work_path, repeat)
+                print(f"{name:<28} scale {scale:>4}: {result['records']:>8} records in {result['min_time']:8.3f} s "
+                      f"({result['throughput']:10.0f} records/s, {result['peak_memory']:8.1f} MB)")
+                results.append(result)
+        response_cache.get_cache().close()
+    return pd.DataFrame(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks of the query modules.")
+    parser.add_argument("benchmarks", nargs="*", choices=[[]] + list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--scale", type=int, nargs="+", default=SCALES, help="number of copies of the KG records, e.g., 1 10 100")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="number of timed runs of each benchmark")
+    parser.add_argument("--kg-path", default=KG_PATH, help="directory with the nodes and relationships CSV files")
+    parser.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION, help="dimension of the synthetic embeddings")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.benchmarks, args.scale, args.repeat, args.kg_path, args.dimension)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        results.to_json(args.output, orient="records", indent=2)
+        print(f"Wrote the results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
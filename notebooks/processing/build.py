@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Incremental build driver for the radx-kg processing notebooks.
+
+Each stage declares the files it reads and writes. A stage is re-run only if one of its
+input files changed since its last successful run (or one of its outputs is missing),
+similar to make. Stages whose upstream stages have finished run in parallel.
+
+Stages marked as external also read data that cannot be fingerprinted (e.g., Google Sheets
+or API results). They are only re-run if their file inputs change or if --refresh is given.
+API responses are served from the response cache (see response_cache) within their TTL.
+
+The stages save the node and relationship tables as typed working copies (see kg_io). The
+export_kg stage writes the CSV files in kg/data from them as the last step. Each file is written
+by a single stage: stages that add properties to the nodes of other stages (e.g., graph metrics
+or embeddings) write sidecar files that are merged on export, so they don't change the inputs
+of other stages.
+
+Usage (from the notebooks/processing directory):
+    python build.py                 # bring all stages up to date
+    python build.py citations       # bring the citations stage and its upstream stages up to date
+    python build.py --dry-run       # show which stages would run
+    python build.py --refresh       # also re-run stages with external inputs
+    python build.py --profile       # write a profiling report of the stages that ran (see profiling)
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List
+
+# paths are relative to the notebooks/processing directory, the working directory of the notebooks
+PROCESSING_PATH = os.path.dirname(os.path.abspath(__file__))
+KG_PATH = "../kg/data"
+WORKING_PATH = "../derived_data/kg"
+DATA_PATH = "../data"
+DERIVED_DATA_PATH = "../derived_data"
+BUILD_STATE_FILE = os.path.join(DERIVED_DATA_PATH, "build_state.json")
+NOTEBOOK_OUTPUT_PATH = os.path.join(DERIVED_DATA_PATH, "notebooks")
+# files of the researcher identity store (see identity_store)
+IDENTITIES = [os.path.join(DERIVED_DATA_PATH, "identities", "ids.parquet"), os.path.join(DERIVED_DATA_PATH, "identities", "names.parquet")]
+
+
+def node(name):
+    return os.path.join(WORKING_PATH, "nodes", name + ".parquet")
+
+
+def relationship(name):
+    return os.path.join(WORKING_PATH, "relationships", name + ".parquet")
+
+
+def properties(label):
+    """Return the property sidecar of a node label (see kg_io.save_properties)."""
+    return os.path.join(WORKING_PATH, "properties", label + ".parquet")
+
+
+def export(path):
+    """Return the CSV file in kg/data exported from a working copy."""
+    kind, file_name = path.split(os.sep)[-2:]
+    return os.path.join(KG_PATH, kind, os.path.splitext(file_name)[0] + ".csv")
+
+
+def derived(name):
+    return os.path.join(DERIVED_DATA_PATH, name + ".csv")
+
+
+def data(name):
+    return os.path.join(DATA_PATH, name + ".csv")
+
+
+@dataclass
+class Stage:
+    name: str
+    notebook: str
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    external: bool = False
+
+
+STAGES = [
+    Stage("core_data", "0_get_core_data.ipynb",
+          outputs=[data("Dataset_list"), data("Grant_list")], external=True),
+    Stage("core_project_info", "1_get_core_project_info.ipynb",
+          inputs=["grant_query.py", "publication_query.py"],
+          outputs=[derived("radx-projects")], external=True),
+    Stage("grant_info", "2_get_grant_info.ipynb",
+          inputs=["grant_query.py", derived("radx-projects")],
+          outputs=[node("Grant"), relationship("FundingOpportunity-PROVIDES-Grant"), node("FundingOpportunity")]),
+    Stage("investigators", "2_get_investigators.ipynb",
+          inputs=["grant_query.py", "publication_query.py", derived("radx-projects")],
+          outputs=[derived("grant_investigators"), derived("radx_investigators")]),
+    Stage("citations", "3_get_citations.ipynb",
+          inputs=["publication_query.py", data("Publications_non_pubmed"), derived("radx_investigators")],
+          outputs=[node("Publication_primary"), relationship("Publication-CITES-Publication"), node("Publication_secondary"),
+                   derived("primary_authors"), derived("primary_authors_other")],
+          external=True),
+    Stage("researcher_info", "4_get_researcher_info.ipynb",
+          inputs=["grant_query.py", "publication_query.py", "identity_store.py", derived("radx-projects"), derived("primary_authors"),
+                  derived("primary_authors_other")],
+          outputs=[derived("grant_pis"), derived("id_to_author_id"), node("Researcher_investigators"),
+                   node("Researcher_primary_coauthors"), relationship("Researcher-IS_INVESTIGATOR_OF-Grant")] + IDENTITIES,
+          external=True),
+    Stage("organization_info", "5_get_organization_info.ipynb",
+          inputs=["grant_query.py", derived("radx-projects")],
+          outputs=[derived("pi_organizations"), node("Organization"), relationship("Researcher-EMPLOYED_AT-Organization")],
+          external=True),
+    Stage("process_publications", "5_process_publications.ipynb",
+          inputs=[derived("primary_authors"), derived("id_to_author_id"), derived("primary_authors_other")],
+          outputs=[relationship("Researcher-AUTHORED-Publication_investigators"), relationship("Researcher-AUTHORED-Publication_other")]),
+    Stage("manual_data", "8_get_manual_data.ipynb",
+          inputs=[data("Software_manually"), data("Researcher-DEVELOPED-Software"), data("Dataset_manually"),
+                  data("Researcher_manually"), data("Researcher-CREATED-Dataset_manually"),
+                  data("Researcher-IS_INVESTIGATOR_OF-Grant_manually")],
+          outputs=[node("Software_manually"), relationship("Researcher-DEVELOPED-Software"), node("Dataset_manually"),
+                   node("Researcher_manually"), relationship("Researcher-CREATED-Dataset_manually"),
+                   relationship("Researcher-IS_INVESTIGATOR_OF-Grant_manually")]),
+    # the metrics are merged into the publication, researcher, and grant nodes on export
+    Stage("graph_analytics", "6_add_graph_analytics.ipynb",
+          inputs=["graph_analytics.py", relationship("Publication-CITES-Publication"),
+                  relationship("Researcher-AUTHORED-Publication_investigators"), relationship("Researcher-AUTHORED-Publication_other"),
+                  relationship("Researcher-IS_INVESTIGATOR_OF-Grant"), relationship("Researcher-IS_INVESTIGATOR_OF-Grant_manually"),
+                  node("Publication_primary"), node("Publication_secondary"), node("Researcher_investigators"),
+                  node("Researcher_primary_coauthors"), node("Researcher_manually"), node("Grant")],
+          outputs=[properties("Publication"), properties("Researcher"), properties("Grant")]),
+    Stage("coordination_center_info", "6_get_coordination_center_info.ipynb",
+          inputs=[data("ResearchInitiative"), data("Grant-FUNDED-ResearchInitiative"), derived("radx-projects")],
+          outputs=[node("ResearchInitiative"), relationship("Grant-FUNDED-ResearchInitiative"),
+                   relationship("ResearchInitiative-SUPPORTED-Grant")]),
+    Stage("dataset_info", "7_get_dataset_info.ipynb",
+          inputs=["publication_query.py", derived("radx-projects"), node("Researcher_investigators")],
+          outputs=[node("Dataset"), relationship("Researcher-CREATED-Dataset")]),
+    Stage("patent_info", "7_get_patent_info.ipynb",
+          inputs=["publication_query.py", node("Researcher_investigators"), node("Researcher_primary_coauthors")],
+          outputs=[relationship("Researcher-IS_INVENTOR-Patent"), node("Patent")],
+          external=True),
+    Stage("dataset_usage", "8_get_dataset_usage.ipynb",
+          inputs=["identity_store.py", data("Dataset_usage")] + IDENTITIES,
+          outputs=[relationship("Researcher-USED-Dataset")]),
+    Stage("event_info", "8_get_event_info.ipynb",
+          inputs=["publication_query.py", node("Researcher_investigators"), node("Researcher_primary_coauthors")],
+          outputs=[relationship("Presentation-PRESENTED_AT-Event"), relationship("Researcher-PRESENTED-Presentation"),
+                   node("Presentation"), node("Event")],
+          external=True),
+    # the embeddings are written to sidecar files, which are merged into the publication nodes on export
+    Stage("embeddings", "9_add_embeddings.ipynb",
+          inputs=["embedding_store.py", node("Publication_primary")],
+          outputs=[os.path.join(KG_PATH, "nodes", "Publication_primary_embedding.npy"),
+                   os.path.join(KG_PATH, "nodes", "Publication_primary_embedding_ids.npy")]),
+]
+PROPERTIES = [path for stage in STAGES for path in stage.outputs if os.path.dirname(path) == os.path.dirname(properties(""))]
+WORKING_COPIES = [path for stage in STAGES for path in stage.outputs if path.startswith(WORKING_PATH) and path not in PROPERTIES]
+EMBEDDINGS = [path for stage in STAGES for path in stage.outputs if path.endswith(".npy")]
+STAGES.append(
+    Stage("export_kg", "10_export_kg.ipynb",
+          inputs=["kg_io.py", "validate_kg.py"] + WORKING_COPIES + PROPERTIES + EMBEDDINGS,
+          outputs=[export(path) for path in WORKING_COPIES]))
+
+
+def check_stages(stages):
+    """
+    Check that each file is written by a single stage, which doesn't read it.
+
+    A file that is updated in place changes the recorded inputs of the stages that read it, so
+    they would never be up to date.
+
+    Raises
+    ------
+    ValueError
+        If a file is written by several stages or is an input of the stage that writes it.
+    """
+    writers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if path in writers:
+                raise ValueError(f"{path} is written by the stages {writers[path]} and {stage.name}")
+            if path in stage.inputs:
+                raise ValueError(f"{path} is an input and an output of the stage {stage.name}")
+            writers[path] = stage.name
+
+
+def get_dependencies(stages):
+    """
+    Return the upstream stages of each stage.
+
+    A stage depends on every earlier stage that writes one of its input files.
+    """
+    dependencies = {}
+    for i, stage in enumerate(stages):
+        inputs = set(stage.inputs)
+        dependencies[stage.name] = {upstream.name for upstream in stages[:i] if inputs & set(upstream.outputs)}
+    return dependencies
+
+
+def resolve(path):
+    """Resolve a stage path relative to the notebooks/processing directory."""
+    return os.path.join(PROCESSING_PATH, path)
+
+
+def file_digest(path):
+    """Return the SHA-256 digest of a file, or None if the file does not exist."""
+    if not os.path.exists(resolve(path)):
+        return None
+    digest = hashlib.sha256()
+    with open(resolve(path), "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(paths):
+    return {path: file_digest(path) for path in paths}
+
+
+class BuildState:
+    """Fingerprints of the inputs of each stage at the end of its last successful run."""
+    def __init__(self, path=None):
+        self.path = resolve(BUILD_STATE_FILE) if path is None else path
+        self._lock = threading.Lock()
+        self.stages = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.stages = json.load(f)
+
+    def is_stale(self, stage):
+        """Return the reason why a stage needs to run, or an empty string if it is up to date."""
+        with self._lock:
+            recorded = self.stages.get(stage.name)
+        if recorded is None:
+            return "never built"
+        missing = [path for path in stage.outputs if not os.path.exists(resolve(path))]
+        if missing:
+            return f"missing output {missing[0]}"
+        changed = [path for path, digest in fingerprint(stage.inputs).items() if recorded.get(path) != digest]
+        if changed:
+            return f"changed input {changed[0]}"
+        return ""
+
+    def record(self, stage, inputs):
+        """Record the input fingerprints of a stage, taken when it started, so inputs changed during the run are detected."""
+        with self._lock:
+            self.stages[stage.name] = inputs
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.stages, f, indent=2, sort_keys=True)
+
+
+def profiled_notebook(stage, profile_path, trace_memory=False):
+    """Return the notebook of a stage with cells added at the start and end that profile the stage (see profiling)."""
+    import nbformat
+
+    notebook = nbformat.read(resolve(stage.notebook), as_version=4)
+    notebook.cells.insert(0, nbformat.v4.new_code_cell(
+        f"import profiling\nprofiling.start({stage.name!r}, {os.path.abspath(profile_path)!r}, trace_memory={trace_memory})"))
+    notebook.cells.append(nbformat.v4.new_code_cell("profiling.stop()"))
+    return notebook
+
+
+def run_notebook(stage, profile_path=None, trace_memory=False):
+    """Execute the notebook of a stage with papermill. If a profile path is given, the stage profile is written there."""
+    import papermill
+
+    output_path = resolve(NOTEBOOK_OUTPUT_PATH)
+    os.makedirs(output_path, exist_ok=True)
+    notebook = resolve(stage.notebook) if profile_path is None else profiled_notebook(stage, profile_path, trace_memory)
+    papermill.execute_notebook(notebook, os.path.join(output_path, stage.notebook),
+                               cwd=PROCESSING_PATH, progress_bar=False)
+
+
+def select_stages(stages, targets, dependencies):
+    """Return the stages required to build the targets (all stages if no targets are given)."""
+    if not targets:
+        return list(stages)
+
+    names = {stage.name for stage in stages}
+    unknown = set(targets) - names
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    required = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in required:
+            required.add(name)
+            pending.extend(dependencies[name])
+
+    return [stage for stage in stages if stage.name in required]
+
+
+def build(targets=None, jobs=4, dry_run=False, force=False, refresh=False, run=run_notebook, stages=STAGES, profile=False,
+          trace_memory=False):
+    """
+    Bring the selected stages up to date.
+
+    Parameters
+    ----------
+    targets : list, optional
+        Names of the stages to build including their upstream stages. Defaults to all stages.
+
+    jobs : int, optional
+        Maximum number of stages to run in parallel. Defaults to 4.
+
+    dry_run : bool, optional
+        If True, only report which stages would run. Stages are assumed to change their
+        outputs, so all downstream stages of a stale stage are reported as well.
+
+    force : bool, optional
+        If True, run all selected stages.
+
+    refresh : bool, optional
+        If True, run all selected stages with external inputs.
+
+    run : function, optional
+        Function that executes a stage. Defaults to run_notebook.
+
+    profile : bool, optional
+        If True, profile the stages and write a run report to a new directory in profiling.PROFILE_PATH.
+        The run function is called with the profile_path and trace_memory arguments.
+
+    trace_memory : bool, optional
+        If True, also record the peak memory of the profiled functions (slower).
+
+    Returns
+    -------
+    list
+        The names of the stages that ran (or would run for a dry run).
+    """
+    check_stages(stages)
+    dependencies = get_dependencies(stages)
+    selected = select_stages(stages, targets, dependencies)
+    state = BuildState()
+    executed = []
+
+    def reason(stage):
+        if force:
+            return "forced"
+        if refresh and stage.external:
+            return "refresh external inputs"
+        if dry_run and dependencies[stage.name] & set(executed):
+            return "upstream stage changed"
+        return state.is_stale(stage)
+
+    if dry_run:
+        for stage in selected:
+            why = reason(stage)
+            if why:
+                print(f"would run {stage.name:<26} ({why})")
+                executed.append(stage.name)
+        return executed
+
+    profile_path = None
+    if profile:
+        import profiling
+        profile_path = os.path.join(profiling.PROFILE_PATH, time.strftime("%Y%m%d-%H%M%S"))
+        run = functools.partial(run, profile_path=profile_path, trace_memory=trace_memory)
+
+    remaining = list(selected)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while remaining or running:
+            # start all stages whose selected upstream stages have finished
+            for stage in list(remaining):
+                active = {s.name for s in remaining} | {s.name for s, _ in running.values()}
+                if dependencies[stage.name] & active:
+                    continue
+                remaining.remove(stage)
+                why = reason(stage)
+                if not why:
+                    print(f"up to date   {stage.name}")
+                    continue
+                print(f"running      {stage.name:<26} ({why})")
+                running[executor.submit(run, stage)] = (stage, fingerprint(stage.inputs))
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, inputs = running.pop(future)
+                future.result()
+                state.record(stage, inputs)
+                print(f"finished     {stage.name}")
+                executed.append(stage.name)
+
+    if profile_path is not None and os.path.exists(profile_path):
+        profiling.write_report(profile_path)
+        print(f"profile      {os.path.join(profile_path, 'report.html')}")
+    return executed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally rebuild the radx-kg data files.")
+    parser.add_argument("targets", nargs="*", help="stages to build (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="maximum number of stages to run in parallel")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="show which stages would run")
+    parser.add_argument("-f", "--force", action="store_true", help="run all selected stages")
+    parser.add_argument("--refresh", action="store_true", help="run stages with external inputs")
+    parser.add_argument("-l", "--list", action="store_true", help="list the stages and their dependencies")
+    parser.add_argument("--profile", action="store_true", help="write a profiling report of the stages that ran")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the peak memory of the profiled functions (slower)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        dependencies = get_dependencies(STAGES)
+        for stage in STAGES:
+            upstream = ", ".join(sorted(dependencies[stage.name])) or "-"
+            print(f"{stage.name:<26} {stage.notebook:<40} depends on: {upstream}")
+        return 0
+
+    build(args.targets, jobs=args.jobs, dry_run=args.dry_run, force=args.force, refresh=args.refresh, profile=args.profile,
+          trace_memory=args.trace_memory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
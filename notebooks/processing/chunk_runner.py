@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+import hashlib
+import json
+import os
+
+# directory of the checkpoint files, override with the RADX_KG_CHECKPOINTS environment variable
+CHECKPOINT_PATH = os.getenv("RADX_KG_CHECKPOINTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "derived_data", "checkpoints"))
+
+
+def checkpoint_file(name, *key):
+    """
+    Return the path of the checkpoint file for a job.
+
+    The file name contains a hash of the key (e.g., the requested fields and ids), so a job
+    with the same key resumes from the same checkpoint.
+
+    Example:
+        >>> checkpoint_file("paper_data", "title,year", ["DOI:10.1101/2022.03.14.22272314"])
+        '.../derived_data/checkpoints/paper_data_5d0c3e0c1b6a9f1e.jsonl'
+    """
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return os.path.join(CHECKPOINT_PATH, f"{name}_{digest[:16]}.jsonl")
+
+
+def read_checkpoint(path):
+    """
+    Read the completed and failed chunks from a checkpoint file.
+
+    A chunk that failed and later completed counts as completed. An incomplete last line
+    (e.g., from an interrupted write) is ignored.
+
+    Returns:
+        tuple: (completed, failed) dictionaries with the result and the failure record by chunk index.
+    """
+    completed = {}
+    failed = {}
+    if path is None or not os.path.exists(path):
+        return completed, failed
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("failed"):
+                failed[record["chunk"]] = record
+            else:
+                completed[record["chunk"]] = record["data"]
+                failed.pop(record["chunk"], None)
+
+    for chunk in completed:
+        failed.pop(chunk, None)
+    return completed, failed
+
+
+def failed_chunks(path):
+    """Return the ids of the chunks that failed in the last run of a checkpointed job, by chunk index."""
+    _, failed = read_checkpoint(path)
+    return {chunk: record["ids"] for chunk, record in failed.items()}
+
+
+def run_chunks(chunks, process_chunk, path=None, errors=(Exception,), keep=False):
+    """
+    Process chunks in order and yield the results as each chunk completes.
+
+    Each result is appended to a write-ahead checkpoint file (JSON lines) before it is yielded.
+    When the job is restarted with the same checkpoint file, completed chunks are served from
+    the file and only the remaining and previously failed chunks are processed. Failed chunks
+    are recorded with their ids and skipped. The checkpoint file is removed once all chunks
+    have completed, unless keep is True.
+
+    Args:
+        chunks (list): The chunks (lists of ids) to process.
+        process_chunk (function): Function that takes a chunk and returns a JSON serializable result.
+        path (str, optional): Path of the checkpoint file (see checkpoint_file). If None, no checkpoint is written.
+        errors (tuple, optional): Exception types that mark a chunk as failed. Other exceptions are raised.
+        keep (bool, optional): If True, the checkpoint file is kept after all chunks completed, e.g., for a
+            job with several steps that is resumed from its completed steps (see remove_checkpoint).
+
+    Yields:
+        tuple: (chunk index, result) in chunk order.
+    """
+    completed, _ = read_checkpoint(path)
+    failed = []
+
+    file = None
+    if path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file = open(path, "a", encoding="utf-8")
+
+    def write(record):
+        if file is not None:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    try:
+        for i, chunk in enumerate(chunks):
+            if i in completed:
+                yield i, completed.pop(i)
+                continue
+
+            try:
+                result = process_chunk(chunk)
+            except errors as error:
+                write({"chunk": i, "failed": True, "ids": chunk, "error": str(error)})
+                failed.append(i)
+                continue
+
+            write({"chunk": i, "data": result})
+            yield i, result
+    finally:
+        if file is not None:
+            file.close()
+
+    if failed:
+        print(f"ERROR: {len(failed)} of {len(chunks)} chunks failed, run again to retry them (checkpoint: {path})")
+    elif not keep:
+        remove_checkpoint(path)
+
+
+def remove_checkpoint(path):
+    """Remove a checkpoint file if it exists."""
+    if path is not None and os.path.exists(path):
+        os.remove(path)
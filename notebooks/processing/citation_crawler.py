@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Breadth-first expansion of the citation graph for multi-hop impact analysis.
+
+Starting from the primary publications (distance 1), each depth requests the citations of a
+frontier of publications from the Semantic Scholar /paper/batch endpoint in chunks of
+publication_query.CHUNK_SIZE ids. The title and abstract of the citing papers are requested
+with the citations, so the next frontier is scored (see publication_query.RelevanceScorer)
+without additional requests. Citing papers that were already visited are not expanded again,
+and each frontier beyond the first is pruned to the publications that match a relevant term,
+at most DEPTH_BUDGET of them, most relevant first. The number of requests therefore grows
+with the budget, not exponentially with the depth.
+
+Citation edges (from: citing DOI, to: cited DOI) are appended to CITATIONS_FILE as each chunk
+completes. The chunks of each depth are checkpointed (see chunk_runner), and the checkpoints
+are kept until the whole crawl completes. An interrupted crawl replays the completed chunks
+from their checkpoints, which rewrites CITATIONS_FILE and selects the same frontiers, and
+resumes at the interrupted depth without repeating requests. If a chunk fails, the crawl stops
+at the end of its depth with an error, and the failed chunks are retried when it runs again.
+
+Usage (from the notebooks/processing directory):
+    python citation_crawler.py                          # crawl from the primary publications in the KG
+    python citation_crawler.py --depth 3 --budget 1000 doi:10.3390/bios12110938
+"""
+import argparse
+import csv
+import os
+import pandas as pd
+import requests
+import chunk_runner
+import kg_io
+import profiling
+import publication_query
+
+MAX_DEPTH = 3
+# maximum number of publications expanded at each depth beyond the first
+DEPTH_BUDGET = 2000
+CITATIONS_FILE = os.getenv("RADX_KG_CITATIONS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "derived_data",
+                                                               "citations", "Publication-CITES-Publication.csv"))
+# fields of the expanded papers and their citing papers
+PAPER_FIELDS = "externalIds,title,abstract,year"
+CRAWL_FIELDS = PAPER_FIELDS + ",citations.paperId,citations.externalIds,citations.title,citations.abstract,citations.year"
+PUBLICATION_COLUMNS = ["doi", "paperId", "title", "abstract", "year", "distance", "relevance", "expanded"]
+
+
+def get_doi(paper):
+    """Return the prefixed DOI of a paper record, or None if it has no DOI."""
+    doi = (paper.get("externalIds") or {}).get("DOI")
+    return "doi:" + doi if doi else None
+
+
+def to_publication(paper, doi, distance):
+    year = paper.get("year")
+    return {"doi": doi, "paperId": paper.get("paperId") or "", "title": paper.get("title") or "",
+            "abstract": paper.get("abstract") or "", "year": str(year) if year is not None else "", "distance": distance}
+
+
+def select_frontier(candidates, min_relevance, budget):
+    """
+    Return the DOIs of the candidates to expand next: those with a relevance above min_relevance,
+    at most budget of them (None: no limit), most relevant first.
+    """
+    selected = candidates[candidates["relevance"] > min_relevance]
+    # a stable sort keeps the discovery order among equally relevant publications
+    selected = selected.sort_values("relevance", ascending=False, kind="stable")
+    if budget is not None:
+        selected = selected.head(budget)
+    return selected["doi"].tolist()
+
+
+def crawl_citations(paper_ids, max_depth=MAX_DEPTH, budget=DEPTH_BUDGET, min_relevance=None, citations_file=CITATIONS_FILE,
+                    scorer=None, checkpoint=True):
+    """
+    Expand the citations of publications breadth-first up to a citation distance.
+
+    Parameters
+    ----------
+    paper_ids : list
+        The publications to start from (distance 1), e.g., ["doi:10.3390/bios12110938"]. They are all expanded.
+
+    max_depth : int, optional
+        The maximum citation distance of the publications found, e.g., 3 for the papers that cite
+        the papers that cite the primary publications. Defaults to MAX_DEPTH.
+
+    budget : int or dict, optional
+        The maximum number of publications expanded at each distance > 1, or a dict by distance
+        (missing distances are not limited). None expands all selected publications. Defaults to DEPTH_BUDGET.
+
+    min_relevance : float or dict, optional
+        Publications with a relevance score not above this value (or a dict by distance) are not
+        expanded. Defaults to the score of a publication without a matched term (alpha**distance),
+        so only publications that match a relevant term are expanded.
+
+    citations_file : str, optional
+        The CSV file the citation edges (from, to) are written to. Defaults to CITATIONS_FILE.
+
+    scorer : RelevanceScorer, optional
+        The relevance scorer. Defaults to the COVID-19 terms (see publication_query.RelevanceScorer).
+
+    checkpoint : bool, optional
+        If True, the chunks of each depth are checkpointed (see chunk_runner.run_chunks). The
+        checkpoints are removed when the crawl completes.
+
+    Returns
+    -------
+    pd.DataFrame
+        The publications found with a DOI: doi, paperId, title, abstract, year, distance, relevance,
+        and expanded (True if their citations were requested).
+
+    Raises
+    ------
+    RuntimeError
+        If a chunk failed after all retries. The completed chunks are kept in the checkpoints.
+    """
+    scorer = scorer or publication_query.RelevanceScorer()
+    apikey = publication_query.get_s2_apikey()
+
+    # DOIs are case insensitive
+    frontier = []
+    visited = set()
+    for paper_id in paper_ids:
+        if paper_id.lower() not in visited:
+            visited.add(paper_id.lower())
+            frontier.append(paper_id)
+    publications = []
+    expanded = set()
+    checkpoints = []
+
+    os.makedirs(os.path.dirname(os.path.abspath(citations_file)), exist_ok=True)
+    with open(citations_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["from", "to"])
+
+        for distance in range(1, max_depth):
+            if not frontier:
+                break
+            chunks = publication_query.create_chunks(frontier, publication_query.CHUNK_SIZE)
+            path = chunk_runner.checkpoint_file("citation_crawl", CRAWL_FIELDS, frontier) if checkpoint else None
+            checkpoints.append(path)
+            candidates = []
+            n_citations = 0
+            n_completed = 0
+
+            def process_chunk(chunk):
+                return publication_query.get_paper_data_chunk(chunk, CRAWL_FIELDS, apikey)
+
+            # the checkpoints of the completed depths are needed to resume the crawl, they are removed at the end
+            for _, data in chunk_runner.run_chunks(chunks, process_chunk, path, errors=(requests.exceptions.RequestException,),
+                                                   keep=True):
+                n_completed += 1
+                edges = []
+                for paper in data:
+                    doi = get_doi(paper) if paper else None
+                    # ids that resolve to a paper that was already expanded (e.g., a PubMed id and a DOI)
+                    if doi is None or doi.lower() in expanded:
+                        continue
+                    if distance == 1:
+                        publications.append(to_publication(paper, doi, distance))
+                    expanded.add(doi.lower())
+                    for citation in paper.get("citations") or []:
+                        citing_doi = get_doi(citation)
+                        if citing_doi is None:
+                            continue
+                        edges.append((citing_doi, doi))
+                        if citing_doi.lower() not in visited:
+                            visited.add(citing_doi.lower())
+                            candidates.append(to_publication(citation, citing_doi, distance + 1))
+                # the edges of a chunk are written as soon as it completes, each cited paper is expanded once,
+                # so edges are unique if they are unique within a chunk (Semantic Scholar lists some citations twice)
+                edges = list(dict.fromkeys(edges))
+                writer.writerows(edges)
+                file.flush()
+                n_citations += len(edges)
+
+            # a smaller frontier would change the following depths, so the crawl doesn't continue without the failed chunks
+            if n_completed < len(chunks):
+                raise RuntimeError(f"{len(chunks) - n_completed} of {len(chunks)} chunks failed at distance {distance}, "
+                                   f"run the crawl again to retry them")
+
+            candidates = pd.DataFrame(candidates, columns=PUBLICATION_COLUMNS[:-2])
+            candidates = scorer.score(candidates, ["title", "abstract"], distance + 1)
+            publications.extend(candidates.to_dict("records"))
+
+            threshold = min_relevance.get(distance + 1) if isinstance(min_relevance, dict) else min_relevance
+            if threshold is None:
+                threshold = scorer.alpha**(distance + 1)
+            limit = budget.get(distance + 1) if isinstance(budget, dict) else budget
+            frontier = select_frontier(candidates, threshold, limit) if distance + 1 < max_depth else []
+            print(f"Distance {distance}: expanded {len(chunks)} chunks, {n_citations} citations, "
+                  f"{len(candidates)} new publications, {len(frontier)} selected for expansion")
+
+    for path in checkpoints:
+        chunk_runner.remove_checkpoint(path)
+
+    df = pd.DataFrame(publications, columns=PUBLICATION_COLUMNS[:-1])
+    # publications at distance 1 are scored after the crawl, they don't affect the pruning
+    primary = df["distance"] == 1
+    if primary.any():
+        df.loc[primary, "relevance"] = scorer.score(df[primary].copy(), ["title", "abstract"], 1)["relevance"]
+    df["expanded"] = df["doi"].str.lower().isin(expanded)
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expand the citations of publications breadth-first.")
+    parser.add_argument("paper_ids", nargs="*", help="DOIs to start from (default: the primary publications in the KG)")
+    parser.add_argument("--depth", type=int, default=MAX_DEPTH, help="maximum citation distance")
+    parser.add_argument("--budget", type=int, default=DEPTH_BUDGET, help="maximum number of publications expanded at each depth")
+    parser.add_argument("--min-relevance", type=float, help="minimum relevance score of the expanded publications")
+    parser.add_argument("--citations-file", default=CITATIONS_FILE, help="CSV file of the citation edges")
+    parser.add_argument("--working-path", default=kg_io.WORKING_PATH, help="directory with the working copies")
+    args = parser.parse_args(argv)
+
+    paper_ids = args.paper_ids or kg_io.load("Publication_primary", columns=["doi"], working_path=args.working_path)["doi"].tolist()
+    publications = crawl_citations(paper_ids, args.depth, args.budget, args.min_relevance, args.citations_file)
+    publications_file = os.path.join(os.path.dirname(os.path.abspath(args.citations_file)), "publications.csv")
+    publications.to_csv(publications_file, index=False)
+    print(publications.groupby("distance").agg(publications=("doi", "size"), expanded=("expanded", "sum")).to_string())
+    print(f"Wrote the citations to {args.citations_file} and the publications to {publications_file}")
+
+
+profiling.instrument(__name__, exclude=["main", "get_doi", "to_publication"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Binary storage for node embeddings.
+
+Embeddings are stored in .npy sidecar files next to the node CSV file (e.g., Publication_primary.csv
+-> Publication_primary_embedding.npy and Publication_primary_embedding_ids.npy) as a float matrix
+with one row per node id. The pipe-delimited embedding column required by the Neo4j bulk import is
+generated from the sidecar with export_csv.
+
+The file naming must match sidecar_paths in notebooks/visualization/vector_index.py, which
+memory-maps the sidecar files.
+
+The sidecar files are generated (by 9_add_embeddings.ipynb, or from the embedding column by
+vector_index.load_embeddings) and are not versioned with the KG: .gitignore excludes the
+*_embedding.npy and *_embedding_ids.npy files, and the embeddings in kg/data are versioned in
+the embedding column of the node CSV files.
+
+Usage (from the notebooks/processing directory):
+    python embedding_store.py ../kg/data/nodes/Publication_primary.csv   # write the embedding column
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+EMBEDDING_COLUMN = "embedding"
+# separator of the embedding values in the node CSV files (Neo4j array delimiter)
+EMBEDDING_SEPARATOR = "|"
+# float32 holds the SPECTER API values exactly, float16 halves the file size
+EMBEDDING_DTYPE = np.float32
+
+
+def sidecar_paths(csv_file):
+    """Return the paths of the embedding and id sidecar files of a node CSV file."""
+    stem = os.path.splitext(csv_file)[0]
+    return stem + "_embedding.npy", stem + "_embedding_ids.npy"
+
+
+def write_embeddings(csv_file, ids, embeddings, dtype=EMBEDDING_DTYPE):
+    """
+    Save the embeddings of the nodes in a node CSV file to its sidecar files.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path of the node CSV file.
+
+    ids : list
+        Node ids, one per row of embeddings.
+
+    embeddings : array-like
+        Matrix of shape (len(ids), dimension).
+
+    dtype : numpy.dtype, optional
+        Storage type of the embeddings, float32 or float16. Defaults to EMBEDDING_DTYPE.
+    """
+    embeddings = np.asarray(embeddings, dtype=dtype)
+    if embeddings.ndim != 2 or len(embeddings) != len(ids):
+        raise ValueError(f"Expected a matrix with {len(ids)} rows, got shape {embeddings.shape}")
+
+    embedding_file, id_file = sidecar_paths(csv_file)
+    np.save(embedding_file, embeddings)
+    np.save(id_file, np.asarray(ids, dtype=str))
+
+
+def read_embeddings(csv_file, mmap=True):
+    """
+    Load the node ids and embeddings from the sidecar files of a node CSV file.
+
+    The embeddings are memory-mapped read-only unless mmap is False.
+
+    Returns
+    -------
+    tuple
+        (ids, embeddings) as a numpy string array and a float matrix.
+    """
+    embedding_file, id_file = sidecar_paths(csv_file)
+    return np.load(id_file), np.load(embedding_file, mmap_mode="r" if mmap else None)
+
+
+def has_embeddings(csv_file):
+    """Return True if the sidecar files of a node CSV file exist."""
+    return all(os.path.exists(path) for path in sidecar_paths(csv_file))
+
+
+def format_embeddings(embeddings):
+    """Format each row of an embedding matrix as a pipe-delimited string, e.g., "-1.91|-4.97|..."."""
+    # tolist() converts to Python floats, which print the shortest representation of the stored value
+    return [EMBEDDING_SEPARATOR.join(map(str, row)) for row in np.asarray(embeddings).tolist()]
+
+
+def export_csv(csv_file, column=EMBEDDING_COLUMN):
+    """
+    Write the embeddings from the sidecar files into the embedding column of a node CSV file.
+
+    Nodes without an embedding get an empty value. An existing embedding column is replaced.
+    """
+    df = pd.read_csv(csv_file, dtype=str, keep_default_na=False, usecols=lambda name: name != column)
+    ids, embeddings = read_embeddings(csv_file)
+    values = pd.Series(format_embeddings(embeddings), index=ids, dtype=str)
+    df[column] = df["id"].map(values).fillna("")
+    df.to_csv(csv_file, index=False)
+    # the sidecar files match the CSV file, readers rebuild sidecar files that are older (see vector_index.load_embeddings)
+    for path in sidecar_paths(csv_file):
+        os.utime(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the embedding column of node CSV files from their sidecar files.")
+    parser.add_argument("csv_files", nargs="+", help="node CSV files, e.g., ../kg/data/nodes/Publication_primary.csv")
+    args = parser.parse_args()
+
+    for csv_file in args.csv_files:
+        if not has_embeddings(csv_file):
+            print(f"ERROR: no embedding sidecar for {csv_file}")
+            continue
+        export_csv(csv_file)
+        print(f"Exported embeddings to {csv_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,46 @@
 # coding: utf-8
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import requests
 from fake_useragent import UserAgent
 import json
 import re
-import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from titlecase import titlecase
-from Levenshtein import jaro_winkler
 from typing import List
-from utils import rename_and_reorder_columns
+from publication_query import rename_and_reorder_columns
+import http_utils
+import profiling
+import name_matching
 
 # Parameters for NIH Reporter Search
 PROJECT_LIMIT = 500 # maximum number of records for project search
+PROJECTS_URL = "https://api.reporter.nih.gov/v2/projects/search"
+REPORTER_HEADERS = {"accept": "application/json"}
+# NIH RePORTER asks clients to post no more than one request per second
+REPORTER_RATE_LIMIT = 1
+PI_NAME_BATCH_SIZE = 50 # maximum number of names in a pi_names query
+GRANTS_GOV_URL = "https://apply07.grants.gov/grantsws/rest/opportunities/search"
+
+# RePORTER project fields used for Grant nodes (dotted paths refer to nested objects)
+PROJECT_COLUMN_MAP = {"project_serial_num": "projectSerialNum", "core_project_num": "coreProjectNum", "fiscal_year": "fiscalYear", "appl_id": "applId", 
+                      "agency_ic_admin.abbreviation": "agency", "project_title": "projectTitle", "abstract_text": "abstract", "phr_text": "narrative", 
+                      "funding_mechanism": "fundingMechanism", "activity_code": "awardCode", "opportunity_number": "opportunityNumber"}
+# project_num replaces missing project serial numbers
+PROJECT_FIELDS = list(PROJECT_COLUMN_MAP.keys()) + ["project_num"]
+# principal investigator fields and the project fields added to each investigator
+PI_FIELDS = ["profile_id", "first_name", "middle_name", "last_name", "is_contact_pi", "full_name", "title"]
+PI_PROJECT_FIELDS = ["appl_id", "core_project_num", "project_serial_num", "fiscal_year"]
+PI_COLUMN_MAP = {"profile_id": "profileId", "core_project_num": "coreProjectNum", "project_serial_num": "projectSerialNum", "is_contact_pi": "isContactPi", "fiscal_year": "fiscalYear",
+                 "name": "name", "full_name": "fullName", "first_name": "firstName", "middle_name": "middleName", "last_name": "lastName"}
+ORGANIZATION_FIELDS = ["appl_id", "organization.org_name", "organization.org_city", "organization.org_zipcode", "organization.org_state", 
+                       "organization.org_country", "organization.primary_duns", "organization.primary_uei"]
+# Arrow types of the non-string fields
+FIELD_TYPES = {"appl_id": pa.int64(), "fiscal_year": pa.int64(), "profile_id": pa.int64(), "is_contact_pi": pa.bool_()}
+# project fields of a project snapshot, from which projects and organizations are derived
+SNAPSHOT_FIELDS = list(dict.fromkeys(PROJECT_FIELDS + ORGANIZATION_FIELDS))
 
 
 def get_projects(core_project_numbers: List[str], chunk_size: int = PROJECT_LIMIT) -> pd.DataFrame:
@@ -48,41 +76,17 @@ def get_projects(core_project_numbers: List[str], chunk_size: int = PROJECT_LIMI
     2   10129336          None         2021    5R01DC016112-05            DC016112  ...
     ...
     """
-    # Fetch project data in batches and concatenate the results
-    offset = 0
-    num_records = 1
-    batches = []
-    while offset < num_records:
-        data, num_records = search_project_numbers(core_project_numbers, chunk_size, offset)
-        batches.append(data)
-        offset += chunk_size
-        
-    # Normalize the JSON data and concatenate into a DataFrame
-    projects = [pd.json_normalize(data["results"]) for data in batches]
-    
-    # Concatenate the extracted data into a DataFrame
-    df = pd.concat(projects, join="inner")
-
-    # Standardize and simplify data
-    df = transform_data(df)
-    return df
+    # Projects are derived from the snapshot shared with get_principal_investigators
+    return get_project_snapshot(search_project_numbers, core_project_numbers, chunk_size).projects()
 
 
 def transform_data(df):
-    df["project_serial_num"].fillna("", inplace=True)
-    df["project_serial_num"] = df.apply(lambda x: x["project_serial_num"] if len(x["project_serial_num"]) > 0 else x["project_num"], axis=1, result_type='expand')
+    # use the project number if the project serial number is missing
+    serial_num = df["project_serial_num"].fillna("")
+    df["project_serial_num"] = serial_num.where(serial_num.str.len() > 0, df["project_num"])
     df["project_serial_num"] = df["project_serial_num"].str.split("-").str[0]
     
-    df["covid_response"].fillna("", inplace=True)
-    
-    # truncate date to YYYY-MM-DD 
-    df["project_start_date"] = df["project_start_date"].str[:10]
-    df["budget_start_date"] = df["budget_start"].str[:10]
-    df["budget_end_date"] = df["budget_end"].str[:10]
-    df_map = {"project_serial_num": "projectSerialNum", "core_project_num": "coreProjectNum", "fiscal_year": "fiscalYear", "appl_id": "applId", 
-              "agency_ic_admin.abbreviation": "agency", "project_title": "projectTitle", "abstract_text": "abstract", "phr_text": "narrative", 
-              "funding_mechanism": "fundingMechanism", "activity_code": "awardCode", "opportunity_number": "opportunityNumber"}
-    df = rename_and_reorder_columns(df, df_map)
+    df = rename_and_reorder_columns(df, PROJECT_COLUMN_MAP)
     return df
 
 
@@ -111,6 +115,26 @@ def standardize_name(name):
     return name.title()
 
 
+def standardize_names(names):
+    """
+    Vectorized version of standardize_name for a pandas Series of names.
+
+    The rules are applied with pandas string methods to the unique names only (investigators
+    occur once per project and fiscal year) and mapped back. Names starting with Mc (rare) are
+    passed to titlecase individually.
+    """
+    unique_names = pd.Series(names.dropna().unique(), dtype=object)
+    standardized = unique_names.str.replace(".", "", regex=False)
+    upper = standardized.str.upper()
+    mc = upper.str.startswith("MC") | upper.str.contains(" MC", regex=False)
+    # str.islower and str.isupper are False for names without cased characters, which are kept as is
+    single_case = standardized.str.islower() | standardized.str.isupper()
+
+    standardized = standardized.where(~single_case, standardized.str.title())
+    standardized[mc] = unique_names[mc].str.replace(".", "", regex=False).map(titlecase)
+    return names.map(dict(zip(unique_names, standardized)))
+
+
 def add_prefix(identifier, prefix):
     """
     Add a prefix if the identifier is not empty or NaN
@@ -194,186 +218,324 @@ def create_chunks(data, chunk_size):
     return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
 
 
-def search_project_numbers(core_project_numbers, chunk_size, offset):
-    #print("search_projects:", core_project_numbers)  
-    PROJECTS_URL = "https://api.reporter.nih.gov/v2/projects/search"
-    HEADERS = {"accept": "application/json"}
-    params = {"criteria": {"project_nums": core_project_numbers,},
+def search_projects(criteria, chunk_size, offset):
+    """
+    Search NIH RePORTER projects for a page of results.
+
+    API description: https://api.reporter.nih.gov/#/Search/post_v2_projects_search
+
+    Requests are throttled by a shared token bucket set to RePORTER's published rate limit.
+    """
+    params = {"criteria": criteria,
               "offset": offset,
               "limit": chunk_size,
              }
-    
-    try:
-        response = requests.post(PROJECTS_URL, headers=HEADERS, json=params)
-        response.raise_for_status()
-        data = response.json()
-        num_records = data["meta"]["total"]
-    except requests.exceptions.HTTPError as error:
-        print(f"ERROR: nih_reporter HTTP error: {error}")
-    except requests.exceptions.RequestException as error:
-        print(f"ERROR: nih_reporter: {error}")
-
-    time.sleep(1)
+    limiter = http_utils.get_rate_limiter("reporter", REPORTER_RATE_LIMIT)
+    data = http_utils.post_json(PROJECTS_URL, limiter=limiter, headers=REPORTER_HEADERS, json=params)
+    num_records = data["meta"]["total"]
     return data, num_records
 
 
+def search_project_numbers(core_project_numbers, chunk_size, offset):
+    return search_projects({"project_nums": core_project_numbers}, chunk_size, offset)
+
+
 def search_profile_ids(profile_ids, chunk_size, offset): 
-    PROJECTS_URL = "https://api.reporter.nih.gov/v2/projects/search"
-    HEADERS = {"accept": "application/json"}
-    params = {"criteria": {
-                  "pi_profile_ids" : profile_ids,
-              },
-              "offset": offset,
-              "limit": chunk_size,
-             }
-    
-    try:
-        response = requests.post(PROJECTS_URL, headers=HEADERS, json=params)
-        response.raise_for_status()
-        data = response.json()
-        num_records = data["meta"]["total"]
-    except requests.exceptions.HTTPError as error:
-        print(f"ERROR: nih_reporter HTTP error: {error}")
-    except requests.exceptions.RequestException as error:
-        print(f"ERROR: nih_reporter: {error}")
-
-    time.sleep(1)
-    return data, num_records
+    return search_projects({"pi_profile_ids": profile_ids}, chunk_size, offset)
 
 
 def search_principal_investigators_by_name(investigator, chunk_size, offset): 
-    PROJECTS_URL = "https://api.reporter.nih.gov/v2/projects/search"
-    HEADERS = {"accept": "application/json"}
-    params = {"criteria": {
-                  "pi_names" : [
-                      {"any_name": investigator}
-                  ]
-              },
-              "offset": offset,
-              "limit": chunk_size,
-             }
-    
-    try:
-        response = requests.post(PROJECTS_URL, headers=HEADERS, json=params)
-        response.raise_for_status()
-        data = response.json()
-        num_records = data["meta"]["total"]
-    except requests.exceptions.HTTPError as error:
-        print(f"ERROR: nih_reporter HTTP error: {error}")
-    except requests.exceptions.RequestException as error:
-        print(f"ERROR: nih_reporter: {error}")
-
-    time.sleep(1)
-    return data, num_records
+    return search_projects({"pi_names": [{"any_name": investigator}]}, chunk_size, offset)
+
+
+def search_principal_investigators_by_names(investigators, chunk_size, offset): 
+    return search_projects({"pi_names": [{"any_name": investigator} for investigator in investigators]}, chunk_size, offset)
+
 
-def get_principal_investigators_by_name(investigators, chunk_size=PROJECT_LIMIT):
+def get_field(record, path):
+    """Return the value of a dotted field path (e.g., organization.org_name) in a JSON record, or None."""
+    for key in path.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def to_record_batch(records, fields):
     """
-    Retrieve principal investigator data for projects associated with a list of core project numbers.
+    Convert JSON records into an Arrow record batch with only the given fields.
 
-    This function divides the list of investigators into smaller chunks to prevent
-    overloading the API. It then fetches project data for each chunk and extracts principal
-    investigator information, expanding it into a structured DataFrame.
+    Fields are typed according to FIELD_TYPES, all other fields are strings.
 
     Args:
-        investigators (list): A list of investigator names to retrieve data for.
-        chunk_size (int, optional): The maximum number of core project numbers to include in
-            each API request. Defaults to PROJECT_LIMIT.
+        records (list): JSON records (dicts).
+        fields (list): Field paths to extract, nested fields are separated by dots.
 
     Returns:
-        pandas.DataFrame: A DataFrame containing principal investigator data associated with
-            the specified core project numbers.
+        pyarrow.RecordBatch: A record batch with one column per field.
+    """
+    arrays = []
+    for field in fields:
+        field_type = FIELD_TYPES.get(field, pa.string())
+        values = [get_field(record, field) for record in records]
+        if field_type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=field_type))
+    return pa.RecordBatch.from_arrays(arrays, names=fields)
+
+
+def fetch_project_tables(search, query, chunk_size, project_fields=None, pi_project_fields=None):
+    """
+    Stream all result pages for a RePORTER search into Arrow tables.
+
+    Each page is converted into record batches with only the requested fields as soon as it
+    arrives, and the raw JSON page is discarded, so memory use does not grow with the size of
+    the unused fields (e.g., abstracts and narratives) or the number of pages in flight.
+
+    Args:
+        search (function): One of the search_* functions, called as search(query, chunk_size, offset).
+        query (list or str): The query passed to the search function.
+        chunk_size (int): The number of records per page.
+        project_fields (list, optional): Project fields to extract, one row per project.
+        pi_project_fields (list, optional): Project fields added to each principal investigator,
+            one row per principal investigator with the PI_FIELDS. If None, no investigators are extracted.
+
+    Returns:
+        tuple: (projects, pis) pyarrow.Table or None if the corresponding fields were not requested.
+    """
+    project_batches = []
+    pi_batches = []
+    for page in http_utils.fetch_pages(lambda offset: search(query, chunk_size, offset), chunk_size):
+        results = page["results"]
+        if project_fields is not None:
+            project_batches.append(to_record_batch(results, project_fields))
+        if pi_project_fields is not None:
+            pis = [(pi, project) for project in results for pi in project.get("principal_investigators") or []]
+            pi_batch = to_record_batch([pi for pi, _ in pis], PI_FIELDS)
+            project_batch = to_record_batch([project for _, project in pis], pi_project_fields)
+            pi_batches.append(pa.RecordBatch.from_arrays(pi_batch.columns + project_batch.columns,
+                                                         names=PI_FIELDS + pi_project_fields))
+
+    projects = to_table(project_batches, project_fields) if project_fields is not None else None
+    pis = to_table(pi_batches, PI_FIELDS + pi_project_fields) if pi_project_fields is not None else None
+    return projects, pis
+
+
+def to_table(batches, fields):
+    """Combine record batches into a table (an empty table with the typed fields if there are no batches)."""
+    schema = pa.schema([(field, FIELD_TYPES.get(field, pa.string())) for field in fields])
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+class ProjectSnapshot:
+    """
+    The RePORTER project records of a search, fetched once.
+
+    All result pages are streamed into a project table with the SNAPSHOT_FIELDS and a principal
+    investigator table with the PI_FIELDS and PI_PROJECT_FIELDS (see fetch_project_tables).
+    Projects, principal investigators, and organizations are derived from these tables, so they
+    are consistent with each other. Use get_project_snapshot to share snapshots.
+
+    Args:
+        search (function): One of the search_* functions, called as search(query, chunk_size, offset).
+        query (list): The query passed to the search function.
+        chunk_size (int, optional): The number of records per page. Defaults to PROJECT_LIMIT.
+    """
+    def __init__(self, search, query, chunk_size=PROJECT_LIMIT):
+        self.query = query
+        self.project_table, self.pi_table = fetch_project_tables(search, query, chunk_size, project_fields=SNAPSHOT_FIELDS,
+                                                                 pi_project_fields=PI_PROJECT_FIELDS)
+
+    def projects(self):
+        """Return the projects in the Grant node format (see get_projects)."""
+        return transform_data(self.project_table.select(PROJECT_FIELDS).to_pandas())
+
+    def principal_investigators(self):
+        """Return the principal investigators of the projects (see get_principal_investigators)."""
+        df = standardize_pi_names(self.pi_table.to_pandas())
+        return rename_and_reorder_columns(df, PI_COLUMN_MAP)
+
+    def organizations(self, profile_ids):
+        """Return the latest organization of each of the principal investigators with the given profile ids (see get_organizations)."""
+        profile_df = self.pi_table.select(PI_FIELDS + ["appl_id", "fiscal_year"]).to_pandas()
+        # only the contact PI has associated organization info
+        profile_df.query("is_contact_pi == True", inplace=True)
+
+        # keep only the latest fiscal year to get the latest organization info
+        profile_df["appl_id"] = profile_df["appl_id"].astype(str)
+        profile_df["profile_id"] = profile_df["profile_id"].astype(str)
+        profile_df.sort_values("fiscal_year", ascending=False, kind="stable", inplace=True)
+        profile_df.drop_duplicates("profile_id", inplace=True)
+
+        # organization information
+        project_df = self.project_table.select(ORGANIZATION_FIELDS).to_pandas()
+        project_df["appl_id"] = project_df["appl_id"].astype(str)
+
+        # keep only records that match the profile ids
+        orgs = profile_df.merge(project_df, on="appl_id")
+        return orgs[orgs["profile_id"].isin(profile_ids)]
+
+
+# futures of the project snapshots by search, query, and chunk size
+_project_snapshots = {}
+_project_snapshots_lock = threading.Lock()
+
+
+def get_project_snapshot(search, query, chunk_size=PROJECT_LIMIT):
+    """
+    Return the project snapshot of a search, fetching it only once per process.
+
+    The query is deduplicated and sorted, so the same set of criteria maps to the same snapshot
+    and to the same request bodies. Notebooks that run in separate processes share the
+    responses through the response cache (see response_cache).
+
+    The lock only guards the lookup: the first caller of a query fetches the snapshot, concurrent
+    callers of the same query wait for its future, and callers of other queries are not blocked.
+    If the fetch fails, the error is raised in all waiting callers and the next call fetches again.
 
     Example:
-        >>> investigators = []
-        >>> get_principal_investigators(core_project_numbers)
+        >>> snapshot = get_project_snapshot(search_project_numbers, ["U01AA029316", "R01DC016112"])
+        >>> projects, pis = snapshot.projects(), snapshot.principal_investigators()
     """
-    # Fetch project data in batches and concatenate the results
-    batches = []
-    for investigator in investigators:
-        offset = 0
-        num_records = 1
-        while offset < num_records:
-            data, num_records = search_principal_investigators_by_name(investigator, chunk_size, offset)
-            batches.append(data)
-            offset += chunk_size
-    
-    # Extract and expand principal investigator data
-    pis = [pd.json_normalize(data["results"], record_path=["principal_investigators"],
-                             meta=["appl_id", "core_project_num", "project_serial_num", "fiscal_year"]) for data in batches]
-    
-    # Concatenate the extracted data into a DataFrame
-    df = pd.concat(pis)
-
-    # standardize names
-    df["first_name"] = df["first_name"].apply(standardize_name)
-    df["last_name"] = df["last_name"].apply(standardize_name)
-    df["middle_name"] = df["middle_name"].apply(standardize_name)
-    df["full_name"] = df["full_name"].apply(standardize_name)
+    query = sorted(dict.fromkeys(query), key=str)
+    key = (search.__name__, tuple(query), chunk_size)
+    with _project_snapshots_lock:
+        future = _project_snapshots.get(key)
+        fetch = future is None
+        if fetch:
+            future = _project_snapshots[key] = Future()
+
+    if fetch:
+        try:
+            future.set_result(ProjectSnapshot(search, query, chunk_size))
+        except BaseException as error:
+            with _project_snapshots_lock:
+                if _project_snapshots.get(key) is future:
+                    del _project_snapshots[key]
+            future.set_exception(error)
+            raise
+    return future.result()
+
+
+def clear_project_snapshots():
+    """Discard the project snapshots, e.g., to fetch updated project records."""
+    with _project_snapshots_lock:
+        _project_snapshots.clear()
+
+
+def standardize_pi_names(df):
+    """Standardize the principal investigator names and add the name column in "lastname initials" format."""
+    for column in ["first_name", "last_name", "middle_name", "full_name"]:
+        df[column] = standardize_names(df[column])
     df["name"] = df["last_name"] + " " + df["first_name"].str[:1] + df["middle_name"].str[:1]
     # create PI name in firstname lastname format to match dbGaP convention
     #df["grant_pi"] = pis["last_name"] + " " + pis["first_name"]
     df["appl_id"] = df["appl_id"].astype(str)
-    col_map = {"profile_id": "profileId", "core_project_num": "coreProjectNum", "project_serial_num": "projectSerialNum", "is_contact_pi": "isContactPi", "fiscal_year": "fiscalYear",
-              "name": "name", "full_name": "fullName", "first_name": "firstName", "middle_name": "middleName", "last_name": "lastName"}
-
-    return rename_and_reorder_columns(df, col_map)
+    return df
 
 
-def get_principal_investigators(core_project_numbers, chunk_size=PROJECT_LIMIT):
+def get_principal_investigators_by_name(investigators, chunk_size=PROJECT_LIMIT, batch_size=PI_NAME_BATCH_SIZE):
     """
-    Retrieve principal investigator data for projects associated with a list of core project numbers.
+    Retrieve principal investigator data for projects associated with a list of investigator names.
 
-    This function divides the list of core project numbers into smaller chunks to prevent
-    overloading the API. It then fetches project data for each chunk and extracts principal
-    investigator information, expanding it into a structured DataFrame.
+    The names are packed into batches of up to batch_size names, and each batch is sent as a
+    single RePORTER query with multiple pi_names criteria. Each principal investigator in the
+    combined result is mapped back to the query name that matches it (see match_query_names).
 
     Args:
-        core_project_numbers (list): A list of core project numbers to retrieve data for.
-        chunk_size (int, optional): The maximum number of core project numbers to include in
-            each API request. Defaults to PROJECT_LIMIT.
+        investigators (list): A list of investigator names to retrieve data for.
+        chunk_size (int, optional): The maximum number of records to include in
+            each API response. Defaults to PROJECT_LIMIT.
+        batch_size (int, optional): The maximum number of names to include in each query.
+            Defaults to PI_NAME_BATCH_SIZE.
 
     Returns:
-        pandas.DataFrame: A DataFrame containing principal investigator data associated with
-            the specified core project numbers.
+        pandas.DataFrame: A DataFrame containing principal investigator data for projects
+            associated with the specified names. The queryName column contains the query name
+            that matches the investigator, or an empty string for other investigators of the project.
 
     Example:
-        >>> core_project_numbers = ["U01AA029316", "R01DC016112"]
-        >>> get_principal_investigators(core_project_numbers)
+        >>> investigators = ["Edward P DeMauro", "Devin MacKenzie"]
+        >>> get_principal_investigators_by_name(investigators)
     """
-    # Fetch project data in batches and concatenate the results
-    offset = 0
-    num_records = 1
-    batches = []
-    while offset < num_records:
-        data, num_records = search_project_numbers(core_project_numbers, chunk_size, offset)
-        batches.append(data)
-        offset += chunk_size
-    
-    # Extract and expand principal investigator data
-    pis = [pd.json_normalize(data["results"], record_path=["principal_investigators"],
-                             meta=["appl_id", "core_project_num", "project_serial_num", "fiscal_year"]) for data in batches]
-    
-    # Concatenate the extracted data into a DataFrame
-    df = pd.concat(pis)
-
-    # standardize names
-    df["first_name"] = df["first_name"].apply(standardize_name)
-    df["last_name"] = df["last_name"].apply(standardize_name)
-    df["middle_name"] = df["middle_name"].apply(standardize_name)
-    df["full_name"] = df["full_name"].apply(standardize_name)
-    df["name"] = df["last_name"] + " " + df["first_name"].str[:1] + df["middle_name"].str[:1]
-    # create PI name in firstname lastname format to match dbGaP convention
-    #df["grant_pi"] = pis["last_name"] + " " + pis["first_name"]
-    df["appl_id"] = df["appl_id"].astype(str)
-    col_map = {"profile_id": "profileId", "core_project_num": "coreProjectNum", "project_serial_num": "projectSerialNum", "is_contact_pi": "isContactPi", "fiscal_year": "fiscalYear",
-              "name": "name", "full_name": "fullName", "first_name": "firstName", "middle_name": "middleName", "last_name": "lastName"}
+    # Fetch project data in batches of names and concatenate the results
+    investigators = list(dict.fromkeys(investigators))
+    tables = []
+    for names in create_chunks(investigators, batch_size):
+        _, pis = fetch_project_tables(search_principal_investigators_by_names, names, chunk_size,
+                                      pi_project_fields=PI_PROJECT_FIELDS)
+        tables.append(pis)
 
-    return rename_and_reorder_columns(df, col_map)
+    df = pa.concat_tables(tables).to_pandas() if tables else to_table([], PI_FIELDS + PI_PROJECT_FIELDS).to_pandas()
+    df = standardize_pi_names(df)
+    # map each investigator back to the query name that produced the hit
+    df["query_name"] = match_query_names(df, investigators)
 
-    
-def get_organizations(profile_ids, chunk_size=PROJECT_LIMIT):
+    return rename_and_reorder_columns(df, {**PI_COLUMN_MAP, "query_name": "queryName"})
+
+
+def name_tokens(name):
+    """Split a name into lower case tokens after applying the standardize_name rules."""
+    name = standardize_name(name).replace(",", " ")
+    return name.lower().split()
+
+
+def match_query_names(pis, query_names):
+    """
+    Map principal investigators to the query names that match them.
+
+    A query name matches an investigator if each of its tokens matches one of the
+    investigator's first, middle, or last name tokens. Single letter tokens on
+    either side match as initials. Names are compared after applying standardize_name.
+    Query names can be in the "First M Last" or the "Last, First M" (RePORTER full_name) format.
+
+    Args:
+        pis (pandas.DataFrame): Principal investigators with standardized first_name,
+            middle_name, and last_name columns.
+        query_names (list): The names used in the pi_names query.
+
+    Returns:
+        list: The matching query name for each row in pis, or an empty string if no query name matches.
     """
-    Retrieve principal investigator data for projects associated with a list of profile ids.
+    # index the query names by each of their tokens that is not an initial, so "Last, First M" and
+    # "First M Last" queries are both found by the last name (names of only initials by all tokens)
+    queries = {}
+    for query_name in query_names:
+        tokens = name_tokens(query_name)
+        keys = [token for token in tokens if len(token) > 1] or tokens
+        for key in dict.fromkeys(keys):
+            queries.setdefault(key, []).append((query_name, tokens))
+
+    def token_match(token, pi_tokens):
+        for pi_token in pi_tokens:
+            if token == pi_token:
+                return True
+            # single letter tokens match as initials
+            if (len(token) == 1 or len(pi_token) == 1) and token[0] == pi_token[0]:
+                return True
+        return False
+
+    matches = []
+    for first_name, middle_name, last_name in zip(pis["first_name"], pis["middle_name"], pis["last_name"]):
+        pi_tokens = name_tokens(" ".join((first_name, middle_name, last_name)))
+        match = ""
+        for pi_token in pi_tokens:
+            # names of only initials are indexed by their initials
+            candidates = queries.get(pi_token, []) + (queries.get(pi_token[0], []) if len(pi_token) > 1 else [])
+            for query_name, tokens in candidates:
+                if all(token_match(token, pi_tokens) for token in tokens):
+                    match = query_name
+                    break
+            if match:
+                break
+        matches.append(match)
+
+    return matches
+
+
+def get_principal_investigators(core_project_numbers, chunk_size=PROJECT_LIMIT):
+    """
+    Retrieve principal investigator data for projects associated with a list of core project numbers.
 
     This function divides the list of core project numbers into smaller chunks to prevent
     overloading the API. It then fetches project data for each chunk and extracts principal
@@ -392,40 +554,43 @@ def get_organizations(profile_ids, chunk_size=PROJECT_LIMIT):
         >>> core_project_numbers = ["U01AA029316", "R01DC016112"]
         >>> get_principal_investigators(core_project_numbers)
     """
-    # Fetch project data in batches and concatenate the results
-    offset = 0
-    num_records = 1
-    batches = []
-    while offset < num_records:
-        data, num_records = search_profile_ids(profile_ids, chunk_size, offset)
-        batches.append(data)
-        offset += chunk_size
-    
-    # Extract and expand principal investigator data
-    profiles = [pd.json_normalize(data["results"], record_path=["principal_investigators"],
-                             meta=["appl_id", "fiscal_year"]) for data in batches]
-    profile_df = pd.concat(profiles)
-    # only the contact PI has associated organization info
-    profile_df.query("is_contact_pi == True", inplace=True)
+    # Principal investigators are derived from the snapshot shared with get_projects
+    return get_project_snapshot(search_project_numbers, core_project_numbers, chunk_size).principal_investigators()
+
     
-    # keep only the latest fiscal year to get the latest organization info
-    profile_df["appl_id"] = profile_df["appl_id"].astype(str)
-    profile_df["profile_id"] = profile_df["profile_id"].astype(str)
-    profile_df.sort_values("fiscal_year", ascending=False, inplace=True)
-    profile_df.drop_duplicates("profile_id", inplace=True)
+def get_organizations(profile_ids, chunk_size=PROJECT_LIMIT, core_project_numbers=None):
+    """
+    Retrieve the latest organization of principal investigators from their projects.
 
-    # extract and expand organization information
-    projects = [pd.json_normalize(data["results"]) for data in batches]
-    project_df = pd.concat(projects)
-    project_df = project_df[["appl_id", "organization.org_name", "organization.org_city", "organization.org_zipcode", "organization.org_state", 
-                             "organization.org_country", "organization.primary_duns", "organization.primary_uei"]].copy()
-    project_df["appl_id"] = project_df["appl_id"].astype(str)
+    Only the contact PI of a project has associated organization info. For each profile id,
+    the organization of the project with the latest fiscal year is returned.
 
-    # keep only records that match the profile ids
-    orgs = profile_df.merge(project_df, on="appl_id")
-    orgs = orgs[orgs["profile_id"].isin(profile_ids)]
+    By default, all projects of the principal investigators are requested (a search by profile
+    ids), so the organization is the latest one, including projects that are not in the KG. This
+    search is not shared with get_projects and get_principal_investigators. If core_project_numbers
+    is given, the organizations are derived from the project snapshot of these projects instead
+    (see get_project_snapshot), which requires no additional requests and is consistent with the
+    projects and principal investigators, but may return an earlier organization.
 
-    return orgs
+    Args:
+        profile_ids (list): The profile ids (str) of the principal investigators.
+        chunk_size (int, optional): The maximum number of records to include in
+            each API response. Defaults to PROJECT_LIMIT.
+        core_project_numbers (list, optional): Derive the organizations from the project
+            snapshot of these core project numbers. Defaults to None (search by profile ids).
+
+    Returns:
+        pandas.DataFrame: A DataFrame with the principal investigator fields (PI_FIELDS), appl_id,
+            fiscal_year, and the organization fields (ORGANIZATION_FIELDS) of each profile id.
+
+    Example:
+        >>> profile_ids = ["2563052", "7039414"]
+        >>> get_organizations(profile_ids)
+        >>> get_organizations(profile_ids, core_project_numbers=["U01AA029316", "R01DC016112"])
+    """
+    if core_project_numbers is not None:
+        return get_project_snapshot(search_project_numbers, core_project_numbers, chunk_size).organizations(profile_ids)
+    return get_project_snapshot(search_profile_ids, profile_ids, chunk_size).organizations(profile_ids)
 
 
 def author_match_score(target_authors, source_authors, threshold):
@@ -436,50 +601,91 @@ def author_match_score(target_authors, source_authors, threshold):
     if not isinstance(source_authors, list):
         source_authors = [source_authors]
 
-    max_score = 0
-    match_target_author = ""
-    match_source_author = ""
-    for target_author in target_authors:
-        for source_author in source_authors:
-            if (score := jaro_winkler(target_author, source_author, score_cutoff=threshold)) > max_score:
-                max_score = score
-                match_target_author = target_author
-                match_source_author = source_author
- 
+    # score all pairs at once, the first pair with the highest score wins (as in a nested loop over targets and sources)
+    scores = name_matching.score_matrix(target_authors, source_authors, threshold)
+    if scores.size == 0 or scores.max() <= 0:
+        return "", "", 0
+
+    i, j = np.unravel_index(scores.argmax(), scores.shape)
+    return target_authors[i], source_authors[j], float(scores[i, j])
 
-    return match_target_author, match_source_author, max_score
+
+_grants_gov_headers = None
+_grants_gov_headers_lock = threading.Lock()
+
+
+def get_grants_gov_headers():
+    """Return the grants.gov request headers. The random User-Agent is created once, loading its browser database is slow."""
+    global _grants_gov_headers
+    with _grants_gov_headers_lock:
+        if _grants_gov_headers is None:
+            _grants_gov_headers = {"accept": "application/json", "User-Agent": UserAgent().random}
+        return _grants_gov_headers
 
 
 def search_grants_dot_gov(funding_opportunity):
-    POST_URL = "https://apply07.grants.gov/grantsws/rest/opportunities/search"
-    ua = UserAgent()
-    HEADERS = {"accept": "application/json", 'User-Agent': ua.random}
     params = {"oppNum": funding_opportunity, "oppStatuses": "forecasted|posted|closed|archived"}
 
     try:
-        response = requests.post(POST_URL, headers=HEADERS, json=params)
-        response.raise_for_status()
-        data = response.json()
-    except requests.exceptions.HTTPError as error:
-        print(f"ERROR: grants.gov HTTP error: {error} for funding opportunity: {funding_opportunity}")
-    except requests.exceptions.RequestException as error:
-        print(f"ERROR: grants.gov: {error} for funding opportunity: {funding_opportunity}")
+        data = http_utils.post_json(GRANTS_GOV_URL, headers=get_grants_gov_headers(), json=params)
+    except requests.exceptions.RequestException:
+        print(f"ERROR: grants.gov request failed for funding opportunity: {funding_opportunity}")
+        raise
 
     return data["oppHits"], data["hitCount"]
 
 
-def search_funding_opportunities(funding_opportunities):   
-    data = []
-    for funding_opportunity in funding_opportunities:
-        fo_data, num_records = search_grants_dot_gov(funding_opportunity)
-        time.sleep(1)
-        if num_records > 0:
-            data.append(fo_data[0])
+def get_funding_opportunities(funding_opportunities, max_workers=http_utils.MAX_WORKERS):
+    """
+    Look up funding opportunities on grants.gov.
+
+    The opportunity numbers are deduplicated and looked up concurrently on the shared session.
+    Lookups that fail are reported and skipped.
+
+    Parameters
+    ----------
+    funding_opportunities : list
+        Funding opportunity numbers, e.g., ["RFA-OD-20-021", "RFA-OD-20-022"].
+
+    max_workers : int, optional
+        The maximum number of concurrent requests. Defaults to http_utils.MAX_WORKERS.
 
-    df = pd.DataFrame(data)
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the first grants.gov hit for each opportunity number that was found
+        (number, title, agency, status, open and close dates, ...), the queried number
+        (query), and the NIH guide URL (url, see add_funding_opportunity_url).
+    """
+    numbers = list(dict.fromkeys(number for number in funding_opportunities if isinstance(number, str) and number))
+
+    def search(number):
+        try:
+            hits, num_records = search_grants_dot_gov(number)
+        except requests.exceptions.RequestException:
+            return None
+        return {**hits[0], "query": number} if num_records > 0 else None
+
+    results = []
+    if numbers:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(numbers))) as executor:
+            results = [result for result in executor.map(search, numbers) if result is not None]
+
+    df = pd.DataFrame(results, columns=["id", "number", "title", "agencyCode", "agency", "openDate", "closeDate", "oppStatus",
+                                        "docType", "query"])
+    df = df.astype({"id": "string", "number": "string", "title": "string", "agencyCode": "string", "agency": "string",
+                    "oppStatus": "string", "docType": "string", "query": "string"})
+    df["openDate"] = pd.to_datetime(df["openDate"], format="%m/%d/%Y", errors="coerce")
+    df["closeDate"] = pd.to_datetime(df["closeDate"], format="%m/%d/%Y", errors="coerce")
+    df["url"] = df["number"].fillna("").map(add_funding_opportunity_url).astype("string")
     return df
 
 
+def search_funding_opportunities(funding_opportunities):
+    """Look up funding opportunities on grants.gov (see get_funding_opportunities)."""
+    return get_funding_opportunities(funding_opportunities)
+
+
 def add_funding_opportunity_url(id):
     """Add funding opportunity URL"""
     if id.startswith("RFA"):
@@ -488,3 +694,7 @@ def add_funding_opportunity_url(id):
         return "https://grants.nih.gov/grants/guide/pa-files/" + id + ".html"
 
     return ""
+
+
+profiling.instrument(__name__, exclude=["extract_project_serial_num", "standardize_name", "add_prefix", "remove_prefix", "create_chunks", "get_field",
+                                        "name_tokens", "author_match_score", "get_grants_gov_headers", "add_funding_opportunity_url"])
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Precomputed graph metrics for the radx-kg node tables.
+
+The metrics are computed from the relationship tables (working copies, see kg_io) with sparse
+matrix operations and saved as property sidecars of the node labels (see kg_io.save_properties),
+which are merged into the node tables on export, so dashboards can read them instead of running
+graph queries against Neo4j:
+
+    Publication: citationCount, pageRank (citation graph)
+    Researcher:  publicationCount, coauthorCount, coauthorCentrality (co-authorship graph)
+    Grant:       publicationCount, citationCount, pageRank (publications of the grant investigators)
+
+Usage (from the notebooks/processing directory):
+    python graph_analytics.py
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+import kg_io
+
+# damping factor of the PageRank random walk
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+# convergence threshold of the power iterations (L1 norm of the change)
+TOLERANCE = 1e-10
+PUBLICATION_METRICS = ["citationCount", "pageRank"]
+RESEARCHER_METRICS = ["publicationCount", "coauthorCount", "coauthorCentrality"]
+GRANT_METRICS = ["publicationCount", "citationCount", "pageRank"]
+
+
+def read_ids(names, working_path=kg_io.WORKING_PATH):
+    """Return the unique node ids in the node tables."""
+    ids = [kg_io.load(name, columns=["id"], working_path=working_path)["id"] for name in names]
+    return pd.Index(pd.concat(ids).replace("", None).dropna().unique()) if ids else pd.Index([], dtype=str)
+
+
+def read_edges(names, working_path=kg_io.WORKING_PATH):
+    """Return the unique from, to pairs in the relationship tables."""
+    edges = [kg_io.load(name, columns=["from", "to"], working_path=working_path) for name in names]
+    if not edges:
+        return pd.DataFrame(columns=["from", "to"], dtype=str)
+    return pd.concat(edges).replace("", None).dropna().drop_duplicates().reset_index(drop=True)
+
+
+def incidence_matrix(edges, row_ids, column_ids):
+    """
+    Return a binary sparse matrix with a 1 for each edge from a row id to a column id.
+
+    Edges with an id that is not a node are ignored.
+    """
+    rows = row_ids.get_indexer(edges["from"])
+    columns = column_ids.get_indexer(edges["to"])
+    valid = (rows >= 0) & (columns >= 0)
+    matrix = sparse.csr_matrix((np.ones(valid.sum()), (rows[valid], columns[valid])), shape=(len(row_ids), len(column_ids)))
+    # duplicate edges are summed by csr_matrix
+    matrix.data[:] = 1
+    return matrix
+
+
+def pagerank(adjacency, damping=DAMPING, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    Compute the PageRank of the nodes of a directed graph by power iteration.
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse matrix
+        Binary matrix with a 1 for each edge from a row node to a column node (e.g., citing -> cited).
+
+    Returns
+    -------
+    numpy.ndarray
+        PageRank of each node, summing to 1. The rank of nodes without outgoing edges is
+        distributed evenly over all nodes.
+    """
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty(0)
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    # transition matrix from the rows of the adjacency matrix, transposed for the update
+    transition = sparse.diags(1 / np.where(dangling, 1, out_degree)) @ adjacency
+    transition_t = transition.T.tocsr()
+
+    rank = np.full(n, 1 / n)
+    for _ in range(max_iterations):
+        updated = damping * (transition_t @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+        converged = np.abs(updated - rank).sum() < tolerance
+        rank = updated
+        if converged:
+            break
+    return rank
+
+
+def eigenvector_centrality(adjacency, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    Compute the eigenvector centrality of the nodes of an undirected graph by power iteration.
+
+    The iteration uses the adjacency matrix plus the identity, which has the same leading
+    eigenvector and converges on bipartite graphs. Centralities are scaled to a maximum of 1.
+
+    The leading eigenvector of a disconnected graph is nonzero only on the principal component
+    (the component with the largest eigenvalue, usually the largest one). The power iteration
+    leaves small residual values on the other components, so the principal component is
+    determined from a first iteration over the whole graph, the centrality is computed on that
+    component only, and all other nodes (including isolated nodes) get exactly 0. Centralities
+    below the tolerance are within the error of the iteration and are also set to 0.
+    """
+    n = adjacency.shape[0]
+    if n == 0 or adjacency.nnz == 0:
+        return np.zeros(n)
+    centrality = power_iteration(adjacency, max_iterations, tolerance)
+    _, labels = csgraph.connected_components(adjacency, directed=False)
+    component = np.flatnonzero(labels == labels[np.argmax(centrality)])
+
+    centrality = np.zeros(n)
+    centrality[component] = power_iteration(adjacency[component][:, component], max_iterations, tolerance)
+    centrality /= centrality.max()
+    centrality[centrality < tolerance] = 0
+    return centrality
+
+
+def power_iteration(adjacency, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """Return the leading eigenvector of the adjacency matrix plus the identity, normalized to a sum of 1."""
+    n = adjacency.shape[0]
+    centrality = np.full(n, 1 / n)
+    for _ in range(max_iterations):
+        updated = adjacency @ centrality + centrality
+        updated /= np.abs(updated).sum()
+        converged = np.abs(updated - centrality).sum() < tolerance
+        centrality = updated
+        if converged:
+            break
+    return centrality
+
+
+def publication_metrics(publication_ids, citations):
+    """
+    Compute the citation metrics of publications.
+
+    Parameters
+    ----------
+    publication_ids : pd.Index
+        The publication node ids.
+
+    citations : pd.DataFrame
+        Publication-CITES-Publication edges (from cites to).
+
+    Returns
+    -------
+    pd.DataFrame
+        citationCount (number of citing publications in the KG) and pageRank, indexed by publication id.
+    """
+    adjacency = incidence_matrix(citations, publication_ids, publication_ids)
+    return pd.DataFrame({"citationCount": np.asarray(adjacency.sum(axis=0)).ravel().astype(int),
+                         "pageRank": pagerank(adjacency)}, index=publication_ids)
+
+
+def researcher_metrics(researcher_ids, authorship):
+    """
+    Compute the co-authorship metrics of researchers.
+
+    Parameters
+    ----------
+    researcher_ids : pd.Index
+        The researcher node ids.
+
+    authorship : sparse matrix
+        Researcher x publication incidence matrix (Researcher-AUTHORED-Publication).
+
+    Returns
+    -------
+    pd.DataFrame
+        publicationCount, coauthorCount (number of distinct co-authors), and coauthorCentrality
+        (eigenvector centrality in the co-authorship graph), indexed by researcher id.
+    """
+    coauthors = (authorship @ authorship.T).tocsr()
+    coauthors.setdiag(0)
+    coauthors.eliminate_zeros()
+    coauthors.data[:] = 1
+    return pd.DataFrame({"publicationCount": np.asarray(authorship.sum(axis=1)).ravel().astype(int),
+                         "coauthorCount": np.asarray(coauthors.sum(axis=1)).ravel().astype(int),
+                         "coauthorCentrality": eigenvector_centrality(coauthors)}, index=researcher_ids)
+
+
+def grant_metrics(grant_ids, investigators, authorship, publications):
+    """
+    Compute the publication metrics of grants from the publications of their investigators.
+
+    Parameters
+    ----------
+    grant_ids : pd.Index
+        The grant node ids.
+
+    investigators : sparse matrix
+        Grant x researcher incidence matrix (Researcher-IS_INVESTIGATOR_OF-Grant).
+
+    authorship : sparse matrix
+        Researcher x publication incidence matrix (Researcher-AUTHORED-Publication).
+
+    publications : pd.DataFrame
+        Publication metrics (see publication_metrics) in the column order of authorship.
+
+    Returns
+    -------
+    pd.DataFrame
+        publicationCount, citationCount, and pageRank (sum over the distinct publications), indexed by grant id.
+    """
+    grant_publications = (investigators @ authorship).tocsr()
+    grant_publications.data[:] = 1
+    return pd.DataFrame({"publicationCount": np.asarray(grant_publications.sum(axis=1)).ravel().astype(int),
+                         "citationCount": (grant_publications @ publications["citationCount"].to_numpy()).astype(int),
+                         "pageRank": grant_publications @ publications["pageRank"].to_numpy()}, index=grant_ids)
+
+
+def round_metrics(metrics):
+    """Round the float metrics to 6 significant digits, which keeps the exported CSV files compact."""
+    rounded = metrics.copy()
+    for column in metrics.columns:
+        if pd.api.types.is_float_dtype(metrics[column]):
+            rounded[column] = [float(f"{value:.6g}") for value in metrics[column]]
+    return rounded
+
+
+def save_metrics(label, metrics, working_path=kg_io.WORKING_PATH):
+    """Save the metrics of the nodes with a label as its property sidecar (see kg_io.save_properties)."""
+    kg_io.save_properties(round_metrics(metrics).rename_axis("id").reset_index(), label, working_path)
+
+
+def compute_graph_analytics(working_path=kg_io.WORKING_PATH):
+    """
+    Compute the graph metrics and save them as property sidecars of the Publication, Researcher, and Grant nodes.
+
+    The node tables are not modified, they only get the metrics when they are exported (see kg_io.export_csv).
+
+    Returns
+    -------
+    dict
+        The publication, researcher, and grant metrics as DataFrames indexed by node id.
+    """
+    def names(prefix, kind="nodes"):
+        return kg_io.table_names(working_path, kind, prefix)
+
+    publication_ids = read_ids(names("Publication"), working_path)
+    researcher_ids = read_ids(names("Researcher"), working_path)
+    grant_ids = read_ids(names("Grant"), working_path)
+
+    citations = read_edges(names("Publication-CITES-Publication", "relationships"), working_path)
+    authorship = incidence_matrix(read_edges(names("Researcher-AUTHORED-Publication", "relationships"), working_path),
+                                  researcher_ids, publication_ids)
+    investigators = incidence_matrix(read_edges(names("Researcher-IS_INVESTIGATOR_OF-Grant", "relationships"), working_path),
+                                     researcher_ids, grant_ids).T.tocsr()
+
+    publications = publication_metrics(publication_ids, citations)
+    researchers = researcher_metrics(researcher_ids, authorship)
+    grants = grant_metrics(grant_ids, investigators, authorship, publications)
+
+    for label, metrics in [("Publication", publications), ("Researcher", researchers), ("Grant", grants)]:
+        save_metrics(label, metrics, working_path)
+
+    return {"Publication": publications, "Researcher": researchers, "Grant": grants}
+
+
+def main():
+    metrics = compute_graph_analytics()
+    for label, df in metrics.items():
+        print(f"{label}: {len(df)} nodes, {', '.join(df.columns)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# coding: utf-8
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import response_cache
+
+# maximum number of concurrent requests issued by the fetch engine
+MAX_WORKERS = 4
+# maximum number of concurrent requests per host (other hosts: MAX_WORKERS)
+HOST_CONCURRENCY = {"apply07.grants.gov": 2}
+# timeout in seconds for connecting to and reading from a server
+TIMEOUT = 60
+# retries of connection errors, timeouts, and the HTTP status codes below
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# base delay in seconds of the exponential backoff, doubled for each retry up to MAX_BACKOFF
+BACKOFF_FACTOR = 1.0
+MAX_BACKOFF = 60
+# upper bound in seconds of a delay requested by a Retry-After header (guards against bogus dates)
+MAX_RETRY_AFTER = 3600
+# a host is skipped for CIRCUIT_RESET_TIMEOUT seconds after CIRCUIT_FAILURE_THRESHOLD consecutive failed requests
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+
+_session = None
+_session_lock = threading.Lock()
+_limiters = {}
+_limiters_lock = threading.Lock()
+_hosts = {}
+_hosts_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised when a request is skipped because the circuit breaker of the host is open."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are refilled continuously at `rate` tokens per second up to `capacity`.
+    Each call to `acquire` takes one token and blocks until the token is available.
+    A caller that has to wait reserves its token first, so concurrent callers are
+    served in the order they arrive.
+
+    Parameters
+    ----------
+    rate : float
+        Number of tokens (requests) added per second.
+
+    capacity : int, optional
+        Maximum number of tokens that can accumulate (burst size). Defaults to 1.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Delay all subsequent tokens by the given number of seconds (e.g., after an HTTP 429 response)."""
+        with self._lock:
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for a host.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests are
+    rejected for `reset_timeout` seconds. Then a single trial request is let through:
+    if it succeeds the circuit closes, otherwise it opens again.
+    """
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent."""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if time.monotonic() - self._opened >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened = time.monotonic()
+            self._trial = False
+
+
+def get_host(host):
+    """Return the circuit breaker and the concurrency limiter (semaphore) of a host."""
+    with _hosts_lock:
+        if host not in _hosts:
+            _hosts[host] = (CircuitBreaker(), threading.BoundedSemaphore(HOST_CONCURRENCY.get(host, MAX_WORKERS)))
+        return _hosts[host]
+
+
+def get_rate_limiter(name, rate, capacity=1):
+    """Return the shared rate limiter registered under `name`, creating it on first use."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = TokenBucket(rate, capacity)
+        return _limiters[name]
+
+
+def get_session():
+    """Return a pooled requests session shared by all API clients."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def record(endpoint, **counts):
+    """Add counts (requests, retries, throttled, failures, rejected, cached, bytes, latency, wait) to the statistics of an endpoint."""
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected": 0,
+                                             "cached": 0, "bytes": 0, "latency": 0.0, "max_latency": 0.0, "wait": 0.0})
+        for name, count in counts.items():
+            stats[name] += count
+        if "latency" in counts:
+            stats["max_latency"] = max(stats["max_latency"], counts["latency"])
+
+
+def get_stats():
+    """
+    Return the request statistics by endpoint (host and path).
+
+    Counts: requests sent, retries, throttled (HTTP 429) responses, failed requests, requests
+    rejected by an open circuit breaker, responses served from the response cache, and bytes
+    received. Times: the mean and max latency and the total time spent waiting for the rate
+    limiter and between retries (wait) in seconds.
+    """
+    with _stats_lock:
+        return {endpoint: {**stats, "latency": stats["latency"] / stats["requests"] if stats["requests"] else 0.0}
+                for endpoint, stats in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def retry_delay(attempt, retry_after=None):
+    """
+    Return the delay in seconds before a retry.
+
+    Exponential backoff with full jitter up to MAX_BACKOFF, at least the delay requested by
+    a Retry-After header (seconds or HTTP date) up to MAX_RETRY_AFTER. The requested delay is
+    not limited by MAX_BACKOFF: retrying earlier only gets more 429 or 503 responses.
+    """
+    delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF_FACTOR * 2**attempt))
+    if retry_after:
+        try:
+            requested = float(retry_after)
+        except ValueError:
+            try:
+                requested = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                requested = 0
+        delay = max(delay, min(requested, MAX_RETRY_AFTER))
+    return delay
+
+
+def request_json(method, url, limiter=None, retries=MAX_RETRIES, **kwargs):
+    """
+    Send a request on the shared session and return the decoded JSON response.
+
+    Connection errors, timeouts, and responses with a status code in RETRY_STATUS_CODES
+    are retried with exponential backoff (see retry_delay). An HTTP 429 response also
+    pauses the rate limiter, so other threads slow down too. The number of concurrent
+    requests per host is limited (HOST_CONCURRENCY), and a circuit breaker stops sending
+    requests to a host that keeps failing.
+
+    Parameters
+    ----------
+    method : str
+        The HTTP method.
+
+    url : str
+        The endpoint URL.
+
+    limiter : TokenBucket, optional
+        Rate limiter to acquire a token from before each attempt.
+
+    retries : int, optional
+        The maximum number of retries. Defaults to MAX_RETRIES.
+
+    **kwargs
+        Additional arguments passed to `requests.Session.request` (headers, params, json, ...).
+
+    Returns
+    -------
+    dict or list
+        The decoded JSON response.
+
+    Raises
+    ------
+    CircuitOpenError
+        If the circuit breaker of the host is open.
+
+    requests.exceptions.RequestException
+        If the request failed after all retries.
+    """
+    parsed = urlparse(url)
+    host = parsed.netloc
+    endpoint = host + parsed.path
+    breaker, semaphore = get_host(host)
+    kwargs.setdefault("timeout", TIMEOUT)
+
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            record(endpoint, rejected=1)
+            print(f"ERROR: {host}: too many failed requests, skipping requests for {breaker.reset_timeout} seconds")
+            raise CircuitOpenError(f"Circuit breaker open for {host}")
+
+        if limiter is not None:
+            start = time.monotonic()
+            limiter.acquire()
+            record(endpoint, wait=time.monotonic() - start)
+
+        retry_after = None
+        start = time.monotonic()
+        try:
+            with semaphore:
+                response = get_session().request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+            record(endpoint, requests=1, failures=1, latency=time.monotonic() - start)
+            breaker.record_failure()
+            if attempt == retries:
+                print(f"ERROR: {host}: {error}")
+                raise
+        else:
+            record(endpoint, requests=1, bytes=len(response.content), latency=time.monotonic() - start)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                break
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429:
+                # the server is healthy but asks us to slow down
+                record(endpoint, throttled=1)
+            else:
+                record(endpoint, failures=1)
+                breaker.record_failure()
+
+        delay = retry_delay(attempt, retry_after)
+        if retry_after and limiter is not None:
+            limiter.pause(delay)
+        record(endpoint, retries=1, wait=delay)
+        time.sleep(delay)
+
+    try:
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.HTTPError as error:
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        record(endpoint, failures=1)
+        print(f"ERROR: {host} HTTP error: {error}")
+        raise
+    except ValueError as error:
+        record(endpoint, failures=1)
+        print(f"ERROR: {host}: invalid JSON response: {error}")
+        raise
+
+    breaker.record_success()
+    return data
+
+
+def post_json(url, limiter=None, cache=True, **kwargs):
+    """
+    Send a POST request on the shared session and return the decoded JSON response.
+
+    Responses are served from and stored in the shared response cache (see response_cache).
+    Requests that go to the network are sent with request_json, which throttles, retries,
+    and records statistics.
+
+    Parameters
+    ----------
+    url : str
+        The endpoint URL.
+
+    limiter : TokenBucket, optional
+        Rate limiter to acquire a token from before each attempt.
+
+    cache : bool, optional
+        If True, use the response cache. Defaults to True.
+
+    **kwargs
+        Additional arguments passed to request_json (retries) and `requests.Session.post` (headers, params, json, ...).
+
+    Returns
+    -------
+    dict or list
+        The decoded JSON response.
+
+    Raises
+    ------
+    response_cache.OfflineCacheMiss
+        If the cache is in offline mode and the response is not cached.
+    """
+    responses = response_cache.get_cache() if cache else None
+    if responses is not None:
+        found, data = responses.get(url, params=kwargs.get("params"), body=kwargs.get("json"))
+        if found:
+            parsed = urlparse(url)
+            record(parsed.netloc + parsed.path, cached=1)
+            return data
+        if responses.offline:
+            raise response_cache.OfflineCacheMiss(f"No cached response for {url} in offline mode")
+
+    data = request_json("POST", url, limiter=limiter, **kwargs)
+
+    if responses is not None:
+        responses.put(url, data, params=kwargs.get("params"), body=kwargs.get("json"))
+    return data
+
+
+def fetch_pages(fetch_page, limit, max_workers=MAX_WORKERS):
+    """
+    Fetch all pages of an offset-based search.
+
+    The first page is fetched to determine the total number of records. The remaining
+    offsets are then requested concurrently. Pages are yielded in offset order, and at
+    most 2 * max_workers pages are requested ahead of the consumer, so memory use does
+    not grow with the number of pages.
+
+    Parameters
+    ----------
+    fetch_page : Callable[[int], Tuple[dict, int]]
+        Function that takes an offset and returns the page data and the total number of records.
+
+    limit : int
+        The number of records per page.
+
+    max_workers : int, optional
+        The maximum number of concurrent requests. Defaults to MAX_WORKERS.
+
+    Yields
+    ------
+    dict
+        The data for each page.
+    """
+    data, num_records = fetch_page(0)
+    yield data
+
+    offsets = range(limit, num_records, limit)
+    if len(offsets) == 0:
+        return
+
+    workers = min(max_workers, len(offsets))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for offset in offsets:
+            pending.append(executor.submit(fetch_page, offset))
+            if len(pending) >= 2 * workers:
+                data, _ = pending.popleft().result()
+                yield data
+        while pending:
+            data, _ = pending.popleft().result()
+            yield data
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Persistent identity index of the researchers across builds.
+
+Researchers are identified by external ids: profileid:<NIH RePORTER profile id>, orcid:<ORCID>,
+and s2authorid:<Semantic Scholar author id>. The store is a union-find over these ids. Ids
+that are known to belong to the same person (e.g., a profile id and the Semantic Scholar
+author id matched to it) are merged into one identity. Its canonical id is the member that
+is a Researcher node id (the id column of a Researcher table), so the ids in the KG stay
+stable. If there is none, or there are several, the canonical id is the member with the
+highest priority in ID_PRIORITY, the same order used for new Researcher node ids.
+
+Name keys ("lastname initials" as created by publication_query.create_name_cols, lower case)
+are indexed to the ids with that name. A name resolves to an identity only if all of its ids
+belong to the same identity, so different people with the same name are never merged.
+
+The store is saved as Parquet files in IDENTITY_PATH and updated by each build. Known
+researchers are then resolved with a dictionary lookup, and only new names need fuzzy
+matching (see IdentityStore.resolve_names and merge_resolved). Names that only differ in their initials are
+often different people (e.g., "smith j" and "smith jd"), so fuzzy matches must have the same
+initials and a score of at least STRICT_NAME_THRESHOLD.
+
+Usage (from the notebooks/processing directory):
+    python identity_store.py import     # add the researchers in the working copies (see kg_io)
+    python identity_store.py stats      # number of ids, identities, and names
+"""
+import argparse
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import kg_io
+import name_matching
+import profiling
+
+# directory of the identity store, override with the RADX_KG_IDENTITIES environment variable
+IDENTITY_PATH = os.getenv("RADX_KG_IDENTITIES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "derived_data", "identities"))
+# id prefixes in the order of preference for the canonical id
+ID_PRIORITY = ["profileid:", "orcid:", "s2authorid:"]
+# prefixes of the id columns whose values may be unprefixed (e.g., authorId from get_author_ids)
+ID_COLUMNS = {"id": None, "profileId": "profileid:", "orcid": "orcid:", "authorId": "s2authorid:"}
+NAME_COLUMNS = ["name", "fullName", "firstName", "middleName", "lastName"]
+RESEARCHER_COLUMNS = ["id"] + NAME_COLUMNS + ["orcid", "profileId"]
+# minimum Jaro-Winkler similarity of a fuzzy match in resolve_names, which also requires the same initials
+STRICT_NAME_THRESHOLD = 0.98
+
+
+def normalize_id(value, prefix=None):
+    """
+    Return an external id with a lower case prefix, or "" for missing values.
+
+    Values without a prefix get the given prefix, e.g., normalize_id("2184494479", "s2authorid:").
+
+    Example:
+        >>> normalize_id("https://orcid.org/0000-0002-0322-4566")
+        'orcid:0000-0002-0322-4566'
+    """
+    if not isinstance(value, str) or value.strip() in ("", "None", "nan"):
+        return ""
+    value = value.strip().replace("https://orcid.org/", "orcid:")
+    head, separator, tail = value.partition(":")
+    if separator and head.lower() + ":" in ID_PRIORITY:
+        return head.lower() + ":" + tail
+    return prefix + value if prefix else value
+
+
+def id_priority(key):
+    """Return the sort key of an id by its prefix (lower is preferred)."""
+    for i, prefix in enumerate(ID_PRIORITY):
+        if key.startswith(prefix):
+            return i, key
+    return len(ID_PRIORITY), key
+
+
+def name_key(name):
+    """Return the lookup key of a name in the "lastname initials" format, e.g., "Vanegas-Gamboa DC" -> "vanegas-gamboa dc"."""
+    return " ".join(name.replace(".", "").split()).lower() if isinstance(name, str) else ""
+
+
+class IdentityStore:
+    """
+    Union-find over the external ids of researchers with a name index.
+
+    Args:
+        path (str): The directory the store is saved to.
+    """
+    def __init__(self, path=IDENTITY_PATH):
+        self.path = path
+        # parent of each id in the union-find forest, roots are their own parent and are the canonical ids
+        self.parent = {}
+        # ids by name key
+        self.names = {}
+        # name columns (NAME_COLUMNS) by id, from the evidence that added the id
+        self.attributes = {}
+        # ids that are Researcher node ids
+        self.node_ids = set()
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __contains__(self, key):
+        return normalize_id(key) in self.parent
+
+    def priority(self, key):
+        """Return the sort key of an id for the choice of the canonical id (lower is preferred)."""
+        return (key not in self.node_ids,) + id_priority(key)
+
+    def find(self, key):
+        """Return the canonical id of a known id."""
+        parent = self.parent
+        while parent[key] != key:
+            # path halving keeps the trees flat
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, a, b):
+        """Merge the identities of two known ids. The root with the higher priority becomes the canonical id."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        root, child = (root_a, root_b) if self.priority(root_a) <= self.priority(root_b) else (root_b, root_a)
+        self.parent[child] = root
+        return root
+
+    def promote(self, key):
+        """Make a known id the canonical id of its identity if it has a higher priority than the current one."""
+        root = self.find(key)
+        if self.priority(key) < self.priority(root):
+            self.parent[root] = key
+            self.parent[key] = key
+
+    def add(self, ids, node=False, **attributes):
+        """
+        Record that ids belong to the same researcher.
+
+        Parameters
+        ----------
+        ids : list
+            External ids (see normalize_id), e.g., ["profileid:11165737", "orcid:0000-0002-0322-4566"].
+            Missing values are ignored.
+
+        node : bool, optional
+            If True, the first id is the Researcher node id of the researcher.
+
+        attributes : str
+            Name columns of the researcher (NAME_COLUMNS). The name ("lastname initials") is
+            indexed as a name key of the first id.
+
+        Returns
+        -------
+        str
+            The canonical id of the researcher, or None if no id was given.
+        """
+        ids = [key for key in (normalize_id(value) for value in ids) if key]
+        if not ids:
+            return None
+        for key in ids:
+            self.parent.setdefault(key, key)
+        if node:
+            self.node_ids.add(ids[0])
+        for key in ids[1:]:
+            self.union(ids[0], key)
+        if node:
+            self.promote(ids[0])
+
+        values = {column: attributes[column] for column in NAME_COLUMNS if isinstance(attributes.get(column), str) and attributes[column]}
+        if values:
+            # later evidence (e.g., a newer build) replaces the names of an id
+            self.attributes.setdefault(ids[0], {}).update(values)
+        if "name" in values:
+            self.names.setdefault(name_key(values["name"]), set()).add(ids[0])
+        return self.find(ids[0])
+
+    def add_researchers(self, df, node=False):
+        """
+        Record the researchers in a DataFrame, e.g., a Researcher node table or id_to_author_id.csv.
+
+        The id columns (ID_COLUMNS) of each row are merged into one identity, and the name
+        columns (NAME_COLUMNS) are recorded. If node is True, the id column contains Researcher
+        node ids.
+
+        Returns
+        -------
+        list
+            The canonical id of each row (None for rows without an id).
+        """
+        id_columns = [column for column in ID_COLUMNS if column in df.columns]
+        name_columns = [column for column in NAME_COLUMNS if column in df.columns]
+        ids = zip(*[[normalize_id(value, ID_COLUMNS[column]) for value in df[column].tolist()] for column in id_columns])
+        names = zip(*[df[column].tolist() for column in name_columns]) if name_columns else ([] for _ in range(len(df)))
+        node = node and "id" in id_columns
+        return [self.add(row_ids, node=node, **dict(zip(name_columns, row_names))) for row_ids, row_names in zip(ids, names)]
+
+    def resolve(self, key):
+        """Return the canonical id of an external id, or None if the id is unknown."""
+        key = normalize_id(key)
+        return self.find(key) if key in self.parent else None
+
+    def resolve_ids(self, keys):
+        """Return the canonical id of each external id (None for unknown ids)."""
+        return [self.resolve(key) for key in keys]
+
+    def resolve_name(self, name):
+        """Return the canonical id of the researcher with a name ("lastname initials"), or None if it is unknown or ambiguous."""
+        roots = {self.find(key) for key in self.names.get(name_key(name), ())}
+        return roots.pop() if len(roots) == 1 else None
+
+    def resolve_names(self, names, threshold=STRICT_NAME_THRESHOLD, fuzzy=True):
+        """
+        Resolve names in the "lastname initials" format to canonical ids.
+
+        Known names are resolved with a dictionary lookup. If fuzzy is True, the remaining names
+        are matched against the known names with the same initials and last name prefix (see
+        name_matching.initials_block_key) and a score >= threshold, and a match resolves if its
+        name is not ambiguous. Fuzzy matches have a score < 1 and should be reviewed.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame with the name, id (None if unresolved), match (the known name key), and
+            score (1 for exact matches) of each name.
+        """
+        names = list(names)
+        ids = [self.resolve_name(name) for name in names]
+        keys = [name_key(name) for name in names]
+        matches = [key if key in self.names else "" for key in keys]
+        scores = [1.0 if match else 0.0 for match in matches]
+
+        new = [i for i, match in enumerate(matches) if not match and keys[i]] if fuzzy else []
+        if new:
+            best = name_matching.match_names([keys[i] for i in new], list(self.names), threshold, name_matching.initials_block_key)
+            for i, source, score in zip(new, best["source"], best["score"]):
+                if source:
+                    ids[i], matches[i], scores[i] = self.resolve_name(source), source, score
+        return pd.DataFrame({"name": names, "id": pd.Series(ids, dtype=object), "match": matches, "score": scores})
+
+    def identities(self):
+        """Return the ids of each identity by canonical id, in priority order."""
+        groups = {}
+        for key in self.parent:
+            groups.setdefault(self.find(key), []).append(key)
+        return {root: sorted(keys, key=self.priority) for root, keys in groups.items()}
+
+    def to_researchers(self, ids):
+        """
+        Return the Researcher nodes of the identities of ids, e.g., for kg_io.save(df, "Researcher_investigators").
+
+        Each identity is exported once with its canonical id. The name columns are taken from
+        the members in priority order (the first non-empty value), orcid and profileId are the
+        ORCID and profile id members. Unknown ids are skipped.
+
+        Note that profileId is empty for researchers without a profile id (Researcher_manually.csv
+        uses the Semantic Scholar id instead).
+        """
+        roots = dict.fromkeys(root for root in self.resolve_ids(ids) if root is not None)
+        groups = self.identities()
+        rows = []
+        for root in roots:
+            members = groups[root]
+            row = {"id": root}
+            for column in NAME_COLUMNS:
+                row[column] = next((self.attributes[key][column] for key in members if column in self.attributes.get(key, {})), "")
+            row["orcid"] = next((key for key in members if key.startswith("orcid:")), "")
+            row["profileId"] = next((key for key in members if key.startswith("profileid:")), "")
+            rows.append(row)
+        return pd.DataFrame(rows, columns=RESEARCHER_COLUMNS, dtype=str)
+
+    def save(self):
+        """Save the store (ids with their canonical id and names, and the name index) as Parquet files."""
+        os.makedirs(self.path, exist_ok=True)
+        keys = list(self.parent)
+        columns = {"id": keys, "canonicalId": [self.find(key) for key in keys]}
+        for column in NAME_COLUMNS:
+            columns[column] = [self.attributes.get(key, {}).get(column) for key in keys]
+        names = [(key, member) for key, members in self.names.items() for member in sorted(members)]
+        schema = pa.schema([(column, pa.string()) for column in columns] + [("node", pa.bool_())])
+        columns["node"] = [key in self.node_ids for key in keys]
+        tables = {"ids": pa.table(columns, schema=schema),
+                  "names": pa.table({"nameKey": [key for key, _ in names], "id": [member for _, member in names]},
+                                    schema=pa.schema([("nameKey", pa.string()), ("id", pa.string())]))}
+        for name, table in tables.items():
+            path = os.path.join(self.path, name + ".parquet")
+            # write to a temporary file first, so an interrupted write doesn't leave a truncated store
+            pq.write_table(table, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=IDENTITY_PATH):
+        """Load a saved store. Returns an empty store if none has been saved in path."""
+        store = cls(path)
+        ids_file = os.path.join(path, "ids.parquet")
+        if not os.path.exists(ids_file):
+            return store
+        ids = pq.read_table(ids_file).to_pydict()
+        # the saved trees are flat, each id points to its canonical id
+        store.parent = dict(zip(ids["id"], ids["canonicalId"]))
+        store.node_ids = {key for key, node in zip(ids["id"], ids["node"]) if node}
+        for i, key in enumerate(ids["id"]):
+            values = {column: ids[column][i] for column in NAME_COLUMNS if ids[column][i]}
+            if values:
+                store.attributes[key] = values
+        names = pq.read_table(os.path.join(path, "names.parquet")).to_pydict()
+        for key, member in zip(names["nameKey"], names["id"]):
+            store.names.setdefault(key, set()).add(member)
+        return store
+
+
+def load(path=IDENTITY_PATH):
+    """Load the identity store (see IdentityStore.load)."""
+    return IdentityStore.load(path)
+
+
+def merge_resolved(left, right, left_ids, right_ids, on=None):
+    """
+    Merge the rows of two DataFrames that resolve to the same researcher, before a fuzzy merge by name.
+
+    Parameters
+    ----------
+    left, right : pd.DataFrame
+        The DataFrames to merge.
+
+    left_ids, right_ids : list
+        The canonical id of each row (None if unresolved), e.g., from IdentityStore.resolve_ids
+        or IdentityStore.resolve_name.
+
+    on : str or list, optional
+        Columns that must be equal as well, e.g., the core project number.
+
+    Returns
+    -------
+    tuple
+        The merged rows with a score of 1, and the rows of left and of right that are not
+        merged, which are left to the fuzzy merge.
+    """
+    on = [on] if isinstance(on, str) else list(on or [])
+    left = left.assign(_identity=list(left_ids), _left=range(len(left)))
+    right = right.assign(_identity=list(right_ids), _right=range(len(right)))
+    merged = left.dropna(subset=["_identity"]).merge(right.dropna(subset=["_identity"]), on=["_identity"] + on)
+    left_rest = left[~left["_left"].isin(merged["_left"])].drop(columns=["_identity", "_left"])
+    right_rest = right[~right["_right"].isin(merged["_right"])].drop(columns=["_identity", "_right"])
+    merged = merged.drop(columns=["_identity", "_left", "_right"])
+    merged["score"] = 1.0
+    return merged, left_rest, right_rest
+
+
+def import_researchers(store, working_path=kg_io.WORKING_PATH):
+    """Add the researchers in the Researcher node tables (working copies) to a store. Returns the table names."""
+    names = kg_io.table_names(working_path, "nodes", "Researcher")
+    for name in names:
+        store.add_researchers(kg_io.load(name, working_path=working_path), node=True)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the persistent identity store of the researchers.")
+    parser.add_argument("command", choices=["import", "stats"], help="import: add the researchers in the working copies, stats: print the size")
+    parser.add_argument("--path", default=IDENTITY_PATH, help="directory of the identity store")
+    parser.add_argument("--working-path", default=kg_io.WORKING_PATH, help="directory with the working copies")
+    args = parser.parse_args()
+
+    store = load(args.path)
+    if args.command == "import":
+        names = import_researchers(store, args.working_path)
+        store.save()
+        print(f"Imported {len(names)} Researcher tables into {args.path}")
+    print(f"{len(store)} ids, {len(store.identities())} identities, {len(store.names)} names")
+
+
+profiling.instrument(__name__, exclude=["main", "normalize_id", "id_priority", "name_key"])
+
+if __name__ == "__main__":
+    main()
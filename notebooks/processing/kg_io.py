@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Typed working copies of the node and relationship tables.
+
+The processing notebooks save and load the KG tables as Parquet files in WORKING_PATH, typed
+with the property types in kg/metadata (int, float, boolean, date, arrays). The Neo4j-ready
+CSV files in kg/data are generated from the working copies in a final export step
+(10_export_kg.ipynb), which also writes the embedding columns from the embedding sidecar files.
+
+Tables are named like their CSV files, e.g., "Researcher_investigators" (nodes) or
+"Researcher-AUTHORED-Publication_other" (relationships).
+
+Node properties computed by a later stage from several tables (e.g., the graph metrics) are saved
+as a property sidecar of the node label (save_properties) instead of updating the node tables of
+other stages in place. They are merged into the node tables of the label on export.
+
+Usage (from the notebooks/processing directory):
+    python kg_io.py import     # create the working copies from the CSV files in kg/data
+    python kg_io.py export     # write the CSV files in kg/data from the working copies
+"""
+import argparse
+import glob
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import embedding_store
+import profiling
+
+KG_PATH = "../kg/data"
+METADATA_PATH = "../kg/metadata"
+WORKING_PATH = "../derived_data/kg"
+# array delimiter of the CSV files (Neo4j bulk import)
+ARRAY_DELIMITER = "|"
+ARROW_TYPES = {
+    "string": pa.string(),
+    "int": pa.int64(),
+    "long": pa.int64(),
+    "float": pa.float64(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+}
+
+
+def table_kind(name):
+    """Return "relationships" for relationship tables (Start-TYPE-End) and "nodes" otherwise."""
+    return "relationships" if name.count("-") == 2 else "nodes"
+
+
+def working_file(name, working_path=WORKING_PATH):
+    """Return the path of the working copy of a table, e.g., ../derived_data/kg/nodes/Grant.parquet."""
+    return os.path.join(working_path, table_kind(name), name + ".parquet")
+
+
+def csv_file(name, kg_path=KG_PATH):
+    """Return the path of the CSV file of a table, e.g., ../kg/data/nodes/Grant.csv."""
+    return os.path.join(kg_path, table_kind(name), name + ".csv")
+
+
+def properties_file(label, working_path=WORKING_PATH):
+    """Return the path of the property sidecar of a node label, e.g., ../derived_data/kg/properties/Grant.parquet."""
+    return os.path.join(working_path, "properties", label + ".parquet")
+
+
+def table_names(working_path=WORKING_PATH, kind=None, prefix=None):
+    """
+    Return the names of the working copies.
+
+    Example:
+        >>> table_names(kind="nodes", prefix="Researcher")
+        ['Researcher_investigators', 'Researcher_manually', 'Researcher_primary_coauthors']
+    """
+    names = []
+    for table_kind_ in [kind] if kind else ["nodes", "relationships"]:
+        for path in sorted(glob.glob(os.path.join(working_path, table_kind_, "*.parquet"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            if prefix is None or name == prefix or name.startswith(prefix + "_"):
+                names.append(name)
+    return names
+
+
+def read_types(name, metadata_path=METADATA_PATH):
+    """Return the property types of a table from its metadata file (an empty dict if there is none)."""
+    if table_kind(name) == "relationships":
+        start, rel_type, end = name.split("-")
+        schema_name = f"{start}-{rel_type}-{end.split('_')[0]}"
+    else:
+        schema_name = name.split("_")[0]
+    metadata_file = os.path.join(metadata_path, table_kind(name), schema_name + ".csv")
+    if not os.path.exists(metadata_file):
+        return {}
+    metadata = pd.read_csv(metadata_file, dtype=str, keep_default_na=False)
+    return dict(zip(metadata["property"], metadata["type"]))
+
+
+def arrow_type(property_type):
+    """Return the Arrow type of a metadata type, e.g., "string[]" -> list<string>. Unknown types are strings."""
+    if property_type.endswith("[]"):
+        return pa.list_(ARROW_TYPES.get(property_type[:-2], pa.string()))
+    return ARROW_TYPES.get(property_type, pa.string())
+
+
+def to_array(values, data_type, column):
+    """
+    Convert a column to an Arrow array of the given type.
+
+    String values are parsed as in the CSV files (e.g., "true", "2023-09-21", "a|b").
+    Empty strings become missing values.
+
+    Raises
+    ------
+    ValueError
+        If a non-empty value cannot be converted.
+    """
+    values = values.astype(object).where(values.notna(), None).replace("", None)
+    missing = values.isna()
+
+    if pa.types.is_list(data_type):
+        items = [value.split(ARRAY_DELIMITER) if isinstance(value, str) else value for value in values]
+        try:
+            return pa.array(items, type=pa.list_(pa.string())).cast(data_type) if pa.types.is_floating(data_type.value_type) \
+                else pa.array(items, type=data_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+            raise ValueError(f"Column {column} is not of type {data_type}: {error}") from None
+
+    if pa.types.is_integer(data_type) or pa.types.is_floating(data_type):
+        converted = pd.to_numeric(values, errors="coerce")
+    elif pa.types.is_boolean(data_type):
+        converted = values.map(lambda value: {"true": True, "false": False}.get(value.lower()) if isinstance(value, str) else value)
+    elif pa.types.is_date(data_type):
+        converted = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce").dt.date
+    else:
+        return pa.array(values.map(lambda value: value if value is None or isinstance(value, str) else str(value)), type=pa.string())
+
+    invalid = converted.isna() & ~missing
+    if invalid.any():
+        raise ValueError(f"Column {column} is not of type {data_type}: {values[invalid].head(3).tolist()}")
+    converted = converted.astype(object).where(~missing, None)
+    if pa.types.is_integer(data_type):
+        converted = converted.map(lambda value: None if value is None else int(value))
+    return pa.array(converted, type=data_type)
+
+
+def to_table(df, name, metadata_path=METADATA_PATH):
+    """
+    Convert a DataFrame to an Arrow table typed with the metadata of a table.
+
+    Columns without a metadata type keep their type if they are numeric, boolean, or lists
+    (e.g., a column loaded from a typed working copy) and are strings otherwise.
+    """
+    types = read_types(name, metadata_path)
+    arrays = []
+    for column in df.columns:
+        values = df[column]
+        if column in types:
+            arrays.append(to_array(values, arrow_type(types[column]), column))
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            arrays.append(pa.Array.from_pandas(values))
+        elif values.map(lambda value: isinstance(value, list)).any():
+            arrays.append(pa.array(values.tolist(), from_pandas=True))
+        else:
+            arrays.append(to_array(values, pa.string(), column))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+
+def save(df, name, working_path=WORKING_PATH, metadata_path=METADATA_PATH):
+    """
+    Save a table as a typed working copy.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The table, with string or typed columns.
+
+    name : str
+        The table name, e.g., "Grant" or "Researcher-IS_INVESTIGATOR_OF-Grant".
+    """
+    path = working_file(name, working_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file first, so an interrupted write doesn't leave a truncated table
+    pq.write_table(to_table(df.reset_index(drop=True), name, metadata_path), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def load(name, columns=None, working_path=WORKING_PATH):
+    """
+    Load the working copy of a table.
+
+    String columns use "" for missing values, like pd.read_csv(..., dtype=str, keep_default_na=False).
+    Numeric and boolean columns use pandas nullable types, and arrays are lists.
+    """
+    table = pq.read_table(working_file(name, working_path), columns=columns)
+    df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get)
+    for field in table.schema:
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            df[field.name] = df[field.name].fillna("")
+        elif pa.types.is_list(field.type):
+            df[field.name] = [None if value is None else list(value) for value in df[field.name]]
+    return df
+
+
+def save_properties(df, label, working_path=WORKING_PATH, metadata_path=METADATA_PATH):
+    """
+    Save computed properties of the nodes with a label as a property sidecar.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The node ids (id column) and one column per property.
+
+    label : str
+        The node label, e.g., "Researcher". The properties are merged into all node tables of the
+        label (e.g., Researcher_investigators and Researcher_manually) when they are exported.
+    """
+    path = properties_file(label, working_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(to_table(df.reset_index(drop=True), label, metadata_path), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def merge_properties(table, name, working_path=WORKING_PATH):
+    """
+    Return a node table (Arrow) with the properties from the property sidecar of its label.
+
+    Existing columns with the same names are replaced. The properties are inserted before the
+    embedding column, which is kept at the end of the table. Nodes without properties get missing values.
+    """
+    path = properties_file(name.split("_")[0], working_path)
+    if table_kind(name) != "nodes" or not os.path.exists(path):
+        return table
+    properties = pq.read_table(path)
+    columns = [column for column in properties.column_names if column != "id"]
+    table = table.drop_columns([column for column in columns if column in table.column_names])
+    position = table.column_names.index(embedding_store.EMBEDDING_COLUMN) \
+        if embedding_store.EMBEDDING_COLUMN in table.column_names else table.num_columns
+    # row of each node in the sidecar (null for nodes without properties)
+    rows = pc.index_in(table.column("id"), value_set=properties.column("id"))
+    for offset, column in enumerate(columns):
+        table = table.add_column(position + offset, properties.schema.field(column), pc.take(properties.column(column), rows))
+    return table
+
+
+def exists(name, working_path=WORKING_PATH):
+    return os.path.exists(working_file(name, working_path))
+
+
+def format_column(column):
+    """Format an Arrow column as CSV strings ("" for missing values)."""
+    data_type = column.type
+    if pa.types.is_list(data_type):
+        return [ARRAY_DELIMITER.join(map(str, value)) if value is not None else "" for value in column.to_pylist()]
+    if pa.types.is_boolean(data_type):
+        return ["" if value is None else str(value).lower() for value in column.to_pylist()]
+    if pa.types.is_floating(data_type):
+        return ["" if value is None else f"{value:.15g}" for value in column.to_pylist()]
+    return ["" if value is None else str(value) for value in column.to_pylist()]
+
+
+def export_csv(name, working_path=WORKING_PATH, kg_path=KG_PATH):
+    """
+    Write the CSV file of a table from its working copy.
+
+    Node tables get the properties from the property sidecar of their label (see merge_properties).
+    If the node file has embedding sidecar files (see embedding_store), the embedding column is
+    written from them.
+    """
+    table = merge_properties(pq.read_table(working_file(name, working_path)), name, working_path)
+    df = pd.DataFrame({field.name: format_column(table.column(field.name)) for field in table.schema}, dtype=object)
+    path = csv_file(name, kg_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path, index=False)
+    if table_kind(name) == "nodes" and embedding_store.has_embeddings(path):
+        embedding_store.export_csv(path)
+    return path
+
+
+def export_all(working_path=WORKING_PATH, kg_path=KG_PATH):
+    """Write the CSV files of all working copies. Returns the paths of the CSV files."""
+    return [export_csv(name, working_path, kg_path) for name in table_names(working_path)]
+
+
+def import_csv(path, name=None, working_path=WORKING_PATH, metadata_path=METADATA_PATH):
+    """Save a CSV file (e.g., a manually curated file in ../data) as a working copy. The name defaults to the file name."""
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    save(pd.read_csv(path, dtype=str, keep_default_na=False), name, working_path, metadata_path)
+    return name
+
+
+def import_all(kg_path=KG_PATH, working_path=WORKING_PATH, metadata_path=METADATA_PATH):
+    """Create the working copies of all CSV files in kg_path. Returns the table names."""
+    paths = sorted(glob.glob(os.path.join(kg_path, "nodes", "*.csv")) + glob.glob(os.path.join(kg_path, "relationships", "*.csv")))
+    return [import_csv(path, working_path=working_path, metadata_path=metadata_path) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between the typed working copies and the CSV files of the KG.")
+    parser.add_argument("command", choices=["import", "export"], help="import: CSV -> working copies, export: working copies -> CSV")
+    parser.add_argument("--kg-path", default=KG_PATH, help="directory with the nodes and relationships CSV files")
+    parser.add_argument("--working-path", default=WORKING_PATH, help="directory with the working copies")
+    parser.add_argument("--metadata-path", default=METADATA_PATH, help="directory with the metadata files")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        names = import_all(args.kg_path, args.working_path, args.metadata_path)
+        print(f"Imported {len(names)} tables into {args.working_path}")
+    else:
+        paths = export_all(args.working_path, args.kg_path)
+        print(f"Exported {len(paths)} tables to {args.kg_path}")
+
+
+profiling.instrument(__name__, exclude=["main", "table_kind", "working_file", "csv_file", "table_names", "read_types", "arrow_type",
+                                        "to_array", "exists", "format_column", "properties_file"])
+
+if __name__ == "__main__":
+    main()
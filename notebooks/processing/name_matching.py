@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Blocked, batched Jaro-Winkler matching of researcher names.
+
+Names are only compared within blocks (e.g., the same last name prefix and first initial), and
+each block is scored as one matrix with rapidfuzz (match_pairs, match_names). The matchers are
+used by grant_query, publication_query, and identity_store.
+
+The fuzzy_merge calls in the processing notebooks use the utils module of the notebook
+environment, which is not part of this repository, and are not routed through this module.
+"""
+import sys
+import numpy as np
+import pandas as pd
+from rapidfuzz import process
+from rapidfuzz.distance import JaroWinkler
+
+# number of leading characters of the last name used as blocking key
+BLOCK_PREFIX_LENGTH = 2
+
+
+def name_block_key(name):
+    """
+    Return the blocking key for a name in the "lastname initials" format created by create_name_cols.
+
+    The key consists of the first characters of the last name and the first initial,
+    e.g., Vanegas-Gamboa DC -> "va d". Only names with the same key are compared.
+    """
+    last_name, _, initials = name.strip().rpartition(" ")
+    if not last_name:
+        last_name, initials = initials, ""
+    return last_name[:BLOCK_PREFIX_LENGTH].lower() + " " + initials[:1].lower()
+
+
+def initials_block_key(name):
+    """
+    Return a blocking key for a name in the "lastname initials" format that requires all initials to agree.
+
+    The key consists of the first characters of the last name and all initials,
+    e.g., Vanegas-Gamboa DC -> "va dc", so "Smith J" and "Smith JD" are never compared.
+    """
+    last_name, _, initials = name.strip().rpartition(" ")
+    if not last_name:
+        last_name, initials = initials, ""
+    return last_name[:BLOCK_PREFIX_LENGTH].lower() + " " + initials.lower()
+
+
+def prefix_block_key(name):
+    """Return the first characters of a name as blocking key (e.g., the last name prefix for "lastname initials")."""
+    return name.strip()[:BLOCK_PREFIX_LENGTH].lower()
+
+
+def score_matrix(targets, sources, threshold=0.0):
+    """
+    Calculate the Jaro-Winkler similarity of all pairs of target and source names.
+
+    Scores below the threshold are set to 0, as in Levenshtein.jaro_winkler with a score_cutoff.
+
+    Returns
+    -------
+    numpy.ndarray
+        Matrix of shape (len(targets), len(sources)) with the similarity scores.
+    """
+    return process.cdist(targets, sources, scorer=JaroWinkler.similarity, score_cutoff=threshold, dtype=np.float64)
+
+
+def get_blocks(targets, sources, block_key):
+    """Yield the target and source indices for each blocking key that occurs in both lists."""
+    if block_key is None:
+        yield list(range(len(targets))), list(range(len(sources)))
+        return
+
+    source_blocks = {}
+    for j, source in enumerate(sources):
+        source_blocks.setdefault(block_key(source), []).append(j)
+
+    target_blocks = {}
+    for i, target in enumerate(targets):
+        target_blocks.setdefault(block_key(target), []).append(i)
+
+    for key, target_indices in target_blocks.items():
+        if key in source_blocks:
+            yield target_indices, source_blocks[key]
+
+
+def match_pairs(targets, sources, threshold, block_key=name_block_key):
+    """
+    Find all pairs of target and source names with a similarity score >= threshold.
+
+    Parameters
+    ----------
+    targets : list
+        Names to be matched.
+
+    sources : list
+        Names to match against.
+
+    threshold : float
+        Minimum Jaro-Winkler similarity (0-1).
+
+    block_key : function, optional
+        Function that returns the blocking key of a name. Only names with the same key are
+        compared. Defaults to name_block_key. Use None to compare all pairs.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the target_index, source_index, target, source, and score of each pair.
+    """
+    targets = list(targets)
+    sources = list(sources)
+    target_indices = []
+    source_indices = []
+    scores = []
+    for block_targets, block_sources in get_blocks(targets, sources, block_key):
+        matrix = score_matrix([targets[i] for i in block_targets], [sources[j] for j in block_sources], threshold)
+        rows, cols = np.nonzero(matrix)
+        target_indices.append(np.asarray(block_targets)[rows])
+        source_indices.append(np.asarray(block_sources)[cols])
+        scores.append(matrix[rows, cols])
+
+    target_index = np.concatenate(target_indices) if target_indices else np.array([], dtype=int)
+    source_index = np.concatenate(source_indices) if source_indices else np.array([], dtype=int)
+    pairs = pd.DataFrame({"target_index": target_index, "source_index": source_index,
+                          "target": [targets[i] for i in target_index], "source": [sources[j] for j in source_index],
+                          "score": np.concatenate(scores) if scores else np.array([])})
+    return pairs.sort_values(["target_index", "source_index"], ignore_index=True)
+
+
+def match_names(targets, sources, threshold, block_key=name_block_key):
+    """
+    Find the best matching source name for each target name.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with one (target, source, score) row per target. Targets without a
+        match with a score >= threshold have an empty source and a score of 0.
+    """
+    targets = list(targets)
+    pairs = match_pairs(targets, sources, threshold, block_key)
+    # keep the first pair with the highest score for each target
+    pairs = pairs.sort_values(["target_index", "score"], ascending=[True, False], kind="stable")
+    pairs.drop_duplicates("target_index", inplace=True)
+
+    best = pd.DataFrame({"target": targets, "source": "", "score": 0.0})
+    best.loc[pairs["target_index"].to_numpy(), "source"] = pairs["source"].to_numpy()
+    best.loc[pairs["target_index"].to_numpy(), "score"] = pairs["score"].to_numpy()
+    return best
+
+
+class NameTokens:
+    """
+    Interned table of the name variants of authors.
+
+    Each distinct variant is stored once in tokens, and the variants of author i are
+    tokens[codes[offsets[i]:offsets[i + 1]]]. Matching scores each distinct variant once,
+    however many authors (or papers of the same author) share it.
+
+    Args:
+        variants (iterable): The name variants of each author, e.g., [["Hua Xu"], ["Guo-Qiang Zhang", "Guoqiang Zhang"]].
+    """
+    def __init__(self, variants):
+        index = {}
+        codes = []
+        offsets = [0]
+        for author_variants in variants:
+            codes.extend(index.setdefault(sys.intern(variant), len(index)) for variant in author_variants)
+            offsets.append(len(codes))
+        self.tokens = list(index)
+        self.codes = np.array(codes, dtype=np.int32)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_keys(cls, keys, separator=","):
+        """Create the table from match keys with the variants of each author separated by separator (e.g., "Hua Xu,Xu H")."""
+        return cls(key.split(separator) if key else [] for key in keys)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def variants(self, i):
+        """Return the name variants of author i."""
+        return [self.tokens[code] for code in self.codes[self.offsets[i]:self.offsets[i + 1]]]
+
+    def match(self, targets, threshold, block_key=None):
+        """
+        Find the best matching author for each target name, using all name variants of the authors.
+
+        Parameters
+        ----------
+        targets : list
+            Names to be matched.
+
+        threshold : float
+            Minimum Jaro-Winkler similarity (0-1).
+
+        block_key : function, optional
+            Function that returns the blocking key of a name (see match_pairs). Defaults to None
+            (compare all pairs), since the variants are not in the "lastname initials" format.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame with one (target, author, variant, score) row per target, where author is the
+            index of the first author with the best matching variant. Targets without a match
+            with a score >= threshold have an author of -1, an empty variant, and a score of 0.
+        """
+        targets = list(targets)
+        pairs = match_pairs(targets, self.tokens, threshold, block_key)
+        # authors of each token, in author order
+        owners = pd.DataFrame({"source_index": self.codes,
+                               "author": np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))})
+        pairs = pairs.merge(owners, on="source_index")
+        pairs = pairs.sort_values(["target_index", "score", "author"], ascending=[True, False, True], kind="stable")
+        pairs.drop_duplicates("target_index", inplace=True)
+
+        best = pd.DataFrame({"target": targets, "author": -1, "variant": "", "score": 0.0})
+        best.loc[pairs["target_index"].to_numpy(), "author"] = pairs["author"].to_numpy()
+        best.loc[pairs["target_index"].to_numpy(), "variant"] = pairs["source"].to_numpy()
+        best.loc[pairs["target_index"].to_numpy(), "score"] = pairs["score"].to_numpy()
+        return best
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Profiling of the processing stages and of the query and I/O functions they call.
+
+For each stage (notebook) and each instrumented function, a profile records:
+
+    calls        number of calls
+    wall         wall time in seconds
+    cpu          CPU time of the process in seconds (all threads)
+    http         time spent in HTTP requests, waiting for rate limiters, and between retries
+    requests     HTTP requests sent (cached: responses served from the response cache)
+    bytes        bytes received
+    rows_in      rows of the DataFrame, list, and table arguments
+    rows_out     rows of the returned DataFrames, lists, and tables
+    peak_memory  peak memory in MB (stage: peak RSS of the kernel, functions: peak traced
+                 Python allocations, only if memory tracing is enabled)
+
+Function times are inclusive (they contain the time of the instrumented functions they call).
+HTTP counts are process-wide, so a function that runs concurrently with other requests is
+also charged for them.
+
+Usage (from the notebooks/processing directory):
+    python build.py --profile                           # profile a build, see build.py
+    python profiling.py report <run_path>               # write report.json and report.html of a run
+    python profiling.py compare <base.json> <new.json>  # compare two run reports
+"""
+import argparse
+import functools
+import html
+import inspect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import pandas as pd
+import pyarrow as pa
+import http_utils
+
+# directory of the profiles, override with the RADX_KG_PROFILES environment variable
+PROFILE_PATH = os.getenv("RADX_KG_PROFILES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "derived_data", "profiles"))
+METRICS = ["calls", "wall", "cpu", "http", "requests", "cached", "bytes", "rows_in", "rows_out", "peak_memory"]
+# metrics compared across runs and the ratio (new / base) reported as a regression
+COMPARED_METRICS = ["wall", "cpu", "http", "requests", "bytes", "peak_memory"]
+REGRESSION_THRESHOLD = 1.2
+# changes of metrics below these values are not reported as regressions (e.g., a stage that takes 0.1 s instead of 0.05 s)
+MIN_VALUES = {"wall": 1.0, "cpu": 1.0, "http": 1.0, "requests": 10, "bytes": 1024**2, "peak_memory": 10.0}
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+class Profiler:
+    """
+    Collects the profiles of the instrumented functions of a stage.
+
+    Args:
+        stage (str): The stage name.
+        path (str): The directory the stage profile is written to.
+        trace_memory (bool): If True, trace the peak memory of function calls with tracemalloc,
+            which slows down code that allocates many objects.
+    """
+    def __init__(self, stage, path, trace_memory=False):
+        self.stage = stage
+        self.path = path
+        self.trace_memory = trace_memory
+        self.functions = {}
+        # peak traced memory of the calls in progress
+        self._active = []
+        self._lock = threading.Lock()
+        self._start = snapshot()
+
+    def begin(self):
+        call = {"peak": 0, **snapshot()}
+        if self.trace_memory:
+            with self._lock:
+                self._update_peaks()
+                self._active.append(call)
+        return call
+
+    def end(self, name, call, rows_in, rows_out):
+        with self._lock:
+            if self.trace_memory:
+                self._update_peaks()
+                self._active.remove(call)
+            profile = self.functions.setdefault(name, dict.fromkeys(METRICS, 0))
+            profile["calls"] += 1
+            for metric, value in difference(call, snapshot()).items():
+                profile[metric] += value
+            profile["rows_in"] += rows_in
+            profile["rows_out"] += rows_out
+            profile["peak_memory"] = max(profile["peak_memory"], call["peak"] / 1024**2)
+
+    def _update_peaks(self):
+        # the traced peak is reset at the start and end of each call, so it covers the time since the last event
+        _, peak = tracemalloc.get_traced_memory()
+        for call in self._active:
+            call["peak"] = max(call["peak"], peak)
+        tracemalloc.reset_peak()
+
+    def stage_profile(self):
+        """Return the profile of the stage so far."""
+        profile = {"calls": 1, **difference(self._start, snapshot()), "rows_in": 0, "rows_out": 0,
+                   "peak_memory": peak_rss()}
+        # rows read and written by the stage are the rows loaded and saved as working copies (see kg_io)
+        for name, function in self.functions.items():
+            if name == "kg_io.load":
+                profile["rows_in"] += function["rows_out"]
+            elif name == "kg_io.save":
+                profile["rows_out"] += function["rows_in"]
+        return {"stage": self.stage, "profile": profile, "functions": self.functions}
+
+
+def snapshot():
+    """Return the current time, CPU time, and HTTP statistics (see http_utils.get_stats)."""
+    stats = http_utils.get_stats().values()
+    return {"wall": time.perf_counter(), "cpu": time.process_time(),
+            "http": sum(endpoint["latency"] * endpoint["requests"] + endpoint["wait"] for endpoint in stats),
+            "requests": sum(endpoint["requests"] for endpoint in stats),
+            "cached": sum(endpoint["cached"] for endpoint in stats),
+            "bytes": sum(endpoint["bytes"] for endpoint in stats)}
+
+
+def difference(start, end):
+    return {metric: end[metric] - start[metric] for metric in ["wall", "cpu", "http", "requests", "cached", "bytes"]}
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def count_rows(value):
+    """Return the number of rows of a DataFrame, Series, table, or list (summed over tuples), or 0 for other values."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pa.Table, list)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(count_rows(item) for item in value)
+    return 0
+
+
+def profiled(function, name):
+    """Wrap a function to record its profile while a profiler is running."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profiler = _profiler
+        if profiler is None:
+            return function(*args, **kwargs)
+        rows_in = sum(count_rows(value) for value in args) + sum(count_rows(value) for value in kwargs.values())
+        call = profiler.begin()
+        result = None
+        try:
+            result = function(*args, **kwargs)
+            return result
+        finally:
+            profiler.end(name, call, rows_in, count_rows(result))
+
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def instrument(module_name, exclude=()):
+    """
+    Instrument the public functions of a module.
+
+    The functions are replaced in the module namespace, so calls within the module are
+    profiled as well. Helpers that are called per row (e.g., in DataFrame.apply) should be
+    excluded, since they would mostly measure the profiling overhead. Generator functions are
+    not instrumented, their time is included in the functions that consume them.
+
+    Example (at the end of a module):
+        >>> profiling.instrument(__name__, exclude=["add_prefix"])
+    """
+    module = sys.modules[module_name]
+    short_name = module_name.rsplit(".", 1)[-1]
+    for name, value in list(vars(module).items()):
+        if (callable(value) and not isinstance(value, type) and not name.startswith("_") and name not in exclude
+                and getattr(value, "__module__", None) == module_name and not hasattr(value, "__wrapped__")
+                and not inspect.isgeneratorfunction(value)):
+            setattr(module, name, profiled(value, f"{short_name}.{name}"))
+
+
+def start(stage, path=PROFILE_PATH, trace_memory=False):
+    """Start profiling a stage. The profile is written to path/<stage>.json by stop."""
+    global _profiler
+    with _profiler_lock:
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _profiler = Profiler(stage, path, trace_memory)
+
+
+def stop():
+    """Stop profiling and write the stage profile. Returns the stage profile."""
+    global _profiler
+    with _profiler_lock:
+        profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    if profiler.trace_memory:
+        tracemalloc.stop()
+    profile = profiler.stage_profile()
+    os.makedirs(profiler.path, exist_ok=True)
+    with open(os.path.join(profiler.path, f"{profiler.stage}.json"), "w") as f:
+        json.dump(profile, f, indent=2)
+    return profile
+
+
+def profile_frames(report):
+    """Return the stage and function profiles of a run report as DataFrames."""
+    stages = pd.DataFrame([{"stage": stage["stage"], **stage["profile"]} for stage in report["stages"]],
+                          columns=["stage"] + METRICS)
+    functions = pd.DataFrame([{"stage": stage["stage"], "function": name, **profile}
+                              for stage in report["stages"] for name, profile in stage["functions"].items()],
+                             columns=["stage", "function"] + METRICS)
+    return stages, functions.sort_values("wall", ascending=False)
+
+
+def write_report(run_path):
+    """
+    Combine the stage profiles of a run into report.json and report.html.
+
+    Returns
+    -------
+    dict
+        The run report with the stage profiles in the order they finished.
+    """
+    stages = []
+    for file_name in os.listdir(run_path):
+        if file_name.endswith(".json") and file_name != "report.json":
+            with open(os.path.join(run_path, file_name)) as f:
+                stages.append(json.load(f))
+    stages.sort(key=lambda stage: os.path.getmtime(os.path.join(run_path, stage["stage"] + ".json")))
+    report = {"run": os.path.basename(os.path.normpath(run_path)), "stages": stages}
+    with open(os.path.join(run_path, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    stage_df, function_df = profile_frames(report)
+    with open(os.path.join(run_path, "report.html"), "w") as f:
+        f.write(f"<html><head><title>Build profile {html.escape(report['run'])}</title></head><body>\n"
+                f"<h1>Build profile {html.escape(report['run'])}</h1>\n"
+                f"<h2>Stages</h2>\n{stage_df.to_html(index=False, float_format='{:.2f}'.format)}\n"
+                f"<h2>Functions</h2>\n{function_df.to_html(index=False, float_format='{:.2f}'.format)}\n"
+                "</body></html>\n")
+    return report
+
+
+def compare_reports(base, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare the stage profiles of two run reports.
+
+    Returns
+    -------
+    pd.DataFrame
+        The base and new value and the ratio (new / base) of each compared metric by stage,
+        and a regressions column with the metrics whose ratio exceeds the threshold.
+    """
+    base_df = profile_frames(base)[0].set_index("stage")[COMPARED_METRICS]
+    new_df = profile_frames(new)[0].set_index("stage")[COMPARED_METRICS]
+    df = base_df.join(new_df, how="outer", lsuffix="_base", rsuffix="_new")
+    regressions = pd.Series("", index=df.index)
+    for metric in COMPARED_METRICS:
+        ratio = df[f"{metric}_new"] / df[f"{metric}_base"].where(df[f"{metric}_base"] > 0)
+        df[f"{metric}_ratio"] = ratio
+        regressed = (ratio > threshold) & (df[f"{metric}_new"] >= MIN_VALUES[metric])
+        regressions[regressed] += metric + " "
+    df["regressions"] = regressions.str.strip()
+    columns = [f"{metric}_{suffix}" for metric in COMPARED_METRICS for suffix in ["base", "new", "ratio"]]
+    return df[columns + ["regressions"]].reset_index()
+
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write and compare the profiling reports of builds.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="write report.json and report.html from the stage profiles of a run")
+    report_parser.add_argument("run_path", help="directory with the stage profiles")
+    compare_parser = subparsers.add_parser("compare", help="compare two run reports")
+    compare_parser.add_argument("base", help="report.json of the base run")
+    compare_parser.add_argument("new", help="report.json of the new run")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        report = write_report(args.run_path)
+        print(f"Wrote the report of {len(report['stages'])} stages to {args.run_path}")
+        return 0
+
+    df = compare_reports(read_report(args.base), read_report(args.new), args.threshold)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(df.to_string(index=False, float_format="{:.2f}".format))
+    regressed = df[df["regressions"] != ""]
+    for stage, regressions in zip(regressed["stage"], regressed["regressions"]):
+        print(f"ERROR: {stage} regressed: {regressions}")
+    return 1 if len(regressed) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,35 @@
+import functools
 import os
+import re
+import sys
 import requests
 import json
-import time
 import pandas as pd
 from dotenv import load_dotenv
+import http_utils
+import profiling
+import chunk_runner
+import kg_io
+import name_matching
 
 CHUNK_SIZE = 500
 # Semantic Scholar rate limit 1 request per second
 RATE_LIMIT = 1
 
+# weight factors for relevance score calculation
+ALPHA = 0.4 # constant based on distance (1: primary, 2: secondary publication, ...)
+BETA = 0.6 # factor for matching relevant terms
+# terms that indicate COVID-19 relevance, matched case-insensitively anywhere in the text
+COVID_TERMS = ["COVID-19", "COVID19", "COVID", "2019-nCoV", "SARS-CoV-2", "Severe Acute Respiratory Syndrome Coronavirus 2",
+               "coronavirus", "betacoronavirus", "Spike Glycoprotein", "MIS-C", "Multisystem Inflammatory Syndrome in Children",
+               "virus", "viral", "pandemic", "RADx", "RADx-rad", "RADx-UP", "RADx-TECH", "RADx-DHT"]
+AUTHOR_COLUMNS = ["authorId", "name", "aliases", "affiliations", "paperCount", "citationCount", "hIndex", "externalIds.DBLP",
+                  "externalIds.ORCID", "paperId", "names"]
+# separator of the name variants in the names column
+NAME_SEPARATOR = ","
+# DBLP distinguishes authors with the same name by a 4-digit number, e.g., "Hua Xu 0001"
+DBLP_NUMBER = re.compile(r"\s+\d{4}$")
+
 def get_s2_apikey():
     load_dotenv()
     apikey = os.getenv("S2_API_KEY")
@@ -17,8 +38,10 @@ def get_s2_apikey():
     return apikey
 
 
-def get_paper_data(paper_ids, fields, apikey):
+def get_paper_data(paper_ids, fields, apikey, checkpoint=True):
     """
+    Get the paper data for a list of paper ids (see iter_paper_data).
+
     API description: https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/post_graph_get_papers
     
     The following types of IDs are supported:
@@ -40,16 +63,36 @@ def get_paper_data(paper_ids, fields, apikey):
     biorxiv.org
     """
 
+    return list(iter_paper_data(paper_ids, fields, apikey, checkpoint))
+
+
+def iter_paper_data(paper_ids, fields, apikey, checkpoint=True):
+    """
+    Yield the paper data for a list of paper ids as the chunks of CHUNK_SIZE ids are retrieved.
+
+    If checkpoint is True, each chunk is written to a checkpoint file as it completes (see
+    chunk_runner.run_chunks). An interrupted run with the same ids and fields resumes after
+    the last completed chunk, and chunks that failed are retried on the next run.
+
+    Raises
+    ------
+    RuntimeError
+        After the completed chunks were yielded, if a chunk failed after all retries, so no
+        incomplete table is saved. The checkpoint is kept, a rerun only requests the failed chunks.
+    """
     chunks = create_chunks(paper_ids, CHUNK_SIZE)
+    path = chunk_runner.checkpoint_file("paper_data", fields, list(paper_ids)) if checkpoint else None
+
+    def process_chunk(chunk):
+        return get_paper_data_chunk(chunk, fields, apikey)
 
-    all_data = get_paper_data_chunk(chunks[0], fields, apikey)
-    # #print(all_data)
-    for chunk in chunks[1:]:
-        time.sleep(RATE_LIMIT)
-        data = get_paper_data_chunk(chunk, fields, apikey)
-        all_data = all_data + data
+    n_completed = 0
+    for _, data in chunk_runner.run_chunks(chunks, process_chunk, path, errors=(requests.exceptions.RequestException,)):
+        n_completed += 1
+        yield from data
 
-    return all_data
+    if n_completed < len(chunks):
+        raise RuntimeError(f"{len(chunks) - n_completed} of {len(chunks)} chunks of paper data failed, run again to retry them")
 
 
 def get_paper_data_chunk(paper_ids, fields, apikey):
@@ -82,28 +125,32 @@ def get_paper_data_chunk(paper_ids, fields, apikey):
     params = {"fields": fields}
     json={"ids": paper_ids}
     
-    try:
-        response = requests.post(URL, headers=HEADERS, params=params, json=json)
-        response.raise_for_status()
-        data = response.json()
-        return data
-    except requests.exceptions.HTTPError as error:
-        print(f"ERROR: Semantic Scholar HTTP error: {error}")
-    except requests.exceptions.RequestException as error:
-        print(f"ERROR: Semantic Scholar: {error}")
-        
-    return []
+    # throttle only requests that are not served from the response cache
+    # errors are reported by post_json and raised to the chunk runner, which records the failed chunk
+    limiter = http_utils.get_rate_limiter("semanticscholar", RATE_LIMIT)
+    return http_utils.post_json(URL, limiter=limiter, headers=HEADERS, params=params, json=json)
+
 
+def get_author_ids(paper_ids, existing=None, refresh=None):
+    """
+    Get the authors of papers from Semantic Scholar.
 
-def get_author_ids(paper_ids):
+    In delta mode (existing is given), only papers that are not in the existing author
+    data (matched on the doi column) or that are listed in refresh are requested, and
+    the existing rows for the remaining papers are merged back into the result.
+    """
     #data = get_paper_data(paper_ids, "authors.authorId,authors.name,authors.paperCount,authors.citationCount,authors.hIndex,externalIds")
+    fetch_ids = delta_ids(paper_ids, existing, "doi", refresh)
+    if len(fetch_ids) == 0:
+        return merge_delta(paper_ids, existing, None, "doi")
+
     apikey = get_s2_apikey()
-    data = get_paper_data(paper_ids, "externalIds", apikey)
-    time.sleep(RATE_LIMIT)
+    # the external ids are requested together with the author fields, which resolves the ids in a single pass
+    data = get_paper_data(fetch_ids, "externalIds,authors.authorId,authors.name,authors.aliases,authors.affiliations,authors.paperCount,authors.citationCount,authors.hIndex,authors.externalIds", apikey)
+    # remove mismatches (e.g., pmid:37205441 -> return None (bioRxiv paper), now published in Small: PMID:37264756)
+    data = [paper for paper in data if paper]
     id_data = pd.json_normalize(data, errors="ignore")
     
-    # remove mismatches (e.g., pmid:37205441 -> return NaN (bioRxiv paper), now published in Small: PMID:37264756)
-    id_data.dropna(axis=0, how='all', inplace=True)
     # DOIs are required as the primary key to publications. Ignore entries without a DOI.
     id_data.dropna(subset=["externalIds.DOI"], inplace=True)
 
@@ -114,68 +161,120 @@ def get_author_ids(paper_ids):
     # add prefix
     id_data["doi"] = "doi:" + id_data["doi"]
 
-    # use only the matching paper_ids to get author data, otherwise this results in an error
-    matching_paper_ids = id_data["paperId"].to_list()
-    #data = get_paper_data(matching_paper_ids, "authors.authorId,authors.name,authors.paperCount,authors.citationCount,authors.hIndex")
-    data = get_paper_data(matching_paper_ids, "authors.authorId,authors.name,authors.aliases,authors.affiliations,authors.paperCount,authors.citationCount,authors.hIndex,authors.externalIds", apikey)
-    author_data = pd.json_normalize(data, record_path=["authors"], meta=["paperId"], errors="ignore")
-    author_data.dropna(axis=0, how='all', inplace=True)
-    author_data = author_data.astype(str)
-    author_data["aliases"] = author_data["aliases"].str.replace(".", "")
-    author_data["aliases"] = author_data["aliases"].str.replace("None", "")
-    author_data["aliases"] = author_data["aliases"].str.replace("['","")
-    author_data["aliases"] = author_data["aliases"].str.replace("']","")
-    author_data["aliases"] = author_data["aliases"].str.replace("'","")
-    author_data["aliases"] = author_data["aliases"].str.split(",")
-    author_data["aliases"] = author_data["aliases"].apply(lambda x: ",".join(x))
-
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].str.replace(".", "")
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].str.replace("['", ",")
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].str.replace("']", ",")
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].str.replace("'", "")
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].str.split(",")
-    author_data["externalIds.DBLP"] = author_data["externalIds.DBLP"].apply(lambda x: ",".join(x))
-
-    author_data["names"] = author_data["name"] + "," + author_data["externalIds.DBLP"] + "," + author_data["aliases"]
-    author_data["names"] = author_data["names"].str.replace(",,",",")
+    author_data = normalize_authors(data)
     author_data = author_data.merge(id_data, on="paperId")
     author_data.fillna("", inplace=True)
-    print(f"Number of mismatches: {len(paper_ids) - author_data['paperId'].nunique()}")
+    print(f"Number of mismatches: {len(fetch_ids) - author_data['paperId'].nunique()}")
     
-    return author_data
+    return merge_delta(paper_ids, existing, author_data, "doi")
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_name_variant(name):
+    """
+    Normalize an author name variant (alias or DBLP name) for name matching.
+
+    Periods, DBLP numbers, and name separators are removed, and whitespace is collapsed, e.g.,
+    "L. Ohno-Machado" -> "L Ohno-Machado", "Hua Xu 0001" -> "Hua Xu". Results are cached and
+    interned, since the same authors appear on many papers.
+    """
+    name = DBLP_NUMBER.sub("", name.replace(".", "").replace(NAME_SEPARATOR, " "))
+    return sys.intern(" ".join(name.split()))
+
+
+def to_count(value):
+    return str(int(value)) if value is not None else ""
 
 
-def get_citations(paper_ids):
-    import json
+def normalize_authors(papers):
+    """
+    Flatten the authors of Semantic Scholar paper records into one row per author and paper.
+
+    The aliases and DBLP names are read from the JSON lists and normalized (see
+    normalize_name_variant) in a single pass over the authors, without converting the lists to
+    strings and back.
+
+    Returns
+    -------
+    pd.DataFrame
+        The author fields (AUTHOR_COLUMNS) as strings ("" if missing). aliases and
+        externalIds.DBLP are the normalized variants separated by ", ", affiliations are
+        separated by "|", and names is the match key: the distinct normalized variants of the
+        name, DBLP names, and aliases separated by NAME_SEPARATOR (see author_name_tokens).
+    """
+    rows = []
+    for paper in papers:
+        for author in paper.get("authors") or []:
+            external_ids = author.get("externalIds") or {}
+            aliases = list(dict.fromkeys(normalize_name_variant(alias) for alias in author.get("aliases") or []))
+            dblp_names = external_ids.get("DBLP") or []
+            dblp_names = list(dict.fromkeys(normalize_name_variant(dblp_name)
+                                            for dblp_name in ([dblp_names] if isinstance(dblp_names, str) else dblp_names)))
+            name = author.get("name") or ""
+            variants = dict.fromkeys(variant for variant in [normalize_name_variant(name), *dblp_names, *aliases] if variant)
+            rows.append((author.get("authorId") or "", name, ", ".join(aliases), "|".join(author.get("affiliations") or []),
+                         to_count(author.get("paperCount")), to_count(author.get("citationCount")), to_count(author.get("hIndex")),
+                         ", ".join(dblp_names), external_ids.get("ORCID") or "", paper.get("paperId") or "",
+                         NAME_SEPARATOR.join(variants)))
+    return pd.DataFrame(rows, columns=AUTHOR_COLUMNS, dtype=str)
+
+
+def author_name_tokens(author_data):
+    """
+    Return the interned name variants of authors (see name_matching.NameTokens), in the row order of author_data.
+
+    Example:
+        >>> authors = get_author_ids(["doi:10.3390/bios12110938"])
+        >>> tokens = author_name_tokens(authors)
+        >>> tokens.match(["Diana Vanegas"], 0.9)
+    """
+    return name_matching.NameTokens.from_keys(author_data["names"], NAME_SEPARATOR)
+
+
+def get_citations(paper_ids, existing=None, refresh=None):
+    """
+    Get the DOIs of the papers that cite the given papers.
+
+    In delta mode (existing is given), only the citations of papers that are not cited papers
+    (doi column) in the existing citations or that are listed in refresh are requested.
+    """
+    fetch_ids = delta_ids(paper_ids, existing, "doi", refresh)
+    if len(fetch_ids) == 0:
+        return merge_delta(paper_ids, existing, None, "doi")
+
     apikey = get_s2_apikey()
-    data = get_paper_data(paper_ids, "externalIds", apikey)
-    # print(json.dumps(data, indent=2))
-    time.sleep(RATE_LIMIT)
+    data = get_paper_data(fetch_ids, "paperId,externalIds,citations.paperId,citations.externalIds,citationCount", apikey)
+    # remove mismatches (e.g., pmid:37205441 -> return None (bioRxiv paper), now published in Small: PMID:37264756)
+    data = [paper for paper in data if paper]
     id_data = pd.json_normalize(data)
     
-    # remove mismatches (e.g., pmid:37205441 -> return NaN (bioRxiv paper), now published in Small: PMID:37264756)
-    id_data.dropna(axis=0, how='all', inplace=True)
     # DOIs are required as the primary key to publications. Ignore entries without a DOI.
     id_data.dropna(subset=["externalIds.DOI"], inplace=True)
+    id_data = id_data[["paperId", "externalIds.DOI"]]
 
-    # use only the matching paper_ids to get author data, otherwise this results in an error
-    matching_paper_ids = id_data["paperId"].to_list()
-    
-    data = get_paper_data(matching_paper_ids, "paperId,externalIds,citations.paperId,citations.externalIds,citationCount", apikey)
-
-    df = pd.json_normalize(data, record_path=["citations"], record_prefix="citation.", meta=["paperId", "externalIds","citationCount"])
+    df = pd.json_normalize(data, record_path=["citations"], record_prefix="citation.", meta=["paperId", "citationCount"])
     df.dropna(subset=["citation.externalIds.DOI"], inplace=True)
     
     df = df.merge(id_data, on="paperId")
     df["doi"] = "doi:" + df["externalIds.DOI"]
     df["doiCite"] = "doi:" + df["citation.externalIds.DOI"]
-    return df[["doiCite", "doi"]].copy()
+    return merge_delta(paper_ids, existing, df[["doiCite", "doi"]].copy(), "doi")
 
 
+def get_publication_info(paper_ids, existing=None, refresh=None):
+    """
+    Get title, journal, year, external ids, citation count, and abstract of papers.
+
+    In delta mode (existing is given, e.g., from load_known_publications), only papers that
+    are not in the existing data (doi column) or that are listed in refresh are requested.
+    """
+    fetch_ids = delta_ids(paper_ids, existing, "doi", refresh)
+    if len(fetch_ids) == 0:
+        return merge_delta(paper_ids, existing, None, "doi")
 
-def get_publication_info(paper_ids):
     apikey = get_s2_apikey()
-    data = get_paper_data(paper_ids, "title,journal,year,citationCount,externalIds,abstract", apikey)
+    data = get_paper_data(fetch_ids, "title,journal,year,citationCount,externalIds,abstract", apikey)
+    data = [paper for paper in data if paper]
     df = pd.json_normalize(data, errors="ignore")
     #print(df.head().to_string())
     
@@ -198,16 +297,89 @@ def get_publication_info(paper_ids):
     # add prefix
     df["doi"] = "doi:" + df["doi"]
     
-    return df
+    return merge_delta(paper_ids, existing, df, "doi")
 
 
-def get_embeddings(paper_ids):
+def get_embeddings(paper_ids, existing=None, refresh=None):
+    """
+    Get the SPECTER v2 embeddings of papers.
+
+    In delta mode (existing is given), only papers that are not in the existing
+    embeddings (doi column) or that are listed in refresh are requested.
+    """
+    fetch_ids = delta_ids(paper_ids, existing, "doi", refresh)
+    if len(fetch_ids) == 0:
+        return merge_delta(paper_ids, existing, None, "doi")
+
     apikey = get_s2_apikey()
-    data = get_paper_data(paper_ids, ["embedding.specter_v2"], apikey)
-    #print(data)
+    data = get_paper_data(fetch_ids, "externalIds,embedding.specter_v2", apikey)
+    data = [paper for paper in data if paper]
     df = pd.json_normalize(data)
-    print(df.columns)
-    return df
+    df.dropna(subset=["externalIds.DOI"], inplace=True)
+    df["doi"] = "doi:" + df["externalIds.DOI"]
+    df = df[["paperId", "doi", "embedding.vector"]].rename(columns={"embedding.vector": "embedding"})
+    return merge_delta(paper_ids, existing, df, "doi")
+
+
+def delta_ids(paper_ids, existing, key, refresh=None):
+    """
+    Return the paper ids that need to be fetched.
+
+    Args:
+        paper_ids (list): The requested paper ids (e.g., doi:10.3390/bios12110938).
+        existing (pandas.DataFrame): Previously fetched data, or None to fetch all papers.
+        key (str): The column in existing that contains the paper ids.
+        refresh (list, optional): Paper ids that are fetched even if they are in existing.
+
+    Returns:
+        list: The unique paper ids that are not in existing or are listed in refresh.
+    """
+    paper_ids = list(dict.fromkeys(paper_ids))
+    if existing is None:
+        return paper_ids
+
+    # DOIs are case insensitive
+    known = set(existing[key].str.lower())
+    refresh = {paper_id.lower() for paper_id in refresh or []}
+    return [paper_id for paper_id in paper_ids if paper_id.lower() not in known or paper_id.lower() in refresh]
+
+
+def merge_delta(paper_ids, existing, fetched, key):
+    """
+    Combine the existing rows for the requested paper ids with the newly fetched rows.
+
+    Existing rows for papers that were fetched again are replaced by the fetched rows.
+    """
+    if existing is None:
+        return fetched
+
+    requested = {paper_id.lower() for paper_id in paper_ids}
+    existing_keys = existing[key].str.lower()
+    keep = existing_keys.isin(requested)
+    if fetched is not None:
+        keep &= ~existing_keys.isin(set(fetched[key].str.lower()))
+
+    return pd.concat([existing[keep], fetched], ignore_index=True)
+
+
+def load_known_publications(working_path=kg_io.WORKING_PATH):
+    """
+    Load the publications already in the KG (working copies, see kg_io) in the format returned by get_publication_info.
+
+    The paperId and citationCount columns are not stored in the KG and are left empty.
+    """
+    columns = ["name", "journal", "year", "pmId", "pmcId", "doi", "abstract"]
+    names = [f"Publication_{pub_type}" for pub_type in ["primary", "secondary"]]
+    publications = pd.concat([kg_io.load(name, columns=columns, working_path=working_path)
+                              for name in names if kg_io.exists(name, working_path)])
+    publications["year"] = publications["year"].astype("string").fillna("")
+    publications["paperId"] = ""
+    publications["citationCount"] = ""
+    col_map = {"paperId": "paperId", "name": "title", "journal": "journal", "year": "year", "pmId": "pmId", "pmcId": "pmcId",
+               "doi": "doi", "citationCount": "citationCount", "abstract": "abstract"}
+    publications = rename_and_reorder_columns(publications, col_map)
+    publications.drop_duplicates("doi", inplace=True)
+    return publications
 
 
 def rename_and_reorder_columns(df, col_map):
@@ -239,27 +411,161 @@ def create_chunks(data, chunk_size):
     return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
         
 
+def term_pattern(terms):
+    """
+    Compile a list of terms into a single regular expression.
+
+    The terms are merged into a prefix tree (e.g., radx(?:-(?:dht|rad|tech|up))?), so the text
+    is scanned once without trying each term at each position. At each position the longest
+    matching term wins.
+    """
+    tree = {}
+    for term in terms:
+        node = tree
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        # a term ends at this node, the longer terms are optional
+        return "(?:" + pattern + ")?" if "" in node else pattern
+
+    return re.compile(build(tree))
+
+
+class RelevanceScorer:
+    """
+    Score the relevance of publications by matching a list of terms in their text columns.
+
+    The terms are compiled once into a single pattern (see term_pattern) that is matched
+    against the lower case text, so matching is case-insensitive. All columns of a publication
+    are joined and scanned in one pass. Where terms overlap, the longest one is reported
+    (e.g., RADx-rad instead of RADx).
+
+    The relevance score is alpha**distance + beta**distance * w, where distance is the citation
+    distance (1: primary, 2: secondary publication, ...) and w is the highest weight of the
+    matched terms (0 if no term matches).
+
+    Parameters
+    ----------
+    terms : list, optional
+        Terms to match. Defaults to COVID_TERMS.
+
+    alpha : float, optional
+        Weight of the citation distance. Defaults to ALPHA.
+
+    beta : float, optional
+        Weight of the term matches. Defaults to BETA.
+
+    weights : dict, optional
+        Weight of each term (case-insensitive). Terms not in the dictionary have a weight of 1.
+    """
+    def __init__(self, terms=COVID_TERMS, alpha=ALPHA, beta=BETA, weights=None):
+        self.alpha = alpha
+        self.beta = beta
+        # map the lower case form of each term (as matched) to the term and its weight
+        self.terms = {term.lower(): term for term in terms}
+        weights = {term.lower(): weight for term, weight in (weights or {}).items()}
+        self.weights = {term: weights.get(term, 1) for term in self.terms}
+        self.pattern = term_pattern(self.terms)
+
+    @staticmethod
+    def join_columns(df, columns):
+        """Return the lower case text of the given columns of each row."""
+        # join the columns with a separator that cannot be part of a term, so matches don't span columns
+        texts = df[columns[0]].fillna("").astype(str)
+        for column in columns[1:]:
+            texts = texts + "\n" + df[column].fillna("").astype(str)
+        return texts.str.lower()
+
+    def match(self, df, columns):
+        """
+        Find the terms in the given columns of each row.
+
+        Returns
+        -------
+        list
+            The sorted list of matched terms for each row.
+        """
+        texts = self.join_columns(df, columns)
+        return [sorted({self.terms[match] for match in self.pattern.findall(text)}) for text in texts]
+
+    def score(self, df, columns, distance, terms_column=None):
+        """
+        Add the relevance column to a DataFrame of publications.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The publications.
+
+        columns : list
+            The text columns to search for terms (e.g., title and abstract).
+
+        distance : int
+            The citation distance of the publications (1: primary, 2: secondary publication, ...).
+
+        terms_column : str, optional
+            If given, add a column with the matched terms separated by "|" for auditing.
+
+        Returns
+        -------
+        pd.DataFrame
+            The DataFrame with the relevance column added.
+        """
+        weights = set(self.weights.values())
+        if terms_column is None and len(weights) == 1:
+            # all terms have the same weight, only check if any term matches (vectorized)
+            matched = self.join_columns(df, columns).str.contains(self.pattern.pattern)
+            term_weights = matched.astype(float) * weights.pop()
+        else:
+            matches = self.match(df, columns)
+            term_weights = pd.Series([max((self.weights[term.lower()] for term in terms), default=0) for terms in matches],
+                                     index=df.index, dtype=float)
+            if terms_column is not None:
+                df[terms_column] = ["|".join(terms) for terms in matches]
+
+        df["relevance"] = self.alpha**distance + term_weights * self.beta**distance
+        return df
+
+
+_relevance_scorer = None
+
+
 def add_relevance_score(df, columns, distance):
-    # weight factors for relevance score calculation
-    ALPHA = 0.4 # constant based on distance (1: primary, 2: secondary publication, ...)
-    BETA = 0.6 # factor for matching relevant terms
-    covid_pattern = "COVID-19|COVID19|COVID|2019-nCoV|SARS-CoV-2|Severe Acute Respiratory Syndrome Coronavirus 2|coronavirus|betacoronavirus|" + \
-                    "Spike Glycoprotein|MIS-C|Multisystem Inflammatory Syndrome in Children|virus|viral|pandemic|RADx|RADx-rad|RADx-UP|RADx-TECH|RADx-DHT"
-    # check for COVID patterns in the specific columns
-    df["covid"] = df[columns[0]].str.contains(covid_pattern, case=False)
-    for col in columns[1:]:
-        df["covid"] = df["covid"] | df[col].str.contains(covid_pattern, case=False)
-
-    # calculate the relevance score
-    df["relevance"] = ALPHA**distance + df["covid"].astype(int) * BETA**distance
-    df.drop(columns="covid", inplace=True)
-    
-    return df
+    """Add the COVID-19 relevance score to publications (see RelevanceScorer)."""
+    global _relevance_scorer
+    if _relevance_scorer is None:
+        _relevance_scorer = RelevanceScorer()
+    return _relevance_scorer.score(df, columns, distance)
 
 
 def expand_name_column(df, name_column):
-    """ Expands a full name (first middle last name) to separate name fields. """
-    df[['name', 'fullName', 'firstName', 'middleName', 'lastName']] = df[name_column].apply(lambda x: pd.Series(create_name_cols(x)))
+    """
+    Expands a full name (first middle last name) to separate name fields.
+
+    Vectorized version of create_name_cols: the first and last space separated parts are the
+    first and last name, the parts in between form the middle name.
+    """
+    full_names = df[name_column].astype(object)
+    parts = full_names.str.split(" ")
+    first_names = parts.str[0].str.replace(".", "", regex=False)
+    last_names = parts.str[-1]
+    # text between the first and the last space, empty for names with less than three parts
+    middle = full_names.str.extract(r"(?s)^[^ ]* (.*) [^ ]*\Z", expand=False).fillna("")
+    middle_names = middle.str.replace(" ", "", regex=False).str.replace(".", "", regex=False)
+    middle_initials = middle.str.replace(r"([^ ])[^ ]*", r"\1", regex=True).str.replace(" ", "", regex=False)
+
+    # name = last name + initials (used for mapping of names)
+    df["name"] = last_names + " " + first_names.str[:1] + middle_initials
+    df["fullName"] = full_names
+    df["firstName"] = first_names
+    df["middleName"] = middle_names
+    df["lastName"] = last_names
 
 
 def create_name_cols(full_name):
@@ -280,3 +586,6 @@ def create_name_cols(full_name):
     name = last_name + " " + first_name[:1] + middle_initials
 
     return name, full_name, first_name, middle_name, last_name
+
+
+profiling.instrument(__name__, exclude=["get_s2_apikey", "create_chunks", "term_pattern", "create_name_cols", "to_count"])
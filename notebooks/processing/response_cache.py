@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+# location of the cache database, override with the RADX_KG_CACHE environment variable
+CACHE_PATH = os.getenv("RADX_KG_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "derived_data", "http_cache.sqlite"))
+# maximum size of the cached (compressed) responses in bytes
+MAX_CACHE_BYTES = 1024**3
+DAY = 24 * 60 * 60
+# time to live in seconds for each source (None: never expires)
+DEFAULT_TTLS = {"api.reporter.nih.gov": 7 * DAY,
+                "apply07.grants.gov": 30 * DAY,
+                "api.semanticscholar.org": 7 * DAY,
+                "model-apis.semanticscholar.org": None,
+               }
+DEFAULT_TTL = DAY
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when a response is not in the cache."""
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for JSON API responses stored in a local SQLite file.
+
+    Responses are keyed on the HTTP method, endpoint URL, and normalized query parameters
+    and request body, so identical requests are served from the cache regardless of key
+    order or headers (e.g., API keys and User-Agents are not part of the key).
+
+    Parameters
+    ----------
+    path : str, optional
+        Path of the SQLite database. Defaults to CACHE_PATH.
+
+    ttls : dict, optional
+        Time to live in seconds by host name. A value of None means the entries never expire.
+        Defaults to DEFAULT_TTLS. Hosts not in the dictionary use DEFAULT_TTL.
+
+    max_bytes : int, optional
+        Maximum size of the stored responses. The least recently used entries are
+        evicted when the cache grows beyond this size. Defaults to MAX_CACHE_BYTES.
+
+    offline : bool, optional
+        If True, only serve responses from the cache, including expired entries.
+        Defaults to the RADX_KG_OFFLINE environment variable.
+    """
+    def __init__(self, path=CACHE_PATH, ttls=None, max_bytes=MAX_CACHE_BYTES, offline=None):
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        if offline is None:
+            offline = os.getenv("RADX_KG_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    key TEXT PRIMARY KEY, host TEXT, url TEXT,
+                                    created REAL, accessed REAL, size INTEGER, body BLOB)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._connection.commit()
+
+    @staticmethod
+    def key(url, params=None, body=None, method="POST"):
+        """Return the content address (SHA-256) of a request."""
+        request = {"method": method.upper(), "url": url, "params": params, "body": body}
+        normalized = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def ttl(self, host):
+        return self.ttls.get(host, DEFAULT_TTL)
+
+    def get(self, url, params=None, body=None, method="POST"):
+        """
+        Return the cached response for a request.
+
+        Returns
+        -------
+        tuple
+            (True, data) if a valid entry exists, otherwise (False, None).
+        """
+        key = self.key(url, params, body, method)
+        with self._lock:
+            row = self._connection.execute("SELECT host, created, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+
+            host, created, blob = row
+            ttl = self.ttl(host)
+            now = time.time()
+            if not self.offline and ttl is not None and now - created > ttl:
+                return False, None
+
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+
+        return True, json.loads(zlib.decompress(blob))
+
+    def put(self, url, data, params=None, body=None, method="POST"):
+        """Store the response for a request and evict old entries if the cache is too large."""
+        key = self.key(url, params, body, method)
+        blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (key, urlparse(url).netloc, url, now, now, len(blob), blob))
+            self._connection.commit()
+            self._evict()
+
+    def _evict(self):
+        # remove the least recently used entries until the cache is below 90% of its maximum size
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = 0.9 * self.max_bytes
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._connection.commit()
+
+    def clear(self, host=None):
+        """Remove all entries, or only the entries for a specific host."""
+        with self._lock:
+            if host is None:
+                self._connection.execute("DELETE FROM responses")
+            else:
+                self._connection.execute("DELETE FROM responses WHERE host = ?", (host,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_cache():
+    """Return the shared response cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def set_cache(cache):
+    """Replace the shared response cache, e.g., with a cache in a temporary directory. Returns the previous cache."""
+    global _cache
+    with _cache_lock:
+        previous, _cache = _cache, cache
+        return previous
+
+
+def set_offline(offline=True):
+    """Switch the shared response cache to offline mode (serve only from the cache)."""
+    get_cache().offline = offline
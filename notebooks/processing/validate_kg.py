@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Preflight validation of the node and relationship CSV files for the Neo4j bulk import.
+
+The files are read once in chunks. Node ids are kept as sorted arrays of 64-bit hashes per
+label, so memory is bounded by the number of nodes, not by the size of the files. The
+validator reports:
+
+    - node files without an id column, empty ids, and duplicate ids within a label
+      (e.g., across Researcher_investigators.csv and Researcher_primary_coauthors.csv)
+    - relationship files without a from or to column, and from/to ids that are not nodes
+      of the start or end label
+    - files without metadata and values that don't match the type in the metadata
+      (int, float, boolean, date, and arrays)
+
+Usage (from the notebooks/processing directory):
+    python validate_kg.py                                  # ../kg/data and ../kg/metadata
+    python validate_kg.py <data_path> <metadata_path>
+
+The exit status is 1 if any error is found.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+
+KG_PATH = "../kg/data"
+METADATA_PATH = "../kg/metadata"
+# number of rows read at a time
+CHUNK_SIZE = 100000
+# array delimiter of the CSV files (Neo4j bulk import)
+ARRAY_DELIMITER = "|"
+# number of example values reported per error
+MAX_EXAMPLES = 3
+
+FLOAT_PATTERN = r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?(?:NaN|Infinity)"
+TYPE_PATTERNS = {
+    "int": r"[+-]?\d+",
+    "long": r"[+-]?\d+",
+    "float": FLOAT_PATTERN,
+    "double": FLOAT_PATTERN,
+    "boolean": r"(?i:true|false)",
+    "date": r"\d{4}-\d{2}-\d{2}",
+}
+
+
+def label_from_file(csv_file):
+    """Return the node label of a node file, e.g., Researcher_investigators.csv -> Researcher."""
+    return os.path.splitext(os.path.basename(csv_file))[0].split("_")[0]
+
+
+def relationship_from_file(csv_file):
+    """Return the start label, type, and end label of a relationship file, e.g., Researcher-AUTHORED-Publication_other.csv."""
+    parts = os.path.splitext(os.path.basename(csv_file))[0].split("-")
+    if len(parts) != 3:
+        return None
+    start, rel_type, end = parts
+    return start, rel_type, end.split("_")[0]
+
+
+def read_metadata(metadata_file):
+    """Return the property types of a metadata file, or None if the file does not exist."""
+    if not os.path.exists(metadata_file):
+        return None
+    metadata = pd.read_csv(metadata_file, dtype=str, keep_default_na=False)
+    return dict(zip(metadata["property"], metadata["type"]))
+
+
+def type_pattern(property_type):
+    """Return the regular expression for the values of a metadata type, or None if any value is valid (e.g., string)."""
+    if property_type.endswith("[]"):
+        pattern = TYPE_PATTERNS.get(property_type[:-2])
+        if pattern is None:
+            return None
+        return f"(?:{pattern})(?:{re.escape(ARRAY_DELIMITER)}(?:{pattern}))*"
+    return TYPE_PATTERNS.get(property_type)
+
+
+def hash_ids(ids):
+    """Return 64-bit hashes of ids."""
+    return pd.util.hash_array(ids.to_numpy(dtype=object))
+
+
+class Validator:
+    """
+    Collects the errors found in the node and relationship files.
+
+    Args:
+        chunk_size (int): The number of rows read at a time.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.errors = []
+        # sorted id hashes by node label
+        self.ids = {}
+
+    def error(self, csv_file, message, values=None, count=None):
+        if values is not None:
+            values = list(dict.fromkeys(values))
+            count = len(values) if count is None else count
+            examples = ", ".join(repr(value) for value in values[:MAX_EXAMPLES])
+            message = f"{message}: {examples}{', ...' if count > MAX_EXAMPLES else ''} ({count} rows)"
+        self.errors.append(f"{os.path.basename(csv_file)}: {message}")
+
+    def chunks(self, csv_file):
+        return pd.read_csv(csv_file, dtype=str, keep_default_na=False, chunksize=self.chunk_size)
+
+    def check_types(self, chunk, types, invalid):
+        """Count the values of each column in a chunk that don't match the metadata type."""
+        for column in chunk.columns:
+            pattern = type_pattern(types.get(column, "string"))
+            if pattern is None:
+                continue
+            values = chunk[column]
+            bad = values[(values != "") & ~values.str.fullmatch(pattern)]
+            if len(bad) > 0:
+                count, examples = invalid.get(column, (0, []))
+                invalid[column] = (count + len(bad), examples + bad.head(MAX_EXAMPLES).tolist())
+
+    def report_types(self, csv_file, types, invalid):
+        for column, (count, examples) in invalid.items():
+            self.error(csv_file, f"values of {column} are not of type {types[column]}", examples, count)
+
+    def validate_node_file(self, csv_file, metadata_path):
+        label = label_from_file(csv_file)
+        types = read_metadata(os.path.join(metadata_path, "nodes", f"{label}.csv"))
+        if types is None:
+            self.error(csv_file, f"no metadata file nodes/{label}.csv")
+            types = {}
+
+        seen = self.ids.get(label, np.empty(0, dtype=np.uint64))
+        invalid = {}
+        duplicates = []
+        n_duplicates = 0
+        for chunk in self.chunks(csv_file):
+            if "id" not in chunk.columns:
+                self.error(csv_file, "missing id column")
+                return
+            ids = chunk["id"]
+            if (ids == "").any():
+                self.error(csv_file, f"{(ids == '').sum()} rows without id")
+            ids = ids[ids != ""]
+            hashes = hash_ids(ids)
+            duplicated = ids.duplicated().to_numpy() | np.isin(hashes, seen)
+            if duplicated.any():
+                n_duplicates += int(duplicated.sum())
+                duplicates.extend(ids[duplicated].head(MAX_EXAMPLES).tolist())
+            seen = np.union1d(seen, hashes)
+            self.check_types(chunk, types, invalid)
+
+        if n_duplicates:
+            self.error(csv_file, f"duplicate {label} ids", duplicates, n_duplicates)
+        self.report_types(csv_file, types, invalid)
+        self.ids[label] = seen
+
+    def validate_relationship_file(self, csv_file, metadata_path):
+        relationship = relationship_from_file(csv_file)
+        if relationship is None:
+            self.error(csv_file, "file name is not of the form Start-TYPE-End.csv")
+            return
+        start, rel_type, end = relationship
+        for label in (start, end):
+            if label not in self.ids:
+                self.error(csv_file, f"no node file for label {label}")
+        types = read_metadata(os.path.join(metadata_path, "relationships", f"{start}-{rel_type}-{end}.csv"))
+        if types is None:
+            self.error(csv_file, f"no metadata file relationships/{start}-{rel_type}-{end}.csv")
+            types = {}
+
+        invalid = {}
+        dangling = {"from": (0, []), "to": (0, [])}
+        for chunk in self.chunks(csv_file):
+            if "from" not in chunk.columns or "to" not in chunk.columns:
+                self.error(csv_file, "missing from or to column")
+                return
+            for column, label in (("from", start), ("to", end)):
+                ids = self.ids.get(label, np.empty(0, dtype=np.uint64))
+                values = chunk[column]
+                hashes = hash_ids(values)
+                # membership test in the sorted id hashes
+                positions = np.minimum(np.searchsorted(ids, hashes), max(len(ids) - 1, 0))
+                missing = values[(ids[positions] != hashes) if len(ids) > 0 else np.ones(len(values), dtype=bool)]
+                if len(missing) > 0:
+                    count, examples = dangling[column]
+                    dangling[column] = (count + len(missing), examples + missing.head(MAX_EXAMPLES).tolist())
+            self.check_types(chunk, types, invalid)
+
+        for column, label in (("from", start), ("to", end)):
+            count, examples = dangling[column]
+            if count:
+                self.error(csv_file, f"{column} ids that are not {label} nodes", examples, count)
+        self.report_types(csv_file, types, invalid)
+
+    def validate(self, data_path, metadata_path):
+        """Validate all node files and then all relationship files. Returns the list of errors."""
+        node_files = sorted(glob.glob(os.path.join(data_path, "nodes", "*.csv")))
+        relationship_files = sorted(glob.glob(os.path.join(data_path, "relationships", "*.csv")))
+        if not node_files:
+            self.error(data_path, "no node files")
+        for csv_file in node_files:
+            self.validate_node_file(csv_file, metadata_path)
+        for csv_file in relationship_files:
+            self.validate_relationship_file(csv_file, metadata_path)
+        return self.errors
+
+
+def validate(data_path=KG_PATH, metadata_path=METADATA_PATH, chunk_size=CHUNK_SIZE):
+    """
+    Validate the node and relationship files of a KG for the Neo4j bulk import.
+
+    Returns
+    -------
+    list
+        Error messages, empty if the files are valid.
+    """
+    return Validator(chunk_size).validate(data_path, metadata_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the radx-kg CSV files before the Neo4j bulk import.")
+    parser.add_argument("data_path", nargs="?", default=KG_PATH, help="directory with the nodes and relationships directories")
+    parser.add_argument("metadata_path", nargs="?", default=METADATA_PATH, help="directory with the metadata files")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="number of rows read at a time")
+    args = parser.parse_args(argv)
+
+    errors = validate(args.data_path, args.metadata_path, args.chunk_size)
+    for error in errors:
+        print(f"ERROR: {error}")
+    if errors:
+        print(f"{len(errors)} errors found in {args.data_path}")
+        return 1
+    print(f"{args.data_path} is valid")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,37 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
+from typing import Dict, List
+
+# use the shared HTTP transport of the processing pipeline if it is on the path (notebooks/processing)
+try:
+    import http_utils
+except ImportError:
+    http_utils = None
+
+URL = "https://model-apis.semanticscholar.org/specter/v1/invoke"
+MAX_BATCH_SIZE = 16
+# dimension of the SPECTER embeddings
+EMBEDDING_DIMENSION = 768
+# maximum number of batches embedded concurrently
+MAX_WORKERS = 4
+# number of retries of a failed batch (connection errors, HTTP 429 and 5xx)
+MAX_RETRIES = 5
+# base delay in seconds of the exponential backoff between retries
+BACKOFF_FACTOR = 1.0
+# location of the embedding cache, override with the RADX_KG_EMBEDDING_CACHE environment variable
+CACHE_PATH = os.getenv("RADX_KG_EMBEDDING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "radx-kg", "embeddings.sqlite"))
+
+_client = None
+_client_lock = threading.Lock()
+
 
 def create_chunks(data, chunk_size):
     """
@@ -23,31 +56,187 @@ def create_chunks(data, chunk_size):
         yield data[i:i + chunk_size]
 
 
-def embed_title_abstract(papers):
-    URL = "https://model-apis.semanticscholar.org/specter/v1/invoke"
-    MAX_BATCH_SIZE = 16
-    
-    embeddings_by_paper_id: Dict[str, List[float]] = {}
+def content_key(paper, url=URL):
+    """Return the content hash of the title and abstract of a paper for the given embedding endpoint."""
+    content = json.dumps([url, paper.get("title") or "", paper.get("abstract") or ""], separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings keyed by content hash, stored in a local SQLite file.
+
+    Args:
+        path (str): Path of the SQLite database. Defaults to CACHE_PATH.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB)")
+        self._connection.commit()
+
+    def get_many(self, keys):
+        """Return a dictionary with the cached embeddings (float32 arrays) of the given keys."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            # stay below the SQLite limit of 999 parameters per statement
+            for chunk in create_chunks(keys, 900):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, embedding in rows:
+                    found[key] = np.frombuffer(embedding, dtype=np.float32)
+        return found
+
+    def put_many(self, embeddings):
+        """Store a dictionary of embeddings by key."""
+        rows = [(key, np.asarray(embedding, dtype=np.float32).tobytes()) for key, embedding in embeddings.items()]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)", rows)
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class EmbeddingClient:
+    """
+    Client for the SPECTER embedding API.
+
+    Papers are deduplicated by the content hash of their title and abstract. Embeddings
+    are served from a persistent cache, and the remaining papers are sent in batches of
+    MAX_BATCH_SIZE, several batches at a time. Each batch is retried with exponential
+    backoff (by http_utils.request_json if notebooks/processing is on the path) and
+    stored in the cache as soon as it completes, so a run that fails part way resumes
+    where it stopped.
+
+    Args:
+        url (str): The embedding endpoint.
+        cache (EmbeddingCache): The embedding cache. Defaults to an EmbeddingCache at CACHE_PATH.
+            Use False to disable caching.
+        batch_size (int): The maximum number of papers per request.
+        max_workers (int): The maximum number of concurrent requests.
+        max_retries (int): The number of retries of a failed batch.
+        backoff_factor (float): The base delay in seconds between retries.
+
+    Example:
+        >>> client = EmbeddingClient()
+        >>> client.embed_texts(["Role of inflammation in COVID-19 patients"]).shape
+        (1, 768)
+    """
+    def __init__(self, url=URL, cache=None, batch_size=MAX_BATCH_SIZE, max_workers=MAX_WORKERS,
+                 max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+        self.url = url
+        self.cache = EmbeddingCache() if cache is None else cache
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+
+    def _post(self, batch):
+        """Embed a batch of papers, retrying connection errors and HTTP 429 and 5xx responses."""
+        if http_utils is not None:
+            data = http_utils.request_json("POST", self.url, retries=self.max_retries, json=batch)
+            return {paper["paper_id"]: paper["embedding"] for paper in data["preds"]}
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(self.url, json=batch)
+                if response.status_code == 200:
+                    return {paper["paper_id"]: paper["embedding"] for paper in response.json()["preds"]}
+                if response.status_code != 429 and response.status_code < 500:
+                    raise RuntimeError(f"Embedding request failed with HTTP status {response.status_code}")
+                error = f"HTTP status {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except requests.exceptions.RequestException as exception:
+                error = str(exception)
+
+            if attempt < self.max_retries:
+                delay = self.backoff_factor * 2**attempt * (1 + random.random())
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                time.sleep(delay)
+
+        raise RuntimeError(f"Embedding request failed after {self.max_retries} retries: {error}")
+
+    def _embed_batch(self, batch):
+        embeddings = self._post(batch)
+        if self.cache:
+            self.cache.put_many(embeddings)
+        return embeddings
+
+    def embed(self, papers):
+        """
+        Embed papers (dicts with title and abstract).
+
+        Returns:
+            numpy.ndarray: float32 matrix of shape (len(papers), EMBEDDING_DIMENSION), one row per paper in input order.
+
+        Raises:
+            RuntimeError: If a batch fails after all retries. Completed batches are kept in the cache.
+        """
+        keys = [content_key(paper, self.url) for paper in papers]
+        embeddings = self.cache.get_many(set(keys)) if self.cache else {}
+
+        # the content hash serves as paper_id, so duplicates are only sent once
+        missing = {}
+        for key, paper in zip(keys, papers):
+            if key not in embeddings and key not in missing:
+                missing[key] = {"paper_id": key, "title": paper.get("title") or "", "abstract": paper.get("abstract") or ""}
 
-    for chunk in create_chunks(papers, chunk_size=MAX_BATCH_SIZE):
-        # Allow Python requests to convert the data above to JSON
-        response = requests.post(URL, json=chunk)
+        batches = list(create_chunks(list(missing.values()), self.batch_size))
+        errors = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                futures = [executor.submit(self._embed_batch, batch) for batch in batches]
+                for future in futures:
+                    try:
+                        embeddings.update(future.result())
+                    except (RuntimeError, requests.exceptions.RequestException) as error:
+                        errors.append(error)
 
-        if response.status_code != 200:
-            raise RuntimeError("Sorry, something went wrong, please try later!")
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(batches)} embedding batches failed: {errors[0]}")
 
-        for paper in response.json()["preds"]:
-            embeddings_by_paper_id[paper["paper_id"]] = paper["embedding"]
+        if len(keys) == 0:
+            return np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        return np.array([embeddings[key] for key in keys], dtype=np.float32)
+
+    def embed_texts(self, texts):
+        """Embed texts, using each text as title and abstract. Returns one row per text in input order."""
+        return self.embed([{"title": text, "abstract": text} for text in texts])
+
+
+def get_client():
+    """Return the shared embedding client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EmbeddingClient()
+        return _client
+
+
+def embed_title_abstract(papers, client=None):
+    """
+    Embed papers (dicts with paper_id, title, and abstract) with the SPECTER API.
+
+    Returns a dictionary with the embedding of each paper_id. Uses the shared EmbeddingClient
+    unless a client is given.
+    """
+    client = get_client() if client is None else client
+    embeddings = client.embed(papers)
+
+    embeddings_by_paper_id: Dict[str, List[float]] = {}
+    for paper, embedding in zip(papers, embeddings.tolist()):
+        embeddings_by_paper_id[paper["paper_id"]] = embedding
 
     return embeddings_by_paper_id
 
 
 def embed_text(text):
-    text_dict = [
-        {
-            "paper_id": "id",
-            "title": text,
-            "abstract": text,
-        }
-    ]
-    return embed_title_abstract(text_dict)["id"]
\ No newline at end of file
+    return get_client().embed_texts([text])[0].tolist()
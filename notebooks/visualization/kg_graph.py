@@ -0,0 +1,396 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+
+# py2neo is only needed to convert results for neo4j_utils.draw_graph
+try:
+    from py2neo import Node, Relationship, Subgraph
+except ImportError:
+    Node = Relationship = Subgraph = None
+
+# array delimiter of the node and relationship CSV files (Neo4j bulk import)
+ARRAY_DELIMITER = "|"
+# large properties that are not loaded by default
+EXCLUDED_PROPERTIES = ("embedding",)
+DIRECTIONS = ("out", "in", "both")
+
+
+def label_from_file(csv_file):
+    """
+    Return the node label of a node CSV file.
+
+    Example:
+        >>> label_from_file("kg/data/nodes/Publication_primary.csv")
+        'Publication'
+    """
+    return os.path.splitext(os.path.basename(csv_file))[0].split("_")[0]
+
+
+def relationship_from_file(csv_file):
+    """
+    Return the start label, relationship type, and end label of a relationship CSV file.
+
+    Example:
+        >>> relationship_from_file("kg/data/relationships/Researcher-AUTHORED-Publication_other.csv")
+        ('Researcher', 'AUTHORED', 'Publication')
+    """
+    start, rel_type, end = os.path.splitext(os.path.basename(csv_file))[0].split("-")
+    return start, rel_type, end.split("_")[0]
+
+
+def read_property_types(metadata_file):
+    """Return the property types (int, boolean, string[], ...) from a metadata CSV file, or an empty dict if it is missing."""
+    if metadata_file is None or not os.path.exists(metadata_file):
+        return {}
+    metadata = pd.read_csv(metadata_file, dtype=str, keep_default_na=False)
+    return dict(zip(metadata["property"], metadata["type"]))
+
+
+def convert_properties(df, types):
+    """
+    Convert the string columns of a node or relationship CSV file to the types in the metadata.
+
+    Empty values become missing values, which are left out of the node and relationship properties
+    like in the Neo4j bulk import.
+    """
+    df = df.replace("", None)
+    for column, column_type in types.items():
+        if column not in df.columns or column in ("id", "from", "to"):
+            continue
+        if column_type == "int":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+        elif column_type == "float":
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        elif column_type == "boolean":
+            df[column] = df[column].str.lower().map({"true": True, "false": False})
+        elif column_type.endswith("[]"):
+            df[column] = df[column].str.split(ARRAY_DELIMITER)
+    return df
+
+
+def property_values(properties):
+    """Return the non-missing values of a row of properties as Python values (JSON serializable for the graph widget)."""
+    values = {}
+    for name, value in properties.items():
+        if isinstance(value, list):
+            values[name] = value
+        elif not pd.isna(value):
+            values[name] = value.item() if isinstance(value, np.generic) else value
+    return values
+
+
+def gather(indptr, order, nodes):
+    """Return the edges of the given nodes from a CSR adjacency (indptr, edges ordered by node)."""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    if counts.sum() == 0:
+        return np.empty(0, dtype=int)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return order[offsets + np.arange(counts.sum())]
+
+
+class KnowledgeGraph:
+    """
+    In-memory graph of the RADx-rad knowledge graph for common traversals without Neo4j.
+
+    Nodes are numbered 0..n-1 and edges 0..m-1. The adjacency is stored as compressed sparse
+    row arrays in both directions, so the edges of a set of nodes are found with a few array
+    operations. Node ids, labels, and relationship types are the same as in the Neo4j database
+    created by the bulk import of the kg/data directory.
+
+    Example:
+        >>> kg = KnowledgeGraph.from_csv(os.environ.get("NEO4J_DATA"))
+        >>> researcher = kg.find("Researcher", lastName="Cirrito")
+        >>> nodes, edges = kg.k_hop(researcher, k=2)
+        >>> widget = neo4j_utils.draw_graph(kg.to_subgraph(nodes, edges), stylesheet)
+    """
+    def __init__(self, nodes, relationships):
+        """
+        Args:
+            nodes (dict): Node properties by label, DataFrames with an id column.
+            relationships (list): Tuples (start label, type, end label, DataFrame with from and to columns).
+        """
+        self.labels = sorted(nodes)
+        self.properties = {}
+        ids = []
+        node_labels = []
+        for code, label in enumerate(self.labels):
+            df = nodes[label].drop_duplicates("id").reset_index(drop=True)
+            df.index += sum(len(label_ids) for label_ids in ids)
+            self.properties[label] = df.drop(columns="id")
+            ids.append(df["id"].to_numpy(dtype=str))
+            node_labels.append(np.full(len(df), code))
+        self.ids = np.concatenate(ids) if ids else np.empty(0, dtype=str)
+        self.node_labels = np.concatenate(node_labels) if node_labels else np.empty(0, dtype=int)
+        self.positions = pd.Series(np.arange(len(self.ids)), index=self.ids)
+
+        self.types = sorted({rel_type for _, rel_type, _, _ in relationships})
+        self.edge_properties = {}
+        sources = []
+        targets = []
+        edge_types = []
+        # relationships to nodes that are not in the node files are skipped, like in the Neo4j bulk import
+        self.skipped_relationships = 0
+        n_edges = 0
+        for start_label, rel_type, end_label, df in relationships:
+            source = self._lookup(df["from"], start_label)
+            target = self._lookup(df["to"], end_label)
+            valid = (source >= 0) & (target >= 0)
+            self.skipped_relationships += int((~valid).sum())
+            sources.append(source[valid])
+            targets.append(target[valid])
+            edge_types.append(np.full(valid.sum(), self.types.index(rel_type)))
+            properties = df.loc[valid, [column for column in df.columns if column not in ("from", "to")]]
+            if len(properties.columns) > 0:
+                properties.index = np.arange(n_edges, n_edges + valid.sum())
+                self.edge_properties.setdefault(rel_type, []).append(properties)
+            n_edges += int(valid.sum())
+        self.edge_properties = {rel_type: pd.concat(frames) for rel_type, frames in self.edge_properties.items()}
+        self.sources = np.concatenate(sources) if sources else np.empty(0, dtype=int)
+        self.targets = np.concatenate(targets) if targets else np.empty(0, dtype=int)
+        self.edge_types = np.concatenate(edge_types) if edge_types else np.empty(0, dtype=int)
+
+        self._out = self._csr(self.sources)
+        self._in = self._csr(self.targets)
+
+    @classmethod
+    def from_csv(cls, data_path, metadata_path=None, excluded_properties=EXCLUDED_PROPERTIES):
+        """
+        Load the graph from the nodes and relationships directories of the kg (e.g., kg/data).
+
+        Args:
+            data_path (str): Directory with the nodes and relationships subdirectories.
+            metadata_path (str): Directory with the metadata CSV files used to type the properties.
+                Defaults to the metadata directory next to data_path (e.g., kg/metadata).
+            excluded_properties (tuple): Properties that are not loaded (e.g., embeddings).
+        """
+        metadata_path = metadata_path or os.path.join(os.path.dirname(os.path.abspath(data_path)), "metadata")
+
+        frames = {}
+        for csv_file in sorted(glob.glob(os.path.join(data_path, "nodes", "*.csv"))):
+            label = label_from_file(csv_file)
+            df = pd.read_csv(csv_file, dtype=str, keep_default_na=False, usecols=lambda name: name not in excluded_properties)
+            df = convert_properties(df, read_property_types(os.path.join(metadata_path, "nodes", f"{label}.csv")))
+            frames.setdefault(label, []).append(df)
+        nodes = {label: pd.concat(dfs, ignore_index=True) for label, dfs in frames.items()}
+
+        relationships = []
+        for csv_file in sorted(glob.glob(os.path.join(data_path, "relationships", "*.csv"))):
+            start_label, rel_type, end_label = relationship_from_file(csv_file)
+            df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+            metadata_file = os.path.join(metadata_path, "relationships", f"{start_label}-{rel_type}-{end_label}.csv")
+            relationships.append((start_label, rel_type, end_label, convert_properties(df, read_property_types(metadata_file))))
+
+        return cls(nodes, relationships)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _lookup(self, ids, label):
+        """Return the node numbers of ids with the given label, -1 for unknown ids."""
+        positions = self.positions.reindex(ids).fillna(-1).to_numpy(dtype=int, copy=True)
+        if label in self.labels:
+            positions[(positions >= 0) & (self.node_labels[positions] != self.labels.index(label))] = -1
+        return positions
+
+    def _csr(self, nodes):
+        order = np.argsort(nodes, kind="stable")
+        indptr = np.zeros(len(self) + 1, dtype=int)
+        np.cumsum(np.bincount(nodes, minlength=len(self)), out=indptr[1:])
+        return indptr, order
+
+    def nodes(self, ids: List[str]):
+        """Return the node numbers of node ids. Unknown ids are ignored."""
+        positions = self.positions.reindex(ids).dropna()
+        return positions.to_numpy(dtype=int)
+
+    def find(self, label=None, **properties):
+        """
+        Return the node numbers of the nodes with a label and property values.
+
+        Example:
+            >>> kg.find("Researcher", lastName="Cirrito")
+            array([2113])
+        """
+        labels = self.labels if label is None else [label]
+        found = []
+        for node_label in labels:
+            df = self.properties.get(node_label)
+            if df is None or any(name not in df.columns for name in properties):
+                continue
+            mask = np.ones(len(df), dtype=bool)
+            for name, value in properties.items():
+                mask &= (df[name] == value).fillna(False).to_numpy(dtype=bool)
+            found.append(df.index[mask].to_numpy())
+        return np.concatenate(found) if found else np.empty(0, dtype=int)
+
+    def incident(self, nodes, direction="both", types=None, labels=None):
+        """
+        Return the edges of the given nodes and the node at the other end of each edge.
+
+        Args:
+            nodes (array-like): Node numbers.
+            direction (str): "out" for outgoing, "in" for incoming, or "both".
+            types (list): Optional relationship types to follow, e.g., ["AUTHORED"].
+            labels (list): Optional labels of the nodes at the other end, e.g., ["Publication"].
+
+        Returns:
+            tuple: (edges, neighbors) arrays of the same length.
+        """
+        edges, _, neighbors = self._traverse(nodes, direction, types, labels)
+        return edges, neighbors
+
+    def _traverse(self, nodes, direction, types, labels):
+        """Return the edges of the given nodes with the node each edge starts from and the node it leads to."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}, got {direction}")
+        nodes = np.asarray(nodes, dtype=int)
+
+        edges = []
+        origins = []
+        neighbors = []
+        if direction in ("out", "both"):
+            out_edges = gather(*self._out, nodes)
+            edges.append(out_edges)
+            origins.append(self.sources[out_edges])
+            neighbors.append(self.targets[out_edges])
+        if direction in ("in", "both"):
+            in_edges = gather(*self._in, nodes)
+            edges.append(in_edges)
+            origins.append(self.targets[in_edges])
+            neighbors.append(self.sources[in_edges])
+        edges = np.concatenate(edges)
+        origins = np.concatenate(origins)
+        neighbors = np.concatenate(neighbors)
+
+        mask = np.ones(len(edges), dtype=bool)
+        if types is not None:
+            mask &= np.isin(self.edge_types[edges], [self.types.index(t) for t in types if t in self.types])
+        if labels is not None:
+            mask &= np.isin(self.node_labels[neighbors], [self.labels.index(l) for l in labels if l in self.labels])
+        return edges[mask], origins[mask], neighbors[mask]
+
+    def neighbors(self, nodes, direction="both", types=None, labels=None):
+        """Return the unique neighbors of the given nodes (see incident for the filters)."""
+        return np.unique(self.incident(nodes, direction, types, labels)[1])
+
+    def k_hop(self, nodes, k=1, direction="both", types=None, labels=None):
+        """
+        Return the k-hop neighborhood of the given nodes.
+
+        The edges are those of the paths with up to k edges that start at the given nodes, like
+        MATCH p=(n)--()--() RETURN p for k=2, except that a path may use an edge twice.
+
+        Returns:
+            tuple: (nodes, edges) arrays with the node numbers and edge numbers of the neighborhood.
+        """
+        frontier = np.unique(np.asarray(nodes, dtype=int))
+        visited = np.zeros(len(self), dtype=bool)
+        visited[frontier] = True
+        edges = []
+        for _ in range(k):
+            hop_edges, neighbors = self.incident(frontier, direction, types, labels)
+            edges.append(hop_edges)
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+            if len(frontier) == 0:
+                break
+        edges = np.unique(np.concatenate(edges)) if edges else np.empty(0, dtype=int)
+        return np.flatnonzero(visited), edges
+
+    def shortest_path(self, source, target, direction="both", types=None, labels=None, max_length=None):
+        """
+        Return a shortest path between two nodes (breadth-first search).
+
+        Args:
+            source (int): Node number of the start node.
+            target (int): Node number of the end node.
+            max_length (int): Optional maximum number of edges.
+            See incident for the other arguments.
+
+        Returns:
+            tuple: (nodes, edges) lists along the path, or None if there is no path.
+        """
+        parent_edge = np.full(len(self), -1)
+        parent_node = np.full(len(self), -1)
+        visited = np.zeros(len(self), dtype=bool)
+        visited[source] = True
+        frontier = np.array([source])
+        length = 0
+        while not visited[target] and len(frontier) > 0 and (max_length is None or length < max_length):
+            edges, origins, neighbors = self._traverse(frontier, direction, types, labels)
+            new = ~visited[neighbors]
+            neighbors, first = np.unique(neighbors[new], return_index=True)
+            parent_edge[neighbors] = edges[new][first]
+            parent_node[neighbors] = origins[new][first]
+            visited[neighbors] = True
+            frontier = neighbors
+            length += 1
+
+        if not visited[target]:
+            return None
+        nodes = [int(target)]
+        edges = []
+        while nodes[-1] != source:
+            edges.append(int(parent_edge[nodes[-1]]))
+            nodes.append(int(parent_node[nodes[-1]]))
+        return nodes[::-1], edges[::-1]
+
+    def induced_edges(self, nodes):
+        """Return the edges between the given nodes."""
+        member = np.zeros(len(self), dtype=bool)
+        member[np.asarray(nodes, dtype=int)] = True
+        return np.flatnonzero(member[self.sources] & member[self.targets])
+
+    def node_properties(self, node):
+        """Return the non-missing properties of a node, including its id."""
+        properties = self.properties[self.labels[self.node_labels[node]]].loc[node]
+        return {"id": str(self.ids[node]), **property_values(properties)}
+
+    def edge_properties_of(self, edge):
+        """Return the non-missing properties of an edge."""
+        df = self.edge_properties.get(self.types[self.edge_types[edge]])
+        if df is None:
+            return {}
+        return property_values(df.loc[edge])
+
+    def to_data_frame(self, nodes):
+        """Return a DataFrame with the id, label, and properties of the given nodes."""
+        nodes = np.asarray(nodes, dtype=int)
+        return pd.DataFrame([{"label": self.labels[self.node_labels[node]], **self.node_properties(node)} for node in nodes])
+
+    def edges_to_data_frame(self, edges):
+        """Return a DataFrame with the from id, type, and to id of the given edges."""
+        edges = np.asarray(edges, dtype=int)
+        return pd.DataFrame({"from": self.ids[self.sources[edges]],
+                             "type": np.asarray(self.types, dtype=object)[self.edge_types[edges]],
+                             "to": self.ids[self.targets[edges]]})
+
+    def to_subgraph(self, nodes, edges=None):
+        """
+        Return the given nodes and edges as a py2neo Subgraph that neo4j_utils.draw_graph can render.
+
+        Edges default to the edges between the given nodes. The node and relationship identities
+        are the node and edge numbers of this graph.
+        """
+        if Subgraph is None:
+            raise ImportError("to_subgraph requires py2neo: pip install py2neo")
+
+        nodes = np.asarray(nodes, dtype=int)
+        edges = self.induced_edges(nodes) if edges is None else np.asarray(edges, dtype=int)
+        graph_nodes = {}
+        for node in np.union1d(nodes, np.concatenate([self.sources[edges], self.targets[edges]])):
+            graph_node = Node(self.labels[self.node_labels[node]], **self.node_properties(node))
+            graph_node.identity = int(node)
+            graph_nodes[node] = graph_node
+
+        relationships = []
+        for edge in edges:
+            relationship = Relationship(graph_nodes[self.sources[edge]], self.types[self.edge_types[edge]],
+                                        graph_nodes[self.targets[edge]], **self.edge_properties_of(edge))
+            relationship.identity = int(edge)
+            relationships.append(relationship)
+
+        return Subgraph(list(graph_nodes.values()), relationships)
@@ -0,0 +1,289 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+
+# dimension of the SPECTER v2 embeddings
+EMBEDDING_DIMENSION = 768
+# separator of the embedding values in the node CSV files (see 9_add_embeddings.ipynb)
+EMBEDDING_SEPARATOR = "|"
+# number of query vectors scored per matrix multiplication
+QUERY_BATCH_SIZE = 1024
+# corpora smaller than this are always searched exhaustively
+MIN_APPROXIMATE_SIZE = 10000
+
+
+def sidecar_paths(csv_file):
+    """
+    Return the paths of the binary embedding sidecar files of a node CSV file
+    (same naming as notebooks/processing/embedding_store.py).
+
+    Example:
+        >>> sidecar_paths("kg/data/nodes/Publication_primary.csv")
+        ('kg/data/nodes/Publication_primary_embedding.npy', 'kg/data/nodes/Publication_primary_embedding_ids.npy')
+    """
+    stem = os.path.splitext(csv_file)[0]
+    return stem + "_embedding.npy", stem + "_embedding_ids.npy"
+
+
+def parse_embeddings(values, dimension=EMBEDDING_DIMENSION):
+    """
+    Parse pipe-delimited embedding strings into a float32 matrix.
+
+    Args:
+        values (list): Embedding strings, e.g., "-1.91|-4.97|...".
+        dimension (int): The number of values per embedding.
+
+    Returns:
+        numpy.ndarray: Matrix of shape (len(values), dimension).
+    """
+    if len(values) == 0:
+        return np.empty((0, dimension), dtype=np.float32)
+
+    # parse all values in a single pass instead of splitting each row
+    matrix = np.fromstring(EMBEDDING_SEPARATOR.join(values), dtype=np.float32, sep=EMBEDDING_SEPARATOR)
+    if matrix.size != len(values) * dimension:
+        raise ValueError(f"Expected {dimension} values per embedding, got {matrix.size / len(values):.1f} on average")
+    return matrix.reshape(len(values), dimension)
+
+
+def load_csv_embeddings(csv_file, id_column="id", embedding_column="embedding"):
+    """
+    Load the ids and embeddings of a node CSV file. Rows without an embedding are skipped.
+
+    Returns:
+        tuple: (ids, embeddings) as a numpy string array and a float32 matrix.
+    """
+    df = pd.read_csv(csv_file, usecols=[id_column, embedding_column], dtype=str)
+    df = df[df[embedding_column].fillna("") != ""]
+    return df[id_column].to_numpy(dtype=str), parse_embeddings(df[embedding_column].tolist())
+
+
+def save_sidecar(csv_file, ids, embeddings):
+    """Save ids and embeddings to the binary sidecar files of a node CSV file."""
+    embedding_file, id_file = sidecar_paths(csv_file)
+    np.save(embedding_file, np.asarray(embeddings))
+    np.save(id_file, np.asarray(ids, dtype=str))
+
+
+def load_sidecar(csv_file, mmap=True):
+    """
+    Load the ids and embeddings from the binary sidecar files of a node CSV file.
+
+    The embeddings are memory-mapped read-only unless mmap is False.
+    """
+    embedding_file, id_file = sidecar_paths(csv_file)
+    embeddings = np.load(embedding_file, mmap_mode="r" if mmap else None)
+    ids = np.load(id_file)
+    return ids, embeddings
+
+
+def has_current_sidecar(csv_file):
+    """Return True if the sidecar files of a node CSV file exist and are not older than the CSV file."""
+    paths = sidecar_paths(csv_file)
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    return min(os.path.getmtime(path) for path in paths) >= os.path.getmtime(csv_file)
+
+
+def load_embeddings(csv_file, cache=True):
+    """
+    Load the ids and embeddings of a node CSV file, preferring the binary sidecar files.
+
+    The sidecar files are written by notebooks/processing/9_add_embeddings.ipynb. If they are
+    missing or older than the CSV file (e.g., after the CSV file was updated), the embeddings
+    are parsed from the CSV file and, if cache is True, saved as sidecar for the next call.
+    """
+    if has_current_sidecar(csv_file):
+        return load_sidecar(csv_file)
+
+    ids, embeddings = load_csv_embeddings(csv_file)
+    if cache:
+        save_sidecar(csv_file, ids, embeddings)
+        return load_sidecar(csv_file)
+    return ids, embeddings
+
+
+def normalize(vectors):
+    """Return a float32 copy of the vectors scaled to unit length (zero vectors are left unchanged)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k_indices(scores, k):
+    """Return the column indices of the k highest scores in each row, in descending order of score."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=int)
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, indices, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(indices, order, axis=1)
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=0):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Returns:
+        tuple: (centroids, labels) with unit-length centroids and the cluster index of each vector.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    labels = np.zeros(len(vectors), dtype=int)
+    for _ in range(n_iter):
+        labels = np.concatenate([np.argmax(vectors[i:i + QUERY_BATCH_SIZE] @ centroids.T, axis=1)
+                                 for i in range(0, len(vectors), QUERY_BATCH_SIZE)])
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # keep the previous centroid for empty clusters
+        empty = np.bincount(labels, minlength=n_clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize(sums)
+    return centroids, labels
+
+
+class VectorIndex:
+    """
+    In-memory cosine similarity index for node embeddings.
+
+    The embeddings are normalized once when the index is created, so a query is a single
+    matrix multiplication. An optional inverted file (IVF) index restricts the search to
+    the clusters closest to the query for large corpora (see build_approximate_index).
+
+    Example:
+        >>> index = VectorIndex.from_csv(["../../kg/data/nodes/Publication_primary.csv"])
+        >>> index.query_ids(["doi:10.1101/2022.03.14.22272314"], top_k=10, threshold=0.8)
+    """
+    def __init__(self, ids, embeddings):
+        self.ids = np.asarray(ids, dtype=str)
+        self.embeddings = normalize(embeddings)
+        if len(self.ids) != len(self.embeddings):
+            raise ValueError(f"Got {len(self.ids)} ids for {len(self.embeddings)} embeddings")
+        self.positions = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.centroids = None
+        self.lists = None
+
+    @classmethod
+    def from_csv(cls, csv_files: List[str], cache=True):
+        """Create an index from the embeddings of one or more node CSV files (e.g., Publication_*.csv)."""
+        ids = []
+        embeddings = []
+        for csv_file in csv_files:
+            file_ids, file_embeddings = load_embeddings(csv_file, cache=cache)
+            ids.append(file_ids)
+            embeddings.append(file_embeddings)
+        return cls(np.concatenate(ids), np.concatenate(embeddings))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build_approximate_index(self, n_lists=None, n_iter=10, seed=0):
+        """
+        Build an inverted file index by clustering the embeddings.
+
+        Args:
+            n_lists (int): The number of clusters. Defaults to sqrt(number of embeddings).
+            n_iter (int): The number of k-means iterations.
+            seed (int): Random seed for the initial centroids.
+        """
+        n_lists = n_lists or max(1, int(np.sqrt(len(self))))
+        self.centroids, labels = spherical_kmeans(self.embeddings, min(n_lists, len(self)), n_iter, seed)
+        order = np.argsort(labels, kind="stable")
+        boundaries = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[start:end] for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+    def search(self, vectors, top_k=10, n_probe=None, exclude=None):
+        """
+        Find the top-k most similar embeddings for each query vector.
+
+        Args:
+            vectors (array-like): Query vectors of shape (n, dimension) or a single vector.
+            top_k (int): The number of results per query.
+            n_probe (int): The number of clusters searched per query if an approximate index
+                has been built and the corpus has at least MIN_APPROXIMATE_SIZE embeddings.
+                Defaults to an exhaustive search.
+            exclude (array-like): Optional index position per query to leave out of its results
+                (e.g., the query node itself), -1 for none.
+
+        Returns:
+            tuple: (positions, scores) arrays of shape (n, top_k) with the index positions and
+            cosine similarities of the results, ordered by descending similarity. Queries with
+            fewer than top_k candidates are padded with position -1 and score -inf.
+        """
+        queries = normalize(vectors)
+        exclude = np.full(len(queries), -1) if exclude is None else np.asarray(exclude)
+        k = top_k + 1 if (exclude >= 0).any() else top_k
+        positions = np.full((len(queries), top_k), -1, dtype=int)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+
+        approximate = self.lists is not None and n_probe is not None and len(self) >= MIN_APPROXIMATE_SIZE
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            batch = queries[start:start + QUERY_BATCH_SIZE]
+            if approximate:
+                results = [self._search_lists(query, k, n_probe) for query in batch]
+            else:
+                batch_scores = batch @ self.embeddings.T
+                batch_positions = top_k_indices(batch_scores, k)
+                results = zip(batch_positions, np.take_along_axis(batch_scores, batch_positions, axis=1))
+
+            for i, (result_positions, result_scores) in enumerate(results, start):
+                keep = result_positions != exclude[i]
+                result_positions = result_positions[keep][:top_k]
+                positions[i, :len(result_positions)] = result_positions
+                scores[i, :len(result_positions)] = result_scores[keep][:top_k]
+
+        return positions, scores
+
+    def _search_lists(self, query, k, n_probe):
+        """Score the query against the embeddings in the n_probe closest clusters."""
+        lists = top_k_indices((self.centroids @ query)[np.newaxis], n_probe)[0]
+        candidates = np.concatenate([self.lists[i] for i in lists])
+        candidate_scores = self.embeddings[candidates] @ query
+        best = top_k_indices(candidate_scores[np.newaxis], k)[0]
+        return candidates[best], candidate_scores[best]
+
+    def query(self, vectors, top_k=10, threshold=None, n_probe=None, neo4j_scores=False, query_ids=None,
+              exclude_self=False):
+        """
+        Find the most similar nodes for one or more query vectors.
+
+        Args:
+            vectors (array-like): Query vectors of shape (n, dimension) or a single vector.
+            top_k (int): The number of results per query.
+            threshold (float): Optional minimum similarity score.
+            n_probe (int): The number of clusters searched per query (see search).
+            neo4j_scores (bool): If True, report scores as (1 + cosine) / 2 like the Neo4j
+                cosine vector index, so thresholds used with db.index.vector.queryNodes apply.
+            query_ids (list): Optional labels of the query vectors. Defaults to 0..n-1.
+            exclude_self (bool): If True, a query label that is an id in the index is left
+                out of its own results.
+
+        Returns:
+            pd.DataFrame: DataFrame with the query, id, rank, and score of each result.
+        """
+        queries = normalize(vectors)
+        query_ids = np.arange(len(queries)) if query_ids is None else np.asarray(query_ids)
+        exclude = [self.positions.get(query_id, -1) for query_id in query_ids] if exclude_self else None
+        positions, scores = self.search(queries, top_k, n_probe, exclude)
+        if neo4j_scores:
+            scores = (1 + scores) / 2
+
+        rows, ranks = np.nonzero(positions >= 0)
+        results = pd.DataFrame({"query": query_ids[rows], "id": self.ids[positions[rows, ranks]],
+                                "rank": ranks + 1, "score": scores[rows, ranks]})
+        if threshold is not None:
+            results = results[results["score"] >= threshold].reset_index(drop=True)
+        return results
+
+    def query_ids(self, ids, top_k=10, threshold=None, n_probe=None, neo4j_scores=False, exclude_self=True):
+        """
+        Find the most similar nodes for nodes in the index, e.g., related papers for a list of Publication ids.
+
+        Ids that are not in the index are ignored. See query for the arguments and results.
+        """
+        ids = [node_id for node_id in ids if node_id in self.positions]
+        vectors = self.embeddings[[self.positions[node_id] for node_id in ids]]
+        return self.query(vectors, top_k, threshold, n_probe, neo4j_scores, query_ids=np.asarray(ids, dtype=str),
+                          exclude_self=exclude_self)
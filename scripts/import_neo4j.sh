@@ -35,5 +35,8 @@ export NEO4J_DATA=/Users/Peter/GitRepositories/radx-kg/kg/data
 # Absolute path to kg-import Git repository
 export KGIMPORT_GITREPO=/Users/Peter/GitRepositories/kg-import
 
+# Validate the node and relationship files before starting the import (requires pandas)
+python "$NEO4J_DATA"/../../notebooks/processing/validate_kg.py "$NEO4J_DATA" "$NEO4J_METADATA" || exit 1
+
 # Run the Neo4j bulk data import
 $KGIMPORT_GITREPO/scripts/neo4j_bulk_import.sh
@@ -0,0 +1,44 @@
+"""
+Tests of grant_query.match_query_names, which maps the principal investigators of a multi-name
+RePORTER query back to the query names and decides which hits are kept.
+
+Usage (from the repository root):
+    python -m pytest tests
+"""
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "processing"))
+
+import grant_query  # noqa: E402
+
+
+def to_pis(names):
+    """Return a principal investigator table from (first, middle, last) names."""
+    return pd.DataFrame(names, columns=["first_name", "middle_name", "last_name"])
+
+
+@pytest.mark.parametrize("query_name", ["Edward P DeMauro", "DeMauro, Edward P", "DeMauro, Edward Paul", "Edward DeMauro",
+                                        "DEMAURO, EDWARD", "E P DeMauro", "DeMauro"])
+def test_query_name_formats(query_name):
+    pis = to_pis([("Edward", "Paul", "DeMauro")])
+    assert grant_query.match_query_names(pis, [query_name]) == [query_name]
+
+
+@pytest.mark.parametrize("query_name", ["DeMauro, Edward Q", "Edward DeMarco", "DeMauro, Frank", "Paul Edwards"])
+def test_query_name_mismatch(query_name):
+    pis = to_pis([("Edward", "Paul", "DeMauro")])
+    assert grant_query.match_query_names(pis, [query_name]) == [""]
+
+
+def test_batch_maps_each_pi_to_its_query():
+    pis = to_pis([("Edward", "Paul", "DeMauro"), ("Devin", "", "MacKenzie"), ("Maria", "Jose", "Miguez"), ("Other", "", "Person")])
+    query_names = ["MacKenzie, Devin", "DeMauro, Edward P", "Maria-Jose Miguez", "Miguez, Maria J"]
+    assert grant_query.match_query_names(pis, query_names) == ["DeMauro, Edward P", "MacKenzie, Devin", "Miguez, Maria J", ""]
+
+
+def test_initials_only_query():
+    pis = to_pis([("Edward", "Paul", "DeMauro"), ("Devin", "", "MacKenzie")])
+    assert grant_query.match_query_names(pis, ["E P D"]) == ["E P D", ""]
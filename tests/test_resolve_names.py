@@ -0,0 +1,66 @@
+"""
+Tests of identity_store.IdentityStore.resolve_names, which links names in the "lastname initials"
+format (e.g., the requestors of 8_get_dataset_usage) to known researchers, and of
+identity_store.merge_resolved, which merges the resolved rows before the fuzzy merges of
+4_get_researcher_info.
+
+Usage (from the repository root):
+    python -m pytest tests
+"""
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "processing"))
+
+import identity_store  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = identity_store.IdentityStore(str(tmp_path))
+    store.add(["profileid:1"], node=True, name="Smith JD")
+    store.add(["profileid:2"], node=True, name="Vanegas-Gamboa DC")
+    store.add(["profileid:3"], node=True, name="Brown A")
+    # two people with the same name key are ambiguous
+    store.add(["profileid:4"], node=True, name="Lee J")
+    store.add(["profileid:5"], node=True, name="Lee J")
+    return store
+
+
+def resolve(store, names, **kwargs):
+    return store.resolve_names(names, **kwargs)["id"].tolist()
+
+
+def test_exact_names(store):
+    assert resolve(store, ["Smith JD", "smith j.d.", "Vanegas-Gamboa DC", "Lee J"]) == ["profileid:1", "profileid:1", "profileid:2", None]
+
+
+@pytest.mark.parametrize("name", ["Smith J", "Smith JDA", "Smith JE", "Browne A", "Brown B"])
+def test_different_initials_or_last_names(store, name):
+    assert resolve(store, [name]) == [None]
+
+
+def test_fuzzy_match_requires_same_initials(store):
+    # a transposition in a long last name
+    result = store.resolve_names(["Vanegas-Gambao DC", "Vanegas-Gambao D"])
+    assert result["id"].tolist() == ["profileid:2", None]
+    assert result["match"].tolist() == ["vanegas-gamboa dc", ""]
+    assert 0.98 <= result["score"][0] < 1
+
+
+def test_exact_only(store):
+    assert resolve(store, ["Vanegas-Gambao DC", "Smith JD"], fuzzy=False) == [None, "profileid:1"]
+
+
+def test_merge_resolved(store):
+    study = pd.DataFrame({"coreProjectNum": ["U01", "U01", "U02"], "studyInvestigator": ["Smith JD", "Lee J", "Smith JD"]})
+    pis = pd.DataFrame({"coreProjectNum": ["U01", "U01", "U03"], "profileId": ["1", "4", "1"]})
+    study_ids = [store.resolve_name(name) for name in study["studyInvestigator"]]
+    pi_ids = store.resolve_ids("profileid:" + pis["profileId"])
+    merged, study_rest, pis_rest = identity_store.merge_resolved(study, pis, study_ids, pi_ids, on="coreProjectNum")
+    assert merged.to_dict("records") == [{"coreProjectNum": "U01", "studyInvestigator": "Smith JD", "profileId": "1", "score": 1.0}]
+    # the ambiguous name and the investigator of another project are left to the fuzzy merge
+    assert study_rest.index.tolist() == [1, 2]
+    assert pis_rest.index.tolist() == [1, 2]
@@ -0,0 +1,95 @@
+"""
+Golden-output tests for the vectorized transforms in grant_query and publication_query.
+
+The vectorized functions must return exactly what the scalar implementations they replaced
+return, for the names and grants in kg/data and for upper-case, lower-case, "Mc", and missing
+values.
+
+Usage (from the repository root):
+    python -m pytest tests
+"""
+import glob
+import os
+import sys
+import pandas as pd
+import pytest
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+KG_PATH = os.path.join(ROOT_PATH, "kg", "data")
+sys.path.insert(0, os.path.join(ROOT_PATH, "notebooks", "processing"))
+
+import grant_query  # noqa: E402
+import publication_query  # noqa: E402
+
+NAME_COLUMNS = ["fullName", "firstName", "middleName", "lastName"]
+# names the kg/data files don't cover: Mc prefixes, initials, mixed case, no cased characters
+EDGE_CASE_NAMES = ["MCDONALD", "mcdonald", "McDonald", "MARY MC CARTHY", "mary mccarthy", "Mc", "J.R.R.", "o'brien", "SHEILA Ann GRANT",
+                   "van der Berg", "JEAN-PIERRE", "Ø", "123", "", " ", "A. B. C.", "  leading", "trailing  "]
+
+
+def read_names():
+    """Return the distinct non-empty values of the name columns of the Researcher nodes in kg/data."""
+    names = []
+    for path in sorted(glob.glob(os.path.join(KG_PATH, "nodes", "Researcher_*.csv"))):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        for column in NAME_COLUMNS:
+            names.extend(df[column])
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def to_list(values):
+    """Return the values of a Series with None for missing values, so results of different dtypes compare equal."""
+    return [None if pd.isna(value) else value for value in values]
+
+
+@pytest.fixture(scope="module")
+def names():
+    names = read_names()
+    assert len(names) > 1000
+    return names
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+def test_standardize_names(names, dtype):
+    values = names + [name.upper() for name in names] + [name.lower() for name in names] + EDGE_CASE_NAMES
+    series = pd.Series(values + [None, float("nan")] + values[:10], dtype=dtype)
+
+    # the scalar version, missing values are kept
+    expected = [None if pd.isna(name) else grant_query.standardize_name(name) for name in series]
+    assert to_list(grant_query.standardize_names(series)) == expected
+
+
+def test_standardize_names_mc():
+    series = pd.Series(["MCDONALD", "mary mccarthy", "MC DONALD", "McDonald", None], dtype=object)
+    assert to_list(grant_query.standardize_names(series)) == ["McDonald", "Mary McCarthy", "Mc Donald", "McDonald", None]
+
+
+def test_transform_data_serial_numbers():
+    grants = pd.read_csv(os.path.join(KG_PATH, "nodes", "Grant.csv"), dtype=str, keep_default_na=False)
+    assert len(grants) > 0
+    df = pd.DataFrame({column: grants["id"] for column in grant_query.PROJECT_COLUMN_MAP})
+    df["project_num"] = "1" + grants["id"] + "-01"
+    # missing and empty project serial numbers are replaced by the project number
+    serial_nums = [grant_id[-8:] + "-01" for grant_id in grants["id"]]
+    serial_nums = [None if i % 3 == 0 else "" if i % 3 == 1 else serial_num for i, serial_num in enumerate(serial_nums)]
+    df["project_serial_num"] = pd.Series(serial_nums, dtype=object)
+
+    # the scalar version (row-wise apply)
+    expected = [(serial_num if isinstance(serial_num, str) and len(serial_num) > 0 else project_num).split("-")[0]
+                for serial_num, project_num in zip(df["project_serial_num"], df["project_num"])]
+    result = grant_query.transform_data(df.copy())
+    assert list(result.columns) == list(grant_query.PROJECT_COLUMN_MAP.values())
+    assert result["projectSerialNum"].tolist() == expected
+    assert result["projectSerialNum"].tolist()[:3] == ["1" + grants["id"][0], "1" + grants["id"][1], grants["id"][2][-8:]]
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+def test_expand_name_column(names, dtype):
+    # full names only, create_name_cols requires a string
+    full_names = names + [name.upper() for name in names] + EDGE_CASE_NAMES + ["A", "A B", "A  B", "Mary-Jane J. K. van der Berg"]
+    df = pd.DataFrame({"author": pd.Series(full_names, dtype=dtype)})
+
+    publication_query.expand_name_column(df, "author")
+    expected = [list(publication_query.create_name_cols(full_name)) for full_name in full_names]
+    result = [to_list(row) for row in zip(*(df[column] for column in ["name", "fullName", "firstName", "middleName", "lastName"]))]
+    assert result == expected